@@ -1,39 +1,187 @@
 import tkinter as tk
-from tkinter import scrolledtext, messagebox
+from tkinter import scrolledtext, messagebox, ttk
 from threading import Thread
-import subprocess
+from functools import partial
+import queue
 import os
-import signal
-
-# Updated list of scripts to run
-scripts = [
-    "rename.py", "zero.py", "missing.py", "interpol.py", "createfolders.py",
-    "timelogrename.py", "tcfilename.py", "validate.py",
-    "averaged.py", "original.py",
-]
+import time
+
+import cli
+import events
+import gaplog
+import instrument
+import worker
+
+# Scripts to run, in the order the headless runner declares its tasks (see
+# cli.py); pipeline.py runs rename -> missing -> interpol -> validate -> rollup in one
+# process, loading each workbook only once
+scripts = [task.script for task in cli.TASKS]
+# Exit codes that report a result rather than a failure (validate.py's incomplete days, say)
+exit_statuses = {task.script: task.exit_statuses for task in cli.TASKS}
+# Scripts that only check the outputs: their files and days stay out of the run's totals
+checks = {task.script for task in cli.TASKS if task.check}
+
+# Tkinter is not thread-safe: the runner thread only puts work on ui_queue
+# and the main loop applies it in batches every DRAIN_INTERVAL_MS
+DRAIN_INTERVAL_MS = 100
+MAX_ITEMS_PER_DRAIN = 5000
+MAX_LOG_LINES = 5000  # older lines are dropped from the top of the log
 
 # Globals
 current_process = None
+ui_queue = queue.Queue()
 mismatch_list = []    # to collect timestamp mismatches across all scripts
 error_list = []       # to collect all error lines (tagged "error")
+run_stats = {}        # totals from the "file" events of the current run
+span_list = []        # timed steps of the current run, when it is traced
+progress = {}         # state of the progress bars for the current batch
 
 def update_error_counter():
     """Refresh the error counter label."""
     error_label.config(text=f"Errors: {len(error_list)}")
 
-def run_script(script, text_widget):
+def record_error(line):
+    error_list.append(line)
+    update_error_counter()
+
+def post(kind, *args):
+    """Queue work for the main loop; safe to call from any thread."""
+    ui_queue.put((kind, args))
+
+def add_log_line(text_widget, line, tag=None):
+    """Append one line to the log, optionally tagged. Main thread only."""
+    start_idx = text_widget.index(tk.END)
+    text_widget.insert(tk.END, line)
+    if tag:
+        text_widget.tag_add(tag, start_idx, text_widget.index(tk.END))
+
+def trim_log(text_widget):
+    """Keep only the last MAX_LOG_LINES lines of the log."""
+    excess = int(text_widget.index("end-1c").split(".")[0]) - MAX_LOG_LINES
+    if excess > 0:
+        text_widget.delete("1.0", f"{excess + 1}.0")
+
+def format_eta(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes // 60}:{minutes % 60:02d}:{seconds:02d}"
+
+def reset_progress(files=0, stages=()):
+    progress.clear()
+    progress.update(files=files, stages=list(stages), files_done=0, stages_done=0,
+                    rows=0, started=time.perf_counter())
+    file_bar.config(maximum=max(files, 1), value=0)
+    stage_bar.config(maximum=max(files * len(progress["stages"]), 1), value=0)
+    file_label.config(text=f"Files: 0/{files}" if files else "Files: -")
+    stage_label.config(text="Stage: -")
+
+def update_progress(event):
+    """Advance the stage and file bars from a "stage" or "file" event."""
+    if not progress.get("files"):
+        return
+    if event["event"] == "stage":
+        progress["stages_done"] += 1
+        stage_bar.config(value=progress["stages_done"])
+        stage_label.config(text=f"Stage: {event['stage']} on {event['file']} "
+                                f"({event.get('elapsed', 0):.2f}s)")
+        return
+
+    progress["files_done"] += 1
+    progress["rows"] += event.get("rows") or 0
+    # Skipped and failed files never report their remaining stages
+    progress["stages_done"] = max(progress["stages_done"],
+                                  progress["files_done"] * len(progress["stages"]))
+    stage_bar.config(value=progress["stages_done"])
+    file_bar.config(value=progress["files_done"])
+
+    elapsed = time.perf_counter() - progress["started"]
+    remaining = progress["files"] - progress["files_done"]
+    rate = progress["rows"] / elapsed if elapsed > 0 else 0
+    eta = elapsed / progress["files_done"] * remaining
+    file_label.config(text=f"Files: {progress['files_done']}/{progress['files']}  "
+                           f"{rate:,.0f} rows/s  ETA {format_eta(eta)}")
+
+def handle_event(script, event, text_widget):
+    """
+    Aggregate one structured event from a stage: errors and day-count
+    mismatches are logged in red and counted, file events feed run_stats
+    and the progress bars. Main thread only.
+    """
+    kind = event.get("event")
+    if kind == "error":
+        where = " / ".join(str(part) for part in (event.get("file"), event.get("stage")) if part)
+        line = f"Error in {script}: {where}: {event.get('message')}"
+        add_log_line(text_widget, line + "\n", "error")
+        record_error(line)
+
+    elif kind == "day_count":
+        if event["count"] != event.get("expected", 1440) and script not in checks:
+            line = f"{event['file']}: {event['date']}: {event['count']} timestamps"
+            add_log_line(text_widget, f"Mismatch: {line}\n", "error")
+            mismatch_list.append(f"{script}: {line}")
+            record_error(line)
+
+    elif kind == "batch":
+        reset_progress(event.get("files", 0), event.get("stages", ()))
+
+    elif kind == "span":
+        span_list.append(event)
+
+    elif kind == "stage":
+        update_progress(event)
+
+    elif kind == "file":
+        if script not in checks:
+            status = event.get("status", "done")
+            run_stats[status] = run_stats.get(status, 0) + 1
+            run_stats["rows"] += event.get("rows") or 0
+            run_stats["gaps"] += event.get("gaps") or 0
+        update_progress(event)
+
+def drain_queue():
+    """
+    Apply everything the runner thread queued since the last call: runs of
+    plain lines go into the log with a single insert, then the log is
+    trimmed and scrolled once.
+    """
+    pending = []
+
+    def flush_pending():
+        if pending:
+            log_text.insert(tk.END, "".join(pending))
+            pending.clear()
+
+    try:
+        for _ in range(MAX_ITEMS_PER_DRAIN):
+            kind, args = ui_queue.get_nowait()
+            if kind == "line" and args[1] is None:
+                pending.append(args[0])
+                continue
+            flush_pending()
+            if kind == "line":
+                add_log_line(log_text, *args)
+            elif kind == "event":
+                handle_event(*args, log_text)
+            elif kind == "call":
+                args[0]()
+    except queue.Empty:
+        pass
+    flush_pending()
+
+    trim_log(log_text)
+    log_text.see(tk.END)
+    root.after(DRAIN_INTERVAL_MS, drain_queue)
+
+def run_script(script, trace_path=None):
     """
-    Runs a single script, writes output to text_widget,
-    highlights errors immediately, and records timestamp mismatches.
+    Runs a single script with structured events switched on (and spans, when
+    the run is traced) and queues its text output and events for the main
+    loop. A non-zero exit code counts as an error unless the task declares
+    it as a result (see cli.Task), in which case only failing ones do.
     """
-    global current_process, mismatch_list, error_list
+    global current_process
 
-    current_process = subprocess.Popen(
-        ["python", script],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        text=True
-    )
+    # Runs in the warm worker daemon when one is up (see worker.py)
+    current_process = worker.launch(script, env={"SJV_EVENTS": "stdout", **instrument.child_env(trace_path)})
 
     while True:
         line = current_process.stdout.readline()
@@ -42,77 +190,92 @@ def run_script(script, text_widget):
         if not line:
             continue
 
-        start_idx = text_widget.index(tk.END)
-        text_widget.insert(tk.END, line)
-        end_idx = text_widget.index(tk.END)
-
-        lowered = line.lower()
-
-        # 1) Standard error highlight
-        if "error" in lowered:
-            text_widget.tag_add("error", start_idx, end_idx)
-            error_list.append((start_idx, line.strip()))
-            update_error_counter()
-
-        # 2) Timestamp‐count mismatch detection
-        elif "timestamps" in lowered:
-            # Expect format "...: NNNN timestamps"
-            parts = line.strip().split()
-            try:
-                count = int(parts[-2])
-            except (ValueError, IndexError):
-                count = None
-
-            if count is not None and count != 1440:
-                text_widget.tag_add("error", start_idx, end_idx)
-                mismatch_list.append(f"{script}: {line.strip()}")
-                error_list.append((start_idx, line.strip()))
-                update_error_counter()
-
-        text_widget.see(tk.END)
-
-    return current_process.poll()
-
-
-def run_all_scripts():
+        event = events.parse(line)
+        if event is not None:
+            post("event", script, event)
+        else:
+            post("line", line, None)
+
+    rc = current_process.poll()
+    status = exit_statuses.get(script, {}).get(rc)
+    if rc and status is not None:
+        line = f"{script} reported {status} (exit code {rc})"
+        post("line", line + "\n", "error")
+        if status in cli.FAILED:
+            post("call", partial(record_error, line))
+    elif rc:
+        line = f"{script} exited with code {rc}"
+        post("line", line + "\n", "error")
+        post("call", partial(record_error, line))
+    return rc
+
+
+def show_summary(run_started):
+    """Pop up a single summary of timestamp mismatches and of the gaps filled this run."""
+    # Gaps recorded by this run come from the gap log store
+    gap_list = [
+        f"{file_name}: {missing} missing minutes in {count} gaps"
+        for file_name, _, _, missing, count in gaplog.files_since(run_started)
+        if missing
+    ]
+    if mismatch_list or gap_list:
+        summary = ""
+        if mismatch_list:
+            summary += "The following timestamp counts did not equal 1440:\n\n"
+            summary += "\n".join(mismatch_list) + "\n\n"
+        if gap_list:
+            summary += "Missing timestamps filled in this run:\n\n" + "\n".join(gap_list)
+        messagebox.showwarning("Timestamp Mismatch Summary", summary)
+
+
+def show_trace(trace_path):
+    """Save the run's spans and log the time spent in each step. Main thread only."""
+    path = instrument.write_trace(trace_path, span_list)
+    add_log_line(log_text, f"Time by step ({len(span_list)} spans):\n")
+    add_log_line(log_text, "\n".join(instrument.summary(span_list)) + "\n")
+    add_log_line(log_text, f"Trace saved: '{path}'\n")
+
+
+def run_all_scripts(run_started, trace_path=None):
     """
-    Runs each script in order, tags the "Running" lines, then at the very end
-    pops up a single summary of all timestamp mismatches (if any).
+    Runs each script in order on the runner thread, tags the "Running"
+    lines, then queues the summary line and popup for the main loop.
     """
-    global current_process, mismatch_list, error_list
-
-    mismatch_list.clear()
-    error_list.clear()
-    update_error_counter()
+    global current_process
 
+    run_clock = time.perf_counter()
     for script in scripts:
-        # Log start
-        start_idx = log_text.index(tk.END)
-        log_text.insert(tk.END, f"Running {script}\n")
-        end_idx = log_text.index(tk.END)
-        log_text.tag_add("running", start_idx, end_idx)
-        log_text.see(tk.END)
-
-        # Run and capture exit code
-        rc = run_script(script, log_text)
-
-        # Log finish
-        log_text.insert(tk.END, f"Finished {script} (exit code {rc})\n")
-        log_text.see(tk.END)
-
-    # After all scripts:
-    if mismatch_list:
-        summary = "\n".join(mismatch_list)
-        messagebox.showwarning(
-            "Timestamp Mismatch Summary",
-            "The following timestamp counts did not equal 1440:\n\n" + summary
+        post("line", f"Running {script}\n", "running")
+        rc = run_script(script, trace_path)
+        post("line", f"Finished {script} (exit code {rc})\n", None)
+
+    def finish():
+        add_log_line(
+            log_text,
+            f"Summary: {run_stats.get('done', 0)} files processed, {run_stats.get('skipped', 0)} up to date, "
+            f"{run_stats.get('error', 0)} failed; {run_stats['rows']} rows, {run_stats['gaps']} gaps filled "
+            f"in {time.perf_counter() - run_clock:.0f}s\n"
         )
+        if trace_path and span_list:
+            show_trace(trace_path)
+        show_summary(run_started)
 
+    post("call", finish)
     current_process = None
 
 
 def start_process():
-    Thread(target=run_all_scripts, daemon=True).start()
+    """Reset the counters on the main thread, then run the scripts on a background thread."""
+    mismatch_list.clear()
+    error_list.clear()
+    run_stats.clear()
+    run_stats.update(rows=0, gaps=0)
+    span_list.clear()
+    update_error_counter()
+    reset_progress()
+    run_started = time.strftime("%Y-%m-%d %H:%M:%S")
+    trace_path = instrument.new_trace_path() if trace_var.get() else None
+    Thread(target=run_all_scripts, args=(run_started, trace_path), daemon=True).start()
 
 
 def stop_process():
@@ -121,10 +284,9 @@ def stop_process():
     """
     global current_process
     if current_process and current_process.poll() is None:
-        os.kill(current_process.pid, signal.SIGTERM)
+        current_process.terminate()
         current_process = None
-        log_text.insert(tk.END, "Process stopped by user.\n")
-        log_text.see(tk.END)
+        post("line", "Process stopped by user.\n", None)
 
 
 # --- GUI setup ---
@@ -147,8 +309,28 @@ start_button.pack(side=tk.LEFT, padx=5)
 stop_button = tk.Button(button_frame, text="Stop", command=stop_process)
 stop_button.pack(side=tk.LEFT, padx=5)
 
+# Time every step of the run and save a trace (see instrument.py)
+trace_var = tk.BooleanVar(value=instrument.enabled())
+trace_check = tk.Checkbutton(button_frame, text="Record trace", variable=trace_var)
+trace_check.pack(side=tk.LEFT, padx=5)
+
 # Error counter label below the buttons
 error_label = tk.Label(root, text="Errors: 0", font=("Arial", 12, "bold"))
 error_label.pack(pady=(0,10))
 
+# Progress of the current batch: stages run across all files, and files finished
+progress_frame = tk.Frame(root)
+progress_frame.pack(fill=tk.X, padx=10, pady=(0, 10))
+
+stage_label = tk.Label(progress_frame, text="Stage: -", anchor="w")
+stage_label.pack(fill=tk.X)
+stage_bar = ttk.Progressbar(progress_frame, mode="determinate")
+stage_bar.pack(fill=tk.X)
+
+file_label = tk.Label(progress_frame, text="Files: -", anchor="w")
+file_label.pack(fill=tk.X, pady=(5, 0))
+file_bar = ttk.Progressbar(progress_frame, mode="determinate")
+file_bar.pack(fill=tk.X)
+
+root.after(DRAIN_INTERVAL_MS, drain_queue)
 root.mainloop()
@@ -0,0 +1,243 @@
+"""
+Time every pipeline stage and the full chain on synthetic exports.
+
+Workbooks in the D12 layout are generated first (see generate.py; the
+generator options apply here too). Then each case runs in a fresh python
+process, so its peak memory is its own:
+
+    load       parse the workbooks into tables
+    rename     B2/B5 metadata and file names (in memory)
+    missing    put the rows on the minute grid and find the gaps
+    interpol   fill the gaps
+    validate   count the timestamps per day
+    rollup     15-minute, hourly and daily aggregates of every value column
+    write      write the highlighted workbooks
+    routing    move averaged outputs into their site folders
+    chain      load -> rename -> missing -> interpol -> validate -> rollup -> write
+
+Only the named step is timed; the steps before it run untimed in the same
+process. Each case is repeated and its best wall time is kept, with rows
+(or files, for routing) per second and the process's peak RSS. Results go
+to a JSON file named for the current commit, and --compare prints the
+change against an earlier one:
+
+    python benchmarks/bench_pipeline.py [--repeat 3] [--cases missing interpol]
+        [--output FILE] [--compare OLD.json] [generator options]
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, SCRIPT_DIR)
+
+from generate import add_arguments, generate, generator_options  # noqa: E402
+
+CASES = ["load", "rename", "missing", "interpol", "validate", "rollup", "write", "routing", "chain"]
+STAGE_ORDER = ["rename", "missing", "interpol", "validate", "rollup"]
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+
+def peak_rss_mb():
+    """This process's peak resident set size in MB, or None where it cannot be read."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _load(file_paths):
+    from pipeline import load_table
+    return [load_table(path, use_cache=False) for path in file_paths]
+
+
+def _stages():
+    from pipeline import default_stages
+    return dict(zip(STAGE_ORDER, default_stages()))
+
+
+def _run_stages(tables, names):
+    stages = _stages()
+    for table in tables:
+        for name in names:
+            # In memory only: no file renames or gap log writes
+            stages[name](table, commit=False)
+
+
+def _write(tables, out_dir):
+    from writer import write_table
+    for i, table in enumerate(tables):
+        write_table(table, os.path.join(out_dir, f"{i} {table.output_name or table.name}"))
+
+
+def _routing_tree(work_dir, count):
+    """A scripts folder beside an averaged folder holding count empty outputs named by site."""
+    from routing import site_list
+    sites = site_list()
+    base = tempfile.mkdtemp(dir=work_dir)
+    scripts = os.path.join(base, "scripts")
+    averaged = os.path.join(base, "averaged")
+    os.makedirs(scripts)
+    os.makedirs(averaged)
+    for i in range(count):
+        site = sites[i % len(sites)]
+        name = f"averaged {site}__(PDT)_sensor_{i}_2025-07-01_2025-07-29.xlsx"
+        open(os.path.join(averaged, name), "wb").close()
+    return scripts
+
+
+def measure(case, file_paths, rows, work_dir, route_files):
+    """Run one case in this (fresh) process and return its timing and memory."""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        items = rows
+        if case == "routing":
+            import averaged
+            scripts = _routing_tree(work_dir, route_files)
+            cwd = os.getcwd()
+            os.chdir(scripts)
+            rss_before = peak_rss_mb()
+            start = time.perf_counter()
+            try:
+                averaged.main()
+            finally:
+                os.chdir(cwd)
+            wall = time.perf_counter() - start
+            items = route_files
+        elif case == "chain":
+            rss_before = peak_rss_mb()
+            start = time.perf_counter()
+            tables = _load(file_paths)
+            _run_stages(tables, STAGE_ORDER)
+            _write(tables, tempfile.mkdtemp(dir=work_dir))
+            wall = time.perf_counter() - start
+        elif case == "load":
+            rss_before = peak_rss_mb()
+            start = time.perf_counter()
+            _load(file_paths)
+            wall = time.perf_counter() - start
+        else:
+            tables = _load(file_paths)
+            before = STAGE_ORDER if case == "write" else STAGE_ORDER[:STAGE_ORDER.index(case)]
+            _run_stages(tables, before)
+            rss_before = peak_rss_mb()
+            start = time.perf_counter()
+            if case == "write":
+                _write(tables, tempfile.mkdtemp(dir=work_dir))
+            else:
+                _run_stages(tables, [case])
+            wall = time.perf_counter() - start
+    return {"wall": wall, "items": items, "peak_rss_mb": peak_rss_mb(), "rss_before_mb": rss_before}
+
+
+def run_case(case, file_paths, rows, work_dir, route_files, repeat):
+    """Best of repeat runs, each in a new process."""
+    runs = []
+    for _ in range(repeat):
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+            runs.append(pool.submit(measure, case, file_paths, rows, work_dir, route_files).result())
+    best = min(runs, key=lambda run: run["wall"])
+    peaks = [run["peak_rss_mb"] for run in runs if run["peak_rss_mb"] is not None]
+    return {
+        "wall": best["wall"],
+        "walls": [run["wall"] for run in runs],
+        "items": best["items"],
+        "unit": "files" if case == "routing" else "rows",
+        "per_sec": best["items"] / best["wall"] if best["wall"] else None,
+        "peak_rss_mb": max(peaks) if peaks else None,
+        "stage_rss_mb": (best["peak_rss_mb"] - best["rss_before_mb"]) if peaks else None,
+    }
+
+
+def commit_id():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SCRIPT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, old_path):
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    print(f"\nAgainst {old.get('commit') or old_path}:", flush=True)
+    for case, result in results["cases"].items():
+        before = old.get("cases", {}).get(case)
+        if not before:
+            continue
+        change = (result["wall"] / before["wall"] - 1) * 100
+        print(f"  {case:<10} {before['wall']:8.3f}s -> {result['wall']:8.3f}s  {change:+6.1f}%", flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic exports.")
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=CASES)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case; the best is kept (default 3)")
+    parser.add_argument("--route-files", type=int, default=2000,
+                        help="outputs moved by the routing case (default 2000)")
+    parser.add_argument("--output", default=None,
+                        help="results file (default benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", default=None, help="earlier results file to compare with")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="sjv-bench-")
+    # Keep the children away from the real cache, database and event log
+    os.environ.update({"SJV_CACHE": "0", "SJV_MANIFEST": "0", "SJV_WORKER": "0",
+                       "SJV_DB": os.path.join(work_dir, "bench.sqlite")})
+    os.environ.pop("SJV_EVENTS", None)
+    os.environ.pop("SJV_EVENTS_LOG", None)
+    try:
+        options = generator_options(args)
+        start = time.perf_counter()
+        file_paths, rows = generate(os.path.join(work_dir, "inputs"), **options)
+        print(f"Generated {len(file_paths)} exports, {rows} rows in {time.perf_counter() - start:.1f}s\n",
+              flush=True)
+
+        results = {
+            "commit": commit_id(),
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "generator": options,
+            "rows": rows,
+            "repeat": args.repeat,
+            "cases": {},
+        }
+        print(f"{'case':<10} {'wall':>9} {'per sec':>12} {'peak RSS':>10}", flush=True)
+        for case in args.cases:
+            result = run_case(case, file_paths, rows, work_dir, args.route_files, args.repeat)
+            results["cases"][case] = result
+            rss = f"{result['peak_rss_mb']:7.0f} MB" if result["peak_rss_mb"] is not None else "         -"
+            print(f"{case:<10} {result['wall']:8.3f}s {result['per_sec']:>8.0f} {result['unit']:<5} {rss}",
+                  flush=True)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{results['commit'] or time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nSaved: '{output}'", flush=True)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
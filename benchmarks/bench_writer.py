@@ -0,0 +1,99 @@
+"""
+Benchmark the missing.py output path on the D12 sample workbooks.
+
+Compares the old write -> reload -> iterrows -> save cycle against the
+single-pass writer backends. Run from the scripts folder:
+
+    python benchmarks/bench_writer.py [folder with sample .xlsx files]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.styles import PatternFill
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pipeline import Table, list_xlsx, load_table  # noqa: E402
+from writer import BACKENDS, write_table, xlsxwriter  # noqa: E402
+
+DEFAULT_SAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "D12")
+
+
+def fill_gaps(df):
+    """The missing.py regularisation, without the logging side effects."""
+    df = df.copy()
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    all_timestamps = pd.date_range(df['timestamp'].min(), df['timestamp'].max(), freq='min')
+    missing_timestamps = all_timestamps.difference(df['timestamp'])
+    missing_df = pd.DataFrame(missing_timestamps, columns=['timestamp'])
+    missing_df[df.columns[1]] = 0
+    combined_df = pd.concat([df, missing_df]).sort_values(by='timestamp').reset_index(drop=True)
+    return combined_df, missing_timestamps
+
+
+def legacy_write(combined_df, missing_timestamps, output_file_path):
+    """The write -> reload -> iterrows -> save cycle missing.py used to run."""
+    with pd.ExcelWriter(output_file_path, engine='openpyxl') as writer:
+        combined_df.to_excel(writer, startrow=0, index=False)
+    wb = load_workbook(output_file_path)
+    ws = wb.active
+    red_fill = PatternFill(start_color="FFFF0000", end_color="FFFF0000", fill_type="solid")
+    max_column = ws.max_column
+    for index, row in combined_df.iterrows():
+        if row['timestamp'] in missing_timestamps:
+            for col_idx in range(1, max_column + 1):
+                ws.cell(row=index + 2, column=col_idx).fill = red_fill
+    wb.save(output_file_path)
+
+
+def single_pass_write(combined_df, missing_timestamps, output_file_path, backend):
+    table = Table(output_file_path, [], combined_df,
+                  combined_df['timestamp'].isin(missing_timestamps).to_numpy())
+    write_table(table, output_file_path, backend=backend)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    sample_dir = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SAMPLES
+    file_paths = [path for path in list_xlsx(sample_dir)
+                  if os.path.basename(path).startswith("D12__")]
+    if not file_paths:
+        print(f"No sample workbooks found in {sample_dir}", flush=True)
+        return
+
+    backends = [b for b in BACKENDS if b != "xlsxwriter" or xlsxwriter is not None]
+    totals = dict.fromkeys(["legacy"] + backends, 0.0)
+
+    print(f"{'file':<60} {'rows':>7} " + " ".join(f"{name:>11}" for name in totals), flush=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        for file_path in file_paths:
+            combined_df, missing_timestamps = fill_gaps(load_table(file_path).df)
+            out = os.path.join(tmp, "out.xlsx")
+
+            times = {"legacy": timed(legacy_write, combined_df, missing_timestamps, out)}
+            for backend in backends:
+                times[backend] = timed(single_pass_write, combined_df, missing_timestamps, out, backend)
+            for name, seconds in times.items():
+                totals[name] += seconds
+
+            name = os.path.basename(file_path)[:60]
+            print(f"{name:<60} {len(combined_df):>7} "
+                  + " ".join(f"{times[key]:>10.2f}s" for key in totals), flush=True)
+
+    print(f"{'total':<60} {'':>7} " + " ".join(f"{seconds:>10.2f}s" for seconds in totals.values()))
+    for backend in backends:
+        print(f"{backend}: {totals['legacy'] / totals[backend]:.1f}x faster than legacy", flush=True)
+
+
+if __name__ == "__main__":
+    main()
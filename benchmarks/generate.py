@@ -0,0 +1,168 @@
+"""
+Generate synthetic sensor exports in the layout of the D12 samples.
+
+Each workbook has the four metadata rows of a raw export (B2 holds the
+location, e.g. "D12  (PDT)"), the "timestamp" / sensor header in row 5 and
+one row per local PDT minute. The number of days, how much of the series is
+missing, how long the gaps are and how many timestamps repeat are all
+configurable, and the same seed gives the same files:
+
+    python benchmarks/generate.py OUT_DIR [--files 8] [--days 28]
+        [--gap-density 0.01] [--mean-gap 5] [--gap-lengths geometric]
+        [--duplicate-rate 0.001] [--site D12] [--seed 0]
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+    from openpyxl import Workbook
+
+SENSORS = ["Air Intake Sensor", "Power", "Volume total", "energy rate", "exhaust air temperature",
+           "flow temperature", "remote temperature", "volume rate"]
+GAP_LENGTHS = ("geometric", "fixed", "pareto")
+MINUTES_PER_DAY = 1440
+
+
+def gap_lengths(rng, count, mean_gap, distribution):
+    """Lengths in minutes of count gaps averaging about mean_gap."""
+    if distribution == "fixed":
+        return np.full(count, max(int(round(mean_gap)), 1))
+    if distribution == "pareto":
+        # Heavy tail: mostly short dropouts with the odd outage of hours
+        return np.maximum(np.round(rng.pareto(1.5, count) * mean_gap / 2), 1).astype(np.int64)
+    return rng.geometric(1 / max(mean_gap, 1), count)
+
+
+def synthetic_series(days=28, start="2025-07-01", gap_density=0.01, mean_gap=5, distribution="geometric",
+                     duplicate_rate=0.001, seed=0, sensor_index=0):
+    """(timestamps, values) of one export: a daily cycle with noise, gaps removed and some rows repeated."""
+    rng = np.random.default_rng(seed)
+    size = int(days * MINUTES_PER_DAY)
+    minutes = np.arange(size)
+
+    keep = np.ones(size, dtype=bool)
+    count = int(size * gap_density / max(mean_gap, 1))
+    if count:
+        starts = rng.integers(0, size, count)
+        lengths = gap_lengths(rng, count, mean_gap, distribution)
+        # Mark each gap with +1/-1 at its ends and accumulate to cover its minutes
+        edges = np.zeros(size + 1, dtype=np.int64)
+        np.add.at(edges, starts, 1)
+        np.add.at(edges, np.minimum(starts + lengths, size), -1)
+        keep = np.cumsum(edges[:-1]) == 0
+    minutes = minutes[keep]
+
+    if duplicate_rate:
+        repeats = 1 + (rng.random(len(minutes)) < duplicate_rate)
+        minutes = np.repeat(minutes, repeats)
+
+    phase = 2 * np.pi * (minutes % MINUTES_PER_DAY) / MINUTES_PER_DAY
+    level = 20 + 10 * sensor_index
+    values = np.round(level + 5 * np.sin(phase) + rng.normal(0, 0.5, len(minutes)), 2)
+    timestamps = pd.Timestamp(start).to_datetime64() + minutes.astype('timedelta64[m]')
+    return timestamps, values
+
+
+def metadata_rows(site, equipment, report_time):
+    return [
+        ("Customer", "Synthetic Customer", "Report Date/Time", f"{report_time:%Y-%m-%d %H:%M} PDT"),
+        ("Location", f"{site}  (PDT)", "User", "benchmark@example.com"),
+        ("Report Name", "Equipment/Export", "Equipment Name", equipment),
+        (None, None, None, None),
+    ]
+
+
+def write_export(path, sensor, timestamps, values, site="D12", equipment="Synthetic HPWH"):
+    """Write one raw-export workbook: metadata rows, header row, then timestamp/value rows."""
+    report_time = pd.Timestamp(timestamps[-1]) if len(timestamps) else pd.Timestamp.now()
+    rows = metadata_rows(site, equipment, report_time)
+    stamps = pd.DatetimeIndex(timestamps).to_pydatetime()
+    if xlsxwriter is not None:
+        workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+        sheet = workbook.add_worksheet()
+        date_format = workbook.add_format({"num_format": "yyyy-mm-dd hh:mm:ss"})
+        for r, row in enumerate(rows):
+            for c, value in enumerate(row):
+                if value is not None:
+                    sheet.write(r, c, value)
+        header = len(rows)
+        sheet.write_row(header, 0, ["timestamp", sensor])
+        for i, (stamp, value) in enumerate(zip(stamps, values.tolist()), start=header + 1):
+            sheet.write_datetime(i, 0, stamp, date_format)
+            sheet.write_number(i, 1, value)
+        workbook.close()
+    else:
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        for row in rows:
+            sheet.append(row)
+        sheet.append(["timestamp", sensor])
+        for stamp, value in zip(stamps, values.tolist()):
+            sheet.append([stamp, value])
+        workbook.save(path)
+
+
+def generate(out_dir, files=8, days=28, start="2025-07-01", gap_density=0.01, mean_gap=5,
+             distribution="geometric", duplicate_rate=0.001, site="D12", seed=0):
+    """Write files synthetic exports to out_dir and return (paths, total rows)."""
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    total = 0
+    export_time = pd.Timestamp(start) + pd.Timedelta(days=days)
+    for i in range(files):
+        sensor = SENSORS[i % len(SENSORS)]
+        timestamps, values = synthetic_series(days, start, gap_density, mean_gap, distribution,
+                                              duplicate_rate, seed + i, i % len(SENSORS))
+        # Named like the raw exports before the rename stage
+        name = f"Synthetic_HPWH {site}_{export_time:%a %b %d %Y %H_%M_%S} GMT-0700 ({i + 1}).xlsx"
+        path = os.path.join(out_dir, name)
+        write_export(path, sensor, timestamps, values, site)
+        paths.append(path)
+        total += len(timestamps)
+    return paths, total
+
+
+def add_arguments(parser):
+    """The generator options, shared with the benchmark runner."""
+    parser.add_argument("--files", type=int, default=8, help="number of exports (default 8)")
+    parser.add_argument("--days", type=float, default=28, help="days per export (default 28)")
+    parser.add_argument("--start", default="2025-07-01", help="first local day (default 2025-07-01)")
+    parser.add_argument("--gap-density", type=float, default=0.01,
+                        help="share of minutes missing (default 0.01)")
+    parser.add_argument("--mean-gap", type=float, default=5, help="average gap length in minutes (default 5)")
+    parser.add_argument("--gap-lengths", choices=GAP_LENGTHS, default="geometric",
+                        help="distribution of gap lengths (default geometric)")
+    parser.add_argument("--duplicate-rate", type=float, default=0.001,
+                        help="share of rows written twice (default 0.001)")
+    parser.add_argument("--site", default="D12", help="site code in the B2 location (default D12)")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def generator_options(args):
+    return {"files": args.files, "days": args.days, "start": args.start, "gap_density": args.gap_density,
+            "mean_gap": args.mean_gap, "distribution": args.gap_lengths,
+            "duplicate_rate": args.duplicate_rate, "site": args.site, "seed": args.seed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write synthetic exports in the layout of the D12 samples.")
+    parser.add_argument("out_dir")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    paths, rows = generate(args.out_dir, **generator_options(args))
+    print(f"Wrote {len(paths)} exports ({rows} rows) to '{args.out_dir}' "
+          f"in {time.perf_counter() - start:.1f}s", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Columnar on-disk cache of parsed workbooks.
+
+load_table keeps every workbook it parses here, keyed by a SHA-256 of the
+file's bytes, so reruns and later stages read a binary columnar copy
+instead of re-parsing the XML. A renamed or moved file with the same
+contents still hits. Entries are Parquet files when pyarrow is installed
+and NumPy .npz archives otherwise.
+
+The cache lives in ../.cache (or $SJV_CACHE_DIR) and is held under
+$SJV_CACHE_MB megabytes (default 1024) by evicting the least recently used
+entries. Set SJV_CACHE=0 to bypass it.
+
+    python cache.py info
+    python cache.py purge [--keep-mb N]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.environ.get("SJV_CACHE_DIR") or os.path.join(os.path.dirname(SCRIPT_DIR), ".cache")
+DEFAULT_LIMIT_MB = 1024
+
+# Column that stores the gap mask inside a cache entry
+MASK_KEY = "__gap_mask"
+
+EXTENSIONS = (".parquet", ".npz")
+
+
+def enabled():
+    return os.environ.get("SJV_CACHE", "1") != "0"
+
+
+def limit_bytes():
+    return int(float(os.environ.get("SJV_CACHE_MB", DEFAULT_LIMIT_MB)) * 1024 * 1024)
+
+
+def file_hash(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _entry_path(key):
+    for ext in EXTENSIONS:
+        if ext == ".parquet" and pq is None:
+            continue
+        path = os.path.join(CACHE_DIR, key + ext)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def read_frame(path):
+    """Return (header_rows, df) from a file written by write_frame."""
+    if path.endswith(".parquet"):
+        table = pq.read_table(path)
+        header_rows = json.loads(table.schema.metadata[b"sjv_header_rows"])
+        return header_rows, table.to_pandas()
+    with np.load(path, allow_pickle=False) as data:
+        header_rows = json.loads(str(data["__header_rows"]))
+        columns = json.loads(str(data["__columns"]))
+        return header_rows, pd.DataFrame({name: data[f"c{i}"] for i, name in enumerate(columns)})
+
+
+def write_frame(base_path, df, header_rows=()):
+    """
+    Write df (plus header_rows as metadata) to base_path + ".parquet", or
+    + ".npz" without pyarrow, and return the path written. The file is
+    written under a temporary name and renamed, so readers in other
+    processes never see half of it.
+    """
+    folder = os.path.dirname(base_path)
+    os.makedirs(folder, exist_ok=True)
+    header_json = json.dumps(list(header_rows), default=str)
+    fd, tmp = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    if pa is not None:
+        os.close(fd)
+        final = base_path + ".parquet"
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                               b"sjv_header_rows": header_json.encode()})
+        pq.write_table(table, tmp)
+    else:
+        final = base_path + ".npz"
+        arrays = {"__header_rows": np.array(header_json), "__columns": np.array(json.dumps(list(df.columns)))}
+        for i, name in enumerate(df.columns):
+            values = df[name].to_numpy()
+            if values.dtype == object:
+                values = values.astype(str)
+            arrays[f"c{i}"] = values
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **arrays)
+    os.replace(tmp, final)
+    return final
+
+
+def get(key):
+    """Return (header_rows, df, gap_mask) for key, or None on a miss."""
+    path = _entry_path(key)
+    if path is None:
+        return None
+    try:
+        header_rows, df = read_frame(path)
+        # Touch the entry so eviction sees it as recently used
+        os.utime(path)
+    except (OSError, KeyError, ValueError):
+        return None
+
+    gap_mask = df.pop(MASK_KEY).to_numpy(dtype=bool) if MASK_KEY in df.columns else None
+    return header_rows, df, gap_mask
+
+
+def put(key, header_rows, df, gap_mask=None):
+    """Store a parsed workbook under key, then evict down to the size limit."""
+    df = df.copy()
+    if gap_mask is not None:
+        df[MASK_KEY] = np.asarray(gap_mask, dtype=bool)
+    write_frame(os.path.join(CACHE_DIR, key), df, header_rows)
+    evict(limit_bytes())
+
+
+def entries():
+    """(path, size, last used) for every cache entry, least recently used first."""
+    if not os.path.isdir(CACHE_DIR):
+        return []
+    found = []
+    for name in os.listdir(CACHE_DIR):
+        if not name.endswith(EXTENSIONS):
+            continue
+        path = os.path.join(CACHE_DIR, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        found.append((path, stat.st_size, stat.st_mtime))
+    return sorted(found, key=lambda entry: entry[2])
+
+
+def evict(max_bytes):
+    """Remove least recently used entries until the cache fits in max_bytes."""
+    current = entries()
+    total = sum(size for _, size, _ in current)
+    removed = 0
+    for path, size, _ in current:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    return removed
+
+
+def info():
+    current = entries()
+    total = sum(size for _, size, _ in current)
+    print(f"Cache folder: {CACHE_DIR}")
+    print(f"Format: {'parquet' if pa is not None else 'npz'}")
+    print(f"Entries: {len(current)}")
+    print(f"Size: {total / 1024 / 1024:.1f} MB of {limit_bytes() / 1024 / 1024:.0f} MB")
+    if current:
+        oldest = time.strftime("%Y-%m-%d %H:%M", time.localtime(current[0][2]))
+        newest = time.strftime("%Y-%m-%d %H:%M", time.localtime(current[-1][2]))
+        print(f"Last used: {oldest} (oldest) .. {newest} (newest)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or purge the parsed-workbook cache.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("info", help="show entry count and size")
+    purge = commands.add_parser("purge", help="remove cache entries")
+    purge.add_argument("--keep-mb", type=float, default=0,
+                       help="keep the most recently used entries up to this size")
+    args = parser.parse_args(argv)
+
+    if args.command == "info":
+        info()
+    else:
+        removed = evict(int(args.keep_mb * 1024 * 1024))
+        print(f"Removed {removed} cache entries.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+Metadata catalog of sensor exports.
+
+scan() streams a workbook with a read-only reader and pulls out what the
+pipeline needs to name and route a file: the B2 location (and the site code
+in it), the B5 sensor name, and the first and last timestamps. It never
+materialises the sheet; given copy_to it also writes the data rows to a new
+workbook as they stream past, dropping the metadata rows above the header.
+
+Results are stored in the shared SQLite database (see db.py) so other
+stages and the folder-routing scripts can look files up by path, site or
+sensor instead of opening them again.
+
+    python catalog.py [site]
+"""
+
+import os
+import re
+import sys
+import time
+
+from openpyxl import Workbook, load_workbook
+
+from db import connect
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS catalog (
+    path        TEXT PRIMARY KEY,
+    size        INTEGER,
+    mtime       REAL,
+    location    TEXT,
+    site        TEXT,
+    sensor      TEXT,
+    first_ts    TEXT,
+    last_ts     TEXT,
+    rows        INTEGER,
+    header_rows INTEGER,
+    scanned_at  TEXT
+);
+CREATE INDEX IF NOT EXISTS catalog_site_sensor ON catalog (site, sensor);
+"""
+
+FIELDS = ("location", "site", "sensor", "first_ts", "last_ts", "rows", "header_rows")
+
+# Site codes look like D12 or G08 at the start of the location or file name
+SITE_PATTERN = re.compile(r"^\s*([A-Za-z]\d{2})")
+
+
+def site_from(text):
+    match = SITE_PATTERN.match(str(text or ""))
+    return match.group(1).upper() if match else None
+
+
+def _is_header(values):
+    first = values[0] if values else None
+    return isinstance(first, str) and first.strip().lower() == "timestamp"
+
+
+def scan(file_path, copy_to=None):
+    """
+    Stream the workbook once and return its metadata as a dict.
+
+    With copy_to, the header row and data rows are written to that path as
+    they are read, leaving out the metadata rows above the header.
+    """
+    wb = load_workbook(file_path, read_only=True)
+    ws = wb.active
+    out = out_ws = None
+    if copy_to is not None:
+        out = Workbook(write_only=True)
+        out_ws = out.create_sheet()
+
+    header_rows = []
+    columns = None
+    first_ts = last_ts = None
+    rows = 0
+    for values in ws.iter_rows(values_only=True):
+        if columns is None:
+            if _is_header(values):
+                columns = values
+                if out_ws is not None:
+                    out_ws.append(values)
+            else:
+                header_rows.append(values)
+            continue
+        if out_ws is not None:
+            out_ws.append(values)
+        timestamp = values[0] if values else None
+        if timestamp is not None:
+            if first_ts is None:
+                first_ts = timestamp
+            last_ts = timestamp
+            rows += 1
+    wb.close()
+
+    if columns is None:
+        raise ValueError("no 'timestamp' header row found")
+    if out is not None:
+        out.save(copy_to)
+
+    # B2 is the second cell of the second metadata row; B5 is the header of the value column
+    location = header_rows[1][1] if len(header_rows) > 1 and len(header_rows[1]) > 1 else None
+    sensor = columns[1] if len(columns) > 1 else None
+    return {
+        "location": location,
+        "site": site_from(location) or site_from(os.path.basename(file_path)),
+        "sensor": sensor,
+        "first_ts": first_ts,
+        "last_ts": last_ts,
+        "rows": rows,
+        "header_rows": len(header_rows),
+    }
+
+
+def has_header_rows(file_path):
+    """True if the workbook still has metadata rows above the "timestamp" header."""
+    wb = load_workbook(file_path, read_only=True)
+    try:
+        for values in wb.active.iter_rows(values_only=True):
+            return not _is_header(values)
+        return False
+    finally:
+        wb.close()
+
+
+def record(file_path, meta):
+    """Store or replace the catalog entry for file_path."""
+    file_path = os.path.abspath(file_path)
+    stat = os.stat(file_path)
+    values = [meta.get(field) for field in FIELDS]
+    values[3:5] = [str(v) if v is not None else None for v in values[3:5]]
+    with connect(SCHEMA) as conn:
+        conn.execute("INSERT OR REPLACE INTO catalog VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                     (file_path, stat.st_size, stat.st_mtime, *values,
+                      time.strftime("%Y-%m-%d %H:%M:%S")))
+
+
+def move(old_path, new_path):
+    """Follow a file that was moved without changing its contents."""
+    move_many([(old_path, new_path)])
+
+
+def move_many(moves):
+    """Follow many (old path, new path) moves in one transaction."""
+    with connect(SCHEMA) as conn:
+        conn.executemany("UPDATE OR REPLACE catalog SET path = ? WHERE path = ?",
+                         [(os.path.abspath(new), os.path.abspath(old)) for old, new in moves])
+
+
+def forget(file_path):
+    with connect(SCHEMA) as conn:
+        conn.execute("DELETE FROM catalog WHERE path = ?", (os.path.abspath(file_path),))
+
+
+def lookup(file_path):
+    """The catalog entry for file_path as a dict, or None if it is missing or stale."""
+    file_path = os.path.abspath(file_path)
+    with connect(SCHEMA) as conn:
+        row = conn.execute("SELECT size, mtime, " + ", ".join(FIELDS) + " FROM catalog WHERE path = ?",
+                           (file_path,)).fetchone()
+    if row is None:
+        return None
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    if (stat.st_size, stat.st_mtime) != (row[0], row[1]):
+        return None
+    return dict(zip(FIELDS, row[2:]))
+
+
+def lookup_many(file_paths):
+    """lookup() for many files with one query per 500 paths: {path: entry} for the current entries."""
+    paths = [os.path.abspath(path) for path in file_paths]
+    rows = []
+    with connect(SCHEMA) as conn:
+        for i in range(0, len(paths), 500):
+            chunk = paths[i:i + 500]
+            rows += conn.execute("SELECT path, size, mtime, " + ", ".join(FIELDS) + " FROM catalog WHERE path IN ("
+                                 + ", ".join("?" * len(chunk)) + ")", chunk).fetchall()
+    entries = {}
+    for path, size, mtime, *values in rows:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        if (stat.st_size, stat.st_mtime) == (size, mtime):
+            entries[path] = dict(zip(FIELDS, values))
+    return entries
+
+
+def query(site=None, sensor=None):
+    """Catalog entries (path plus metadata) filtered by site and/or sensor."""
+    sql = "SELECT path, " + ", ".join(FIELDS) + " FROM catalog WHERE 1 = 1"
+    params = []
+    if site is not None:
+        sql += " AND site = ?"
+        params.append(site.upper())
+    if sensor is not None:
+        sql += " AND sensor = ?"
+        params.append(sensor)
+    with connect(SCHEMA) as conn:
+        rows = conn.execute(sql + " ORDER BY site, sensor, first_ts", params).fetchall()
+    return [dict(zip(("path",) + FIELDS, row)) for row in rows]
+
+
+if __name__ == "__main__":
+    site = sys.argv[1] if len(sys.argv) > 1 else None
+    for entry in query(site):
+        print(f"{entry['site'] or '?':<4} {entry['sensor'] or '?':<28} "
+              f"{entry['first_ts']} .. {entry['last_ts']}  {entry['rows']:>7} rows  "
+              f"{os.path.basename(entry['path'])}")
@@ -0,0 +1,309 @@
+"""
+Headless runner for the whole processing chain.
+
+Every step RUN.py used to run in sequence is declared here as a task with
+the resources it reads and writes. A task waits only for earlier tasks that
+write one of its inputs, so independent steps (creating the site folders
+while the pipeline runs, routing the averaged and original files at the
+same time) run concurrently, and the pipeline itself spreads files over
+worker processes. A task whose inputs hold no pending work is skipped as up
+to date, and tasks after a failed one are not started.
+
+The last task checks every averaged workbook with validate.py and saves
+the completeness matrix to ../validation; its exit status (incomplete days
+or unreadable files) shows in the summary. The exit status of the run is 0
+when everything ran cleanly and 1 when a task failed or reported errors,
+a workbook could not be validated, or (with --strict) a day does not have
+1440 timestamps, so the command can be scheduled from cron on machines
+without a display.
+With SJV_TRACE set, the spans of every task are saved there as one trace
+and summarised after the run (see instrument.py).
+
+    python cli.py run [--workers N] [--force] [--strict] [--dry-run] [--merge]
+    python cli.py plan
+    python cli.py cache info|purge [--keep-mb N]
+    python cli.py manifest show|reset [--stage NAME]
+    python cli.py worker serve|status|stop
+    python cli.py validate [folder] [--workers N]
+    python cli.py watch [--workers N] [--polling] [--once]
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import events
+import gaplog
+import instrument
+import worker
+from pipeline import AVERAGED_DIR, ORIGINAL_DIR, SCRIPT_DIR, TIME_CORRECTED_DIR, list_xlsx
+
+
+def _loose_files(folder, extensions=(".xlsx",)):
+    """Files directly inside folder (not in its site subfolders) still to be handled."""
+    if not os.path.isdir(folder):
+        return 0
+    return sum(1 for f in os.listdir(folder)
+               if f.lower().endswith(extensions) and not f.startswith("~$")
+               and os.path.isfile(os.path.join(folder, f)))
+
+
+class Task:
+    """
+    One script in the chain.
+
+    inputs and outputs name the resources (folders or stores) the script
+    reads and writes. pending returns how much work is waiting; a task with
+    nothing pending is up to date. Without pending the task always runs.
+    exit_statuses names the non-zero exit codes that are results rather
+    than failures. A check task only inspects what earlier tasks wrote: its
+    files stay out of the run's totals and its incomplete days are counted
+    instead of listed one by one.
+    """
+
+    def __init__(self, name, script, inputs=(), outputs=(), pending=None, args=(), exit_statuses=None,
+                 check=False):
+        self.name = name
+        self.script = script
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.pending = pending
+        self.args = list(args)
+        self.exit_statuses = dict(exit_statuses or {})
+        self.check = check
+        self.deps = []
+
+
+# Declared in the order RUN.py runs them; each task depends on the earlier
+# tasks that write one of its inputs
+TASKS = [
+    Task("pipeline", "pipeline.py", inputs=["original"], outputs=["original", "averaged", "gap log", "rollups"],
+         pending=lambda: len(list_xlsx(ORIGINAL_DIR))),
+    Task("createfolders", "createfolders.py", outputs=["time corrected"]),
+    Task("timelogrename", "timelogrename.py", inputs=["gap log", "time corrected"], outputs=["time corrected"],
+         pending=lambda: len(gaplog.sites_to_export())),
+    Task("tcfilename", "tcfilename.py", inputs=["time corrected"], outputs=["time corrected"],
+         pending=lambda: _loose_files(TIME_CORRECTED_DIR, (".xlsx", ".csv"))),
+    Task("averaged", "averaged.py", inputs=["averaged"], outputs=["averaged"],
+         pending=lambda: _loose_files(AVERAGED_DIR)),
+    Task("original", "original.py", inputs=["original"], outputs=["original"],
+         pending=lambda: _loose_files(ORIGINAL_DIR)),
+    Task("validate", "validate.py", inputs=["averaged"], outputs=["validation"],
+         exit_statuses={1: "incomplete", 2: "unreadable"}, check=True),
+]
+
+# Task statuses that fail the run (and block the tasks after them)
+FAILED = ("failed", "blocked", "unreadable")
+
+
+def resolve(tasks):
+    """Fill in each task's dependencies from the inputs and outputs declared before it."""
+    for index, task in enumerate(tasks):
+        task.deps = [earlier for earlier in tasks[:index]
+                     if set(earlier.outputs) & set(task.inputs)]
+    return tasks
+
+
+class Summary:
+    """Thread-safe totals collected from task results and events."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.status = {}
+        self.elapsed = {}
+        self.files = {}
+        self.rows = 0
+        self.gaps = 0
+        self.errors = []
+        self.mismatches = []
+        self.incomplete_days = 0
+
+    def handle_event(self, task, event):
+        kind = event.get("event")
+        with self.lock:
+            if kind == "error":
+                where = " / ".join(str(part) for part in (event.get("file"), event.get("stage")) if part)
+                self.errors.append(f"{task.name}: {where}: {event.get('message')}")
+            elif kind == "day_count" and event["count"] != event.get("expected", 1440):
+                if task.check:
+                    self.incomplete_days += 1
+                else:
+                    self.mismatches.append(f"{task.name}: {event['file']}: {event['date']}: "
+                                           f"{event['count']} timestamps")
+            elif kind == "file" and not task.check:
+                status = event.get("status", "done")
+                self.files[status] = self.files.get(status, 0) + 1
+                self.rows += event.get("rows") or 0
+                self.gaps += event.get("gaps") or 0
+
+    def finish(self, task, status, elapsed):
+        with self.lock:
+            self.status[task.name] = status
+            self.elapsed[task.name] = elapsed
+
+    def print(self, tasks, total_elapsed):
+        print("\nSummary:", flush=True)
+        for task in tasks:
+            status = self.status.get(task.name, "not run")
+            elapsed = self.elapsed.get(task.name)
+            timing = f"{elapsed:6.1f}s" if elapsed is not None else "       "
+            print(f"  {task.name:<14} {status:<10} {timing}", flush=True)
+        print(f"  {self.files.get('done', 0)} files processed, {self.files.get('skipped', 0)} up to date, "
+              f"{self.files.get('error', 0)} failed; {self.rows} rows, {self.gaps} gaps filled "
+              f"in {total_elapsed:.0f}s", flush=True)
+        if self.mismatches:
+            print(f"\n{len(self.mismatches)} timestamp counts did not equal 1440:", flush=True)
+            for line in self.mismatches:
+                print(f"  {line}", flush=True)
+        if self.incomplete_days:
+            print(f"\n{self.incomplete_days} days of the averaged workbooks do not have 1440 timestamps "
+                  f"(see validation/completeness.csv)", flush=True)
+        if self.errors:
+            print(f"\n{len(self.errors)} errors:", flush=True)
+            for line in self.errors:
+                print(f"  {line}", flush=True)
+
+
+def run_task(task, summary, extra_args=()):
+    """Run one task's script with structured events on, echoing its output prefixed by the task name."""
+    # Runs in the warm worker daemon when one is up (see worker.py)
+    process = worker.launch(task.script, [*task.args, *extra_args],
+                            env={"SJV_EVENTS": "stdout", **instrument.child_env()})
+    for line in process.stdout:
+        event = events.parse(line)
+        if event is not None:
+            summary.handle_event(task, event)
+            # Pass it on to SJV_EVENTS_LOG and any subscribers in this process
+            events.dispatch(event)
+        elif line.strip():
+            print(f"[{task.name}] {line.rstrip()}", flush=True)
+    rc = process.wait()
+    if not rc:
+        return "done"
+    if rc in task.exit_statuses:
+        return task.exit_statuses[rc]
+    summary.handle_event(task, {"event": "error", "stage": task.name,
+                                "message": f"{task.script} exited with code {rc}"})
+    return "failed"
+
+
+def run(tasks, workers=None, force=False, dry_run=False, max_parallel=None, merge=False):
+    """Schedule the tasks over a thread pool as their dependencies finish; returns the Summary."""
+    summary = Summary()
+    pipeline_args = []
+    if workers:
+        pipeline_args += ["--workers", str(workers)]
+    if force:
+        pipeline_args.append("--force")
+    if merge:
+        pipeline_args.append("--merge")
+
+    remaining = list(tasks)
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_parallel or len(tasks)) as pool:
+        while remaining or running:
+            for task in list(remaining):
+                states = [summary.status.get(dep.name) for dep in task.deps]
+                if any(state in FAILED for state in states):
+                    remaining.remove(task)
+                    summary.finish(task, "blocked", None)
+                    print(f"Blocked: {task.name} (a dependency failed)", flush=True)
+                    continue
+                if any(state is None for state in states):
+                    continue
+
+                remaining.remove(task)
+                pending = task.pending() if task.pending is not None and not force else None
+                if pending == 0:
+                    summary.finish(task, "up to date", None)
+                    print(f"Up to date: {task.name}", flush=True)
+                    continue
+                if dry_run:
+                    summary.finish(task, "would run", None)
+                    print(f"Would run: {task.name}" + (f" ({pending} pending)" if pending else ""), flush=True)
+                    continue
+                print(f"Running {task.script}" + (f" ({pending} pending)" if pending else ""), flush=True)
+                extra = pipeline_args if task.name == "pipeline" else ()
+                running[pool.submit(run_task, task, summary, extra)] = (task, time.perf_counter())
+
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                task, start = running.pop(future)
+                try:
+                    status = future.result()
+                except Exception as e:
+                    summary.handle_event(task, {"event": "error", "stage": task.name, "message": str(e)})
+                    status = "failed"
+                summary.finish(task, status, time.perf_counter() - start)
+                print(f"Finished {task.script} ({status})", flush=True)
+    return summary
+
+
+def print_plan(tasks):
+    for task in tasks:
+        after = ", ".join(dep.name for dep in task.deps) or "-"
+        print(f"{task.name:<14} reads {', '.join(task.inputs) or '-':<28} "
+              f"writes {', '.join(task.outputs) or '-':<32} after {after}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the SJV processing chain without the GUI.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="run every task that has pending work")
+    run_parser.add_argument("--workers", type=int, default=None,
+                            help="worker processes for the pipeline (default: $SJV_WORKERS or the CPU count)")
+    run_parser.add_argument("--force", action="store_true",
+                            help="run every task and reprocess every file")
+    run_parser.add_argument("--strict", action="store_true",
+                            help="exit non-zero on timestamp count mismatches and incomplete days too")
+    run_parser.add_argument("--dry-run", action="store_true",
+                            help="show which tasks would run without running them")
+    run_parser.add_argument("--merge", action="store_true",
+                            help="process each site's sensors together on one shared index (see merge.py)")
+    commands.add_parser("plan", help="show the tasks and their dependencies")
+    for name in ("cache", "manifest", "worker", "validate", "watch"):
+        sub = commands.add_parser(name, help=f"same as python {name}.py", add_help=False)
+        sub.add_argument("args", nargs=argparse.REMAINDER)
+    # Options after a forwarded command belong to that script, even before its first argument
+    args, extra = parser.parse_known_args(argv)
+    if extra and not hasattr(args, "args"):
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+    if extra:
+        args.args = extra + args.args
+
+    tasks = resolve(TASKS)
+    if args.command == "plan":
+        print_plan(tasks)
+        return 0
+    if args.command == "cache":
+        import cache
+        return cache.main(args.args)
+    if args.command == "manifest":
+        import manifest
+        return manifest.main(args.args)
+    if args.command == "worker":
+        return worker.main(args.args)
+    if args.command == "validate":
+        import validate
+        return validate.main(args.args)
+    if args.command == "watch":
+        import watch
+        return watch.main(args.args)
+
+    start = time.perf_counter()
+    summary = run(tasks, args.workers, args.force, args.dry_run, merge=args.merge)
+    summary.print(tasks, time.perf_counter() - start)
+    failed = [name for name, status in summary.status.items() if status in FAILED]
+    incomplete = summary.mismatches or summary.incomplete_days
+    if failed or summary.errors or (args.strict and incomplete):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
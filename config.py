@@ -0,0 +1,40 @@
+"""
+Shared settings, read from config.json next to the scripts (or the file
+named by $SJV_CONFIG). Keys missing from the file fall back to DEFAULTS, so
+the scripts run the same as before without one.
+"""
+
+import json
+import os
+from functools import lru_cache
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_PATH = os.environ.get("SJV_CONFIG") or os.path.join(SCRIPT_DIR, "config.json")
+
+DEFAULTS = {
+    # How the interpolation stage fills the gap rows of each value column.
+    # Keys are column names or fnmatch patterns, matched without case;
+    # "default" covers every other column. See interpol.POLICIES. Zero-fill
+    # is opt-in, e.g. {"default": "interpolate", "energy rate": "zero"} for a
+    # rate that reads 0 while the unit is idle; a cumulative meter such as
+    # "Volume total" should interpolate or hold, since a 0 breaks its total.
+    "column_policies": {"default": "interpolate"},
+    # Which export wins where exports of one sensor overlap. See stitch.OVERLAP_RULES.
+    "stitch": {"overlap": "last"},
+    # Site codes the routing scripts sort files into. See routing.py.
+    "sites": ["D12", "D15", "D17", "D31", "D32", "G06", "G08", "G10", "G14", "G15", "G24"],
+}
+
+
+@lru_cache(maxsize=None)
+def load(path=CONFIG_PATH):
+    """The settings in path layered over DEFAULTS (a missing file gives the defaults)."""
+    settings = json.loads(json.dumps(DEFAULTS))
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            settings.update(json.load(f))
+    return settings
+
+
+def get(key, path=CONFIG_PATH):
+    return load(path).get(key)
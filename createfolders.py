@@ -1,13 +1,15 @@
 import os
 
+import routing
+
 # Get the directory path one level up from where the script is being run
 parent_dir = os.path.abspath(os.path.join(os.getcwd(), ".."))
 
 # Define the target folder name
 target_folder = "time corrected"
 
-# Define the subfolders you want to create
-subfolders = ["D12", "D15", "D17", "D31", "D32", "G06", "G08", "G10", "G14", "G15", "G24"]
+# One subfolder for every site in the registry (see routing.py)
+subfolders = routing.site_list()
 
 # Construct the path to the "time corrected" folder
 target_folder_path = os.path.join(parent_dir, target_folder)
@@ -0,0 +1,32 @@
+"""
+Shared SQLite database for pipeline bookkeeping.
+
+The database lives next to the data folders (../sjv.sqlite, or $SJV_DB) so
+every script, worker process and the GUI see the same state. Connections
+use WAL mode and a busy timeout so parallel workers can write safely.
+"""
+
+import os
+import sqlite3
+from contextlib import contextmanager
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.environ.get("SJV_DB") or os.path.join(os.path.dirname(SCRIPT_DIR), "sjv.sqlite")
+
+
+@contextmanager
+def connect(schema=None):
+    """
+    Open the database for one transaction, creating the tables in schema if
+    they are missing. Commits on success and always closes the connection.
+    """
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        if schema:
+            conn.executescript(schema)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
@@ -0,0 +1,87 @@
+"""
+Structured events between the stages and whoever runs them.
+
+Stages call emit() with a kind and fields such as file, stage, rows, gaps,
+elapsed and error details. Events reach:
+  - in-process subscribers registered with subscribe();
+  - the parent process as JSON lines on stdout when SJV_EVENTS=stdout.
+    Each event line starts with an ASCII record separator, so a runner can
+    tell events from ordinary log text without guessing (see parse());
+  - a JSON-lines file when SJV_EVENTS_LOG is set, for monitoring.
+
+Event kinds:
+  batch      a run of stages is starting (files, stages, workers)
+  stage      one stage finished on one file (file, stage, rows, gaps, elapsed)
+  file       one file finished (file, status, output, rows, gaps, elapsed)
+  day_count  timestamps counted for one day (file, date, count, expected)
+  error      something failed (file, stage, message, traceback)
+  span       a timed step finished, when SJV_TRACE is set (name, cat, ts, dur, tid, args; see instrument.py)
+"""
+
+import io
+import json
+import os
+import sys
+import time
+
+PREFIX = "\x1e"
+
+_subscribers = []
+
+# Set inside worker processes so their events travel back with their output
+forward_to_stdout = False
+
+
+def subscribe(callback):
+    """Call callback(event) for every event emitted or replayed in this process."""
+    _subscribers.append(callback)
+
+
+def unsubscribe(callback):
+    if callback in _subscribers:
+        _subscribers.remove(callback)
+
+
+def dispatch(event):
+    """Deliver an event that already has its kind and time set."""
+    if forward_to_stdout:
+        # Worker process: the parent replays the event to its own outputs
+        sys.stdout.write(PREFIX + json.dumps(event, default=str) + "\n")
+        return
+    for callback in list(_subscribers):
+        callback(event)
+    if os.environ.get("SJV_EVENTS") == "stdout":
+        sys.stdout.write(PREFIX + json.dumps(event, default=str) + "\n")
+        sys.stdout.flush()
+    log_path = os.environ.get("SJV_EVENTS_LOG")
+    if log_path:
+        with open(log_path, "a") as log_file:
+            log_file.write(json.dumps(event, default=str) + "\n")
+
+
+def emit(kind, **fields):
+    event = {"event": kind, "time": time.time(), "pid": os.getpid(), **fields}
+    dispatch(event)
+    return event
+
+
+def parse(line):
+    """The event on this output line, or None for ordinary text."""
+    if not line.startswith(PREFIX):
+        return None
+    try:
+        return json.loads(line[len(PREFIX):])
+    except ValueError:
+        return None
+
+
+def replay(output):
+    """Print captured worker output, dispatching the events found in it."""
+    # Split on newlines only: str.splitlines would also break at the record separator
+    for line in io.StringIO(output):
+        event = parse(line)
+        if event is None:
+            sys.stdout.write(line)
+        else:
+            dispatch(event)
+    sys.stdout.flush()
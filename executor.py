@@ -0,0 +1,80 @@
+"""
+Shared executor for the per-file stages.
+
+Work runs in a process pool (parsing and computing on workbooks is
+CPU-bound, so threads only ever use one core). At most max_in_flight items
+are submitted or holding results at a time, which bounds how many
+workbooks are in memory, and results are reported in input order. Each
+worker's printed output and events are captured and replayed with its
+result, so the log reads the same as a sequential run.
+
+The worker count comes from the workers argument, then the SJV_WORKERS
+environment variable, then the number of CPUs.
+"""
+
+import io
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import redirect_stdout
+
+import events
+
+
+def default_workers():
+    value = os.environ.get("SJV_WORKERS")
+    if value:
+        return max(1, int(value))
+    return os.cpu_count() or 1
+
+
+def captured(func, item):
+    """Run func(item) in a worker, returning (printed output and events, result) for events.replay."""
+    events.forward_to_stdout = True
+    buffer = io.StringIO()
+    with redirect_stdout(buffer):
+        try:
+            result = func(item)
+        except Exception as e:
+            print(f"Error processing '{item}': {e}", flush=True)
+            events.emit("error", file=str(item), message=str(e), traceback=traceback.format_exc())
+            result = None
+    return buffer.getvalue(), result
+
+
+def run_ordered(func, items, workers=None, max_in_flight=None, processes=True):
+    """
+    Apply func to every item and return the results in input order.
+
+    func and the items must be picklable when processes is True (use
+    module-level functions or functools.partial). Thread mode is meant for
+    I/O-bound work such as file moves; its output is not captured.
+    """
+    items = list(items)
+    workers = min(workers or default_workers(), max(len(items), 1))
+    if workers <= 1:
+        return [func(item) for item in items]
+
+    limit = max(max_in_flight or workers, 1)
+    pool_class = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    results = []
+    with pool_class(max_workers=workers) as pool:
+        window = {}
+        next_submit = 0
+        for index in range(len(items)):
+            # Keep the window full, counting finished-but-unreported items
+            while next_submit < len(items) and next_submit - index < limit:
+                if processes:
+                    window[next_submit] = pool.submit(captured, func, items[next_submit])
+                else:
+                    window[next_submit] = pool.submit(func, items[next_submit])
+                next_submit += 1
+
+            future = window.pop(index)
+            if processes:
+                output, result = future.result()
+                events.replay(output)
+            else:
+                result = future.result()
+            results.append(result)
+    return results
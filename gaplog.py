@@ -0,0 +1,149 @@
+"""
+Gap log store.
+
+missing.py records every run of missing minutes as a (start, end, count)
+interval in the shared SQLite database (see db.py) instead of appending
+each minute as text to timestamp_log.csv. Intervals are split at midnight
+so each one belongs to a single date, and the table is indexed on site,
+sensor and date. Recording a file replaces its previous intervals in one
+transaction, so reruns and parallel workers never duplicate or interleave
+entries.
+
+    python gaplog.py [site]
+"""
+
+import csv
+import sys
+import time
+
+import numpy as np
+
+from db import connect
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS gap_files (
+    file        TEXT PRIMARY KEY,
+    site        TEXT,
+    sensor      TEXT,
+    missing     INTEGER,
+    intervals   INTEGER,
+    recorded_at TEXT
+);
+CREATE TABLE IF NOT EXISTS gaps (
+    file     TEXT NOT NULL,
+    site     TEXT,
+    sensor   TEXT,
+    date     TEXT,
+    start_ts TEXT,
+    end_ts   TEXT,
+    count    INTEGER
+);
+CREATE INDEX IF NOT EXISTS gaps_file ON gaps (file);
+CREATE INDEX IF NOT EXISTS gaps_site ON gaps (site);
+CREATE INDEX IF NOT EXISTS gaps_sensor ON gaps (sensor);
+CREATE INDEX IF NOT EXISTS gaps_date ON gaps (date);
+CREATE TABLE IF NOT EXISTS gap_exports (
+    site        TEXT PRIMARY KEY,
+    exported_at TEXT
+);
+"""
+
+
+def _now():
+    return time.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def intervals(timestamps, gap_mask):
+    """
+    Run-length encode a gap mask into (start, end, count) tuples.
+
+    timestamps and gap_mask are aligned arrays; runs are split wherever the
+    date changes so no interval crosses midnight.
+    """
+    mask = np.asarray(gap_mask, dtype=bool)
+    if not mask.any():
+        return []
+    ts = np.asarray(timestamps, dtype="datetime64[ns]")
+    day = ts.astype("datetime64[D]")
+
+    new_day = np.ones(len(mask), dtype=bool)
+    new_day[1:] = day[1:] != day[:-1]
+    prev_gap = np.concatenate(([False], mask[:-1]))
+    next_gap = np.concatenate((mask[1:], [False]))
+    next_new_day = np.concatenate((new_day[1:], [True]))
+
+    starts = np.flatnonzero(mask & (~prev_gap | new_day))
+    ends = np.flatnonzero(mask & (~next_gap | next_new_day))
+    return [(ts[s], ts[e], int(e - s + 1)) for s, e in zip(starts, ends)]
+
+
+def _text(value):
+    return str(value.astype("datetime64[s]")).replace("T", " ")
+
+
+def record(file_name, site, sensor, gap_intervals):
+    """Replace the stored intervals for file_name."""
+    rows = [(file_name, site, sensor, _text(start)[:10], _text(start), _text(end), count)
+            for start, end, count in gap_intervals]
+    missing = sum(count for _, _, count in gap_intervals)
+    with connect(SCHEMA) as conn:
+        conn.execute("DELETE FROM gaps WHERE file = ?", (file_name,))
+        conn.executemany("INSERT INTO gaps VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        conn.execute("INSERT OR REPLACE INTO gap_files VALUES (?, ?, ?, ?, ?, ?)",
+                     (file_name, site, sensor, missing, len(rows), _now()))
+
+
+def files_since(since=None, site=None):
+    """(file, site, sensor, missing, intervals) for files recorded at or after since."""
+    sql = "SELECT file, site, sensor, missing, intervals FROM gap_files WHERE 1 = 1"
+    params = []
+    if since is not None:
+        sql += " AND recorded_at >= ?"
+        params.append(since)
+    if site is not None:
+        sql += " AND site = ?"
+        params.append(site)
+    with connect(SCHEMA) as conn:
+        return conn.execute(sql + " ORDER BY site, file", params).fetchall()
+
+
+def daily_missing(site=None, sensor=None, date=None):
+    """(file, date, missing minutes) per file and day."""
+    sql = "SELECT file, date, SUM(count) FROM gaps WHERE 1 = 1"
+    params = []
+    for column, value in (("site", site), ("sensor", sensor), ("date", date)):
+        if value is not None:
+            sql += f" AND {column} = ?"
+            params.append(value)
+    with connect(SCHEMA) as conn:
+        return conn.execute(sql + " GROUP BY file, date ORDER BY file, date", params).fetchall()
+
+
+def sites_to_export():
+    """Sites with gap records newer than their last CSV export."""
+    with connect(SCHEMA) as conn:
+        rows = conn.execute(
+            "SELECT DISTINCT f.site FROM gap_files f LEFT JOIN gap_exports e ON e.site = f.site "
+            "WHERE f.site IS NOT NULL AND (e.exported_at IS NULL OR f.recorded_at >= e.exported_at) "
+            "ORDER BY f.site").fetchall()
+    return [site for (site,) in rows]
+
+
+def export_csv(site, path):
+    """Write the site's intervals to a CSV report and remember the export time."""
+    exported_at = _now()
+    with connect(SCHEMA) as conn:
+        rows = conn.execute("SELECT file, sensor, start_ts, end_ts, count FROM gaps WHERE site = ? "
+                            "ORDER BY file, start_ts", (site,)).fetchall()
+        conn.execute("INSERT OR REPLACE INTO gap_exports VALUES (?, ?)", (site, exported_at))
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["File Name", "Sensor", "Start", "End", "Missing Minutes"])
+        writer.writerows(rows)
+    return len(rows)
+
+
+if __name__ == "__main__":
+    site = sys.argv[1] if len(sys.argv) > 1 else None
+    for file_name, file_site, sensor, missing, count in files_since(site=site):
+        print(f"{file_site or '?':<4} {missing:>6} missing minutes in {count:>4} gaps  {file_name}")
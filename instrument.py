@@ -0,0 +1,200 @@
+"""
+Timed spans and counters for the stages, saved as a Chrome trace.
+
+Stages wrap their parse, compute and write steps in span() and add what
+they handled (rows, gaps, cells) to the innermost span with count(). With
+SJV_TRACE set to a file path, every finished span is sent as a "span" event
+(see events.py), so spans from worker processes and from scripts started by
+RUN.py or cli.py reach the top-level process like any other event. That
+process writes them to SJV_TRACE in Chrome trace format (open it in
+chrome://tracing or https://ui.perfetto.dev) and summary() turns them into
+a table of time per step. Without SJV_TRACE a span records nothing.
+
+SJV_PROFILE adds heavier capture to the spans:
+  tracemalloc  the peak Python allocations inside each span (peak_kb)
+  cprofile     a cProfile of each outermost span, saved beside the trace
+               as <trace>.<span>.<pid>.<n>.prof (open with pstats or snakeviz)
+"""
+
+import atexit
+import cProfile
+import json
+import os
+import re
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import events
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+TRACE_DIR = os.path.join(os.path.dirname(SCRIPT_DIR), "traces")
+
+PROFILES = ("tracemalloc", "cprofile")
+
+_local = threading.local()
+_collected = []
+_profile_count = 0
+
+
+def enabled():
+    return bool(os.environ.get("SJV_TRACE"))
+
+
+def profile_mode():
+    mode = os.environ.get("SJV_PROFILE", "").lower()
+    return mode if mode in PROFILES else None
+
+
+def new_trace_path():
+    return os.path.join(TRACE_DIR, time.strftime("run %Y-%m-%d %H%M%S.json"))
+
+
+def child_env(trace_path=None):
+    """Environment that turns tracing on in a child script (the warm worker does not inherit ours)."""
+    trace_path = trace_path or os.environ.get("SJV_TRACE")
+    if not trace_path:
+        return {}
+    env = {"SJV_TRACE": trace_path}
+    if os.environ.get("SJV_PROFILE"):
+        env["SJV_PROFILE"] = os.environ["SJV_PROFILE"]
+    return env
+
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+class _Frame:
+    __slots__ = ("name", "cat", "args", "start", "start_us", "mem_start", "peak", "profiler")
+
+    def __init__(self, name, cat, args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start_us = time.time_ns() // 1000
+        self.start = time.perf_counter()
+        self.mem_start = self.peak = 0
+        self.profiler = None
+
+
+def _profile_path(name):
+    global _profile_count
+    _profile_count += 1
+    safe = re.sub(r"[^\w.-]+", "_", name)
+    return f"{os.environ['SJV_TRACE']}.{safe}.{os.getpid()}.{_profile_count}.prof"
+
+
+@contextmanager
+def span(name, cat="stage", **args):
+    """Time the enclosed block as one step; args (file, backend, ...) are kept with it."""
+    if not enabled():
+        yield
+        return
+    stack = _stack()
+    frame = _Frame(name, cat, args)
+    mode = profile_mode()
+    if mode == "tracemalloc":
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        current, peak = tracemalloc.get_traced_memory()
+        if stack:
+            # Keep the enclosing span's peak before starting a fresh one for this span
+            stack[-1].peak = max(stack[-1].peak, peak)
+        tracemalloc.reset_peak()
+        frame.mem_start = frame.peak = current
+    elif mode == "cprofile" and not stack:
+        frame.profiler = cProfile.Profile()
+        frame.profiler.enable()
+    stack.append(frame)
+    try:
+        yield
+    finally:
+        stack.pop()
+        elapsed = time.perf_counter() - frame.start
+        if frame.profiler is not None:
+            frame.profiler.disable()
+            path = _profile_path(name)
+            frame.profiler.dump_stats(path)
+            frame.args["profile"] = path
+        if mode == "tracemalloc" and tracemalloc.is_tracing():
+            frame.peak = max(frame.peak, tracemalloc.get_traced_memory()[1])
+            frame.args["peak_kb"] = (frame.peak - frame.mem_start) // 1024
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, frame.peak)
+            tracemalloc.reset_peak()
+        events.emit("span", name=name, cat=cat, ts=frame.start_us, dur=int(elapsed * 1e6),
+                    tid=threading.get_ident(), args=frame.args)
+
+
+def count(name, value=1):
+    """Add value to counter name on the innermost open span."""
+    if not enabled():
+        return
+    stack = _stack()
+    if stack:
+        stack[-1].args[name] = stack[-1].args.get(name, 0) + int(value)
+
+
+def chrome_trace(spans):
+    """The spans as a Chrome trace document."""
+    trace_events = []
+    for event in spans:
+        trace_events.append({"name": event["name"], "cat": event.get("cat", "stage"), "ph": "X",
+                             "ts": event["ts"], "dur": event["dur"], "pid": event.get("pid", 0),
+                             "tid": event.get("tid", 0), "args": event.get("args") or {}})
+    return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+
+def write_trace(path, spans):
+    """Write the spans to path in Chrome trace format; returns the path."""
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(chrome_trace(spans), f, default=str)
+    os.replace(tmp, path)
+    return path
+
+
+def summary(spans):
+    """Lines of a table with the count, total and mean time and rows per second of each step."""
+    steps = {}
+    for event in spans:
+        step = steps.setdefault((event.get("cat", "stage"), event["name"]), {"n": 0, "us": 0, "rows": 0})
+        step["n"] += 1
+        step["us"] += event["dur"]
+        step["rows"] += (event.get("args") or {}).get("rows", 0)
+    lines = [f"  {'step':<16} {'count':>6} {'total':>9} {'mean':>9} {'rows/s':>11}"]
+    for (cat, name), step in sorted(steps.items(), key=lambda item: -item[1]["us"]):
+        total = step["us"] / 1e6
+        # Rates over steps shorter than a millisecond are noise
+        rate = f"{step['rows'] / total:11,.0f}" if step["rows"] and total >= 0.001 else f"{'-':>11}"
+        lines.append(f"  {name:<16} {step['n']:>6} {total:8.2f}s {total / step['n']:8.3f}s {rate}")
+    return lines
+
+
+def _top_level():
+    """True when this process keeps the spans itself instead of passing them to a parent."""
+    return not events.forward_to_stdout and os.environ.get("SJV_EVENTS") != "stdout"
+
+
+def _collect(event):
+    if event.get("event") == "span" and _top_level():
+        _collected.append(event)
+
+
+def _write_collected():
+    if _collected and enabled():
+        path = write_trace(os.environ["SJV_TRACE"], _collected)
+        print(f"\nTime by step ({len(_collected)} spans):", flush=True)
+        for line in summary(_collected):
+            print(line, flush=True)
+        print(f"Trace saved: '{path}'", flush=True)
+
+
+events.subscribe(_collect)
+atexit.register(_write_collected)
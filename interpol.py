@@ -1,90 +1,177 @@
-import openpyxl
-import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
-
-def process_excel(file_path):
-    print(f"Start: '{os.path.basename(file_path)}'", flush=True)
-    
-    # Load the workbook and select the active sheet
-    wb = openpyxl.load_workbook(file_path)
-    sheet = wb.active
-
-    # Get the maximum row number
-    max_row = sheet.max_row
-
-    # Store the indices of cells to be processed
-    cells_to_process = []
-
-    for row in range(7, max_row + 1):
-        cell = sheet.cell(row=row, column=2)
-        fill = cell.fill
-
-        if fill.start_color.index == "FFFF0000":  # This is the red fill color in RGB
-            cells_to_process.append(row)
-
-    for row in cells_to_process:
-        # Find the first non-red value before the cell
-        prev_value = None
-        for r in range(row - 1, 6, -1):
-            cell = sheet.cell(row=r, column=2)
-            fill = cell.fill
-            if fill.start_color.index != "FFFF0000":
-                prev_value = cell.value
-                break
-
-        # Find the first non-red value after the cell
-        next_value = None
-        for r in range(row + 1, max_row + 1):
-            cell = sheet.cell(row=r, column=2)
-            fill = cell.fill
-            if fill.start_color.index != "FFFF0000":
-                next_value = cell.value
-                break
-
-        # Calculate the average
-        if prev_value is not None and next_value is not None:
-            new_value = (prev_value + next_value) / 2
-            sheet.cell(row=row, column=2).value = new_value
-
-    # Create the 'averaged' directory one level up from the script's location if it doesn't exist
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    parent_dir = os.path.dirname(script_dir)
-    averaged_dir = os.path.join(parent_dir, "averaged")
-    if not os.path.exists(averaged_dir):
-        os.makedirs(averaged_dir)
-
-    # Modify the output file name
-    input_file_name = os.path.basename(file_path)
-    output_file_name = input_file_name.replace("time corrected", "averaged")
-    output_file_path = os.path.join(averaged_dir, output_file_name)
-
-    # Save the workbook
-    wb.save(output_file_path)
-    print(f"Saved: '{output_file_path}'", flush=True)
+import argparse
+from fnmatch import fnmatch
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+import config
+import instrument
+from pipeline import AVERAGED_DIR, TIME_CORRECTED_DIR, Stage, list_xlsx, run_pipeline
+
+# Interpolation methods understood by interpolate_gaps
+METHODS = ("midpoint", "linear", "time")
+
+# How a value column's gap rows are filled (set per column in config.json):
+#   interpolate  from the neighbouring rows with the stage's method
+#   zero         with 0 (never for cumulative totals, which would dip to 0)
+#   hold         with the last value before the gap
+#   leave        not at all
+POLICIES = ("interpolate", "zero", "hold", "leave")
+
+def interpolate_gaps(values, mask, method="midpoint", timestamps=None, max_gap=None):
+    """
+    Fill every gap in one vectorized pass and return a new float array.
+
+    values is a 1-D array, or a 2-D array with one column per sensor, and
+    mask a boolean array of the same shape that is True for gap rows. Each
+    gap row is filled from the nearest non-gap row before and after it in
+    the same column:
+      - "midpoint": the average of the two neighbours (the original behaviour)
+      - "linear":   linear in row position between the neighbours
+      - "time":     linear in time; needs timestamps (datetime64 or numbers)
+    Gaps at either end of the series, gaps next to an empty neighbour, and
+    gaps longer than max_gap rows are left as they are.
+    """
+    if method not in METHODS:
+        raise ValueError(f"unknown interpolation method {method!r}; expected one of {METHODS}")
+
+    values = np.asarray(values, dtype=float).copy()
+    mask = np.asarray(mask, dtype=bool)
+    if values.ndim == 1:
+        return interpolate_gaps(values[:, None], mask[:, None], method, timestamps, max_gap)[:, 0]
+    n = len(values)
+    if n == 0 or not mask.any():
+        return values
+
+    # Index of the nearest non-gap row at or before / at or after each row
+    positions = np.arange(n)[:, None]
+    prev_idx = np.maximum.accumulate(np.where(mask, -1, positions), axis=0)
+    next_idx = np.minimum.accumulate(np.where(mask, n, positions)[::-1], axis=0)[::-1]
+
+    fill = mask & (prev_idx >= 0) & (next_idx < n)
+    if max_gap is not None:
+        fill &= (next_idx - prev_idx - 1) <= max_gap
+
+    rows, cols = fill.nonzero()
+    prev_rows, next_rows = prev_idx[rows, cols], next_idx[rows, cols]
+    before = values[prev_rows, cols]
+    after = values[next_rows, cols]
+    usable = ~(np.isnan(before) | np.isnan(after))
+    rows, cols, before, after = rows[usable], cols[usable], before[usable], after[usable]
+    prev_rows, next_rows = prev_rows[usable], next_rows[usable]
+
+    if method == "midpoint":
+        values[rows, cols] = (before + after) / 2
+        return values
+
+    if method == "linear":
+        weight = (rows - prev_rows) / (next_rows - prev_rows)
+    else:
+        if timestamps is None:
+            raise ValueError("time interpolation needs timestamps")
+        t = np.asarray(timestamps)
+        if np.issubdtype(t.dtype, np.datetime64):
+            t = t.astype("datetime64[ns]").astype(np.int64)
+        t = t.astype(float)
+        span = t[next_rows] - t[prev_rows]
+        weight = np.divide(t[rows] - t[prev_rows], span, out=np.full(len(rows), 0.5), where=span != 0)
+    values[rows, cols] = before + weight * (after - before)
+    return values
+
+def column_policy(name, policies=None):
+    """The fill policy for a column: an exact name first, then the first matching pattern, then "default"."""
+    if policies is None:
+        policies = config.get("column_policies") or {}
+    key = str(name).strip().lower()
+    for pattern, policy in policies.items():
+        if pattern.lower() == key:
+            return policy
+    for pattern, policy in policies.items():
+        if pattern != "default" and fnmatch(key, pattern.lower()):
+            return policy
+    return policies.get("default", "interpolate")
+
+def value_columns(df):
+    """Every column besides the timestamp that holds numbers."""
+    return [name for name in df.columns
+            if name != 'timestamp' and (pd.api.types.is_numeric_dtype(df[name])
+                                        or pd.to_numeric(df[name], errors='coerce').notna().any())]
+
+def fill_columns(values, mask, names, method="midpoint", timestamps=None, max_gap=None, policies=None):
+    """
+    Fill the gap rows of a 2-D array with one column per name, following each
+    column's policy. The interpolated columns go through interpolate_gaps
+    together in one pass. mask is 2-D, or 1-D when every column shares it.
+    """
+    values = np.asarray(values, dtype=float)
+    mask = np.asarray(mask, dtype=bool)
+    if mask.ndim == 1:
+        mask = np.broadcast_to(mask[:, None], values.shape)
+    chosen = np.array([column_policy(name, policies) for name in names])
+    unknown = set(chosen) - set(POLICIES)
+    if unknown:
+        raise ValueError(f"unknown column policy {sorted(unknown)}; expected one of {POLICIES}")
+
+    out = values.copy()
+    cols = np.flatnonzero(chosen == "interpolate")
+    if len(cols):
+        out[:, cols] = interpolate_gaps(values[:, cols], mask[:, cols], method, timestamps, max_gap)
+    cols = np.flatnonzero(chosen == "zero")
+    if len(cols):
+        out[:, cols] = np.where(mask[:, cols], 0.0, values[:, cols])
+    cols = np.flatnonzero(chosen == "hold")
+    if len(cols):
+        # Row of the last non-gap value at or before each row
+        positions = np.arange(len(values))[:, None]
+        last = np.maximum.accumulate(np.where(mask[:, cols], -1, positions), axis=0)
+        held = np.take_along_axis(values[:, cols], np.maximum(last, 0), axis=0)
+        out[:, cols] = np.where(mask[:, cols] & (last >= 0), held, values[:, cols])
+    return out
+
+def interpolate_table(table, columns=None, method="midpoint", max_gap=None):
+    """Fill the gaps of every numeric value column (or just columns) in one pass."""
+    print(f"Start: '{table.name}'", flush=True)
+
+    mask = table.gap_mask
+    if mask is not None and mask.any():
+        names = columns or value_columns(table.df)
+        if names:
+            values = table.df[names].to_numpy(dtype=float)
+            timestamps = table.df['timestamp'].to_numpy() if method == "time" else None
+            filled = fill_columns(values, mask, names, method, timestamps, max_gap)
+            for j, name in enumerate(names):
+                table.df[name] = filled[:, j]
+            instrument.count("gaps", int(mask.sum()))
+            instrument.count("cells", int(mask.sum()) * len(names))
+
+    # Point the output at the 'averaged' folder with the modified file name
+    table.output_dir = AVERAGED_DIR
+    table.output_name = (table.output_name or table.name).replace("time corrected", "averaged")
+    if not table.output_name.startswith("averaged"):
+        table.output_name = f"averaged {table.output_name}"
+
+def make_stage(method="midpoint", max_gap=None):
+    """An interpolation stage with a non-default method or gap limit."""
+    return Stage("interpol", partial(interpolate_table, method=method, max_gap=max_gap))
+
+INTERPOLATE = make_stage()
 
 def main():
+    parser = argparse.ArgumentParser(description="Interpolate the gaps in the 'time corrected' workbooks.")
+    parser.add_argument("--method", choices=METHODS, default="midpoint")
+    parser.add_argument("--max-gap", type=int, default=None,
+                        help="leave gaps longer than this many minutes unfilled")
+    args = parser.parse_args()
+
     print("Conversion start...", flush=True)
-    
-    # Set the directory to the 'time corrected' folder one level up from the script's directory
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    parent_dir = os.path.dirname(script_dir)
-    time_corrected_dir = os.path.join(parent_dir, "time corrected")
 
     # Get all .xlsx files in the 'time corrected' directory
-    file_paths = [os.path.join(time_corrected_dir, f) for f in os.listdir(time_corrected_dir) if f.endswith(".xlsx")]
+    file_paths = list_xlsx(TIME_CORRECTED_DIR)
 
     if file_paths:
         print(f"Files found: {len(file_paths)}", flush=True)
-        # Use ThreadPoolExecutor to process files concurrently
-        with ThreadPoolExecutor() as executor:
-            futures = {executor.submit(process_excel, file_path): file_path for file_path in file_paths}
-
-            for future in as_completed(futures):
-                file_path = futures[future]
-                try:
-                    future.result()
-                except Exception as e:
-                    print(f"Error: '{file_path}': {e}", flush=True)
+        run_pipeline(file_paths, [make_stage(args.method, args.max_gap)])
     else:
         print("No files found", flush=True)
 
@@ -0,0 +1,132 @@
+"""
+Per-file stage manifest for resumable, incremental runs.
+
+Two things are recorded against the SHA-256 of each input file:
+  - stage_runs: which stages have already made their changes outside the
+    table (renaming the file, appending the gap log), so a rerun never
+    repeats them;
+  - outputs: which file a given chain of stages wrote, so a rerun skips
+    inputs whose output is still on disk.
+
+A changed file has a new hash and is processed again from scratch.
+
+    python manifest.py show
+    python manifest.py reset [--stage NAME]
+"""
+
+import argparse
+import os
+import time
+
+from db import DB_PATH, connect
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stage_runs (
+    input_hash   TEXT NOT NULL,
+    stage        TEXT NOT NULL,
+    input_path   TEXT,
+    completed_at TEXT,
+    PRIMARY KEY (input_hash, stage)
+);
+CREATE TABLE IF NOT EXISTS outputs (
+    input_hash   TEXT NOT NULL,
+    chain        TEXT NOT NULL,
+    input_path   TEXT,
+    output_path  TEXT,
+    completed_at TEXT,
+    PRIMARY KEY (input_hash, chain)
+);
+"""
+
+
+def enabled():
+    return os.environ.get("SJV_MANIFEST", "1") != "0"
+
+
+def chain_name(stages):
+    return " -> ".join(stage.name for stage in stages)
+
+
+def _now():
+    return time.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def completed_stages(input_hash):
+    """Names of the stages whose side effects already ran for this input."""
+    with connect(SCHEMA) as conn:
+        rows = conn.execute("SELECT stage FROM stage_runs WHERE input_hash = ?", (input_hash,))
+        return {stage for (stage,) in rows}
+
+
+def is_up_to_date(input_hash, chain):
+    """True when this chain already wrote an output for the input and it still exists."""
+    with connect(SCHEMA) as conn:
+        row = conn.execute("SELECT output_path FROM outputs WHERE input_hash = ? AND chain = ?",
+                           (input_hash, chain)).fetchone()
+    return row is not None and row[0] is not None and os.path.exists(row[0])
+
+
+def record_stage(input_hash, stage, input_path):
+    with connect(SCHEMA) as conn:
+        conn.execute("INSERT OR REPLACE INTO stage_runs VALUES (?, ?, ?, ?)",
+                     (input_hash, stage, input_path, _now()))
+
+
+def record_output(input_hash, chain, input_path, output_path):
+    with connect(SCHEMA) as conn:
+        conn.execute("INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?, ?)",
+                     (input_hash, chain, input_path, output_path, _now()))
+
+
+def move_output(old_path, new_path):
+    """Follow an output file that a routing script moved into a site folder."""
+    move_outputs([(old_path, new_path)])
+
+
+def move_outputs(moves):
+    """Follow many (old path, new path) output moves in one transaction."""
+    with connect(SCHEMA) as conn:
+        conn.executemany("UPDATE outputs SET output_path = ? WHERE output_path = ?",
+                         [(os.path.abspath(new), os.path.abspath(old)) for old, new in moves])
+
+
+def show():
+    with connect(SCHEMA) as conn:
+        stages = conn.execute("SELECT stage, COUNT(*) FROM stage_runs GROUP BY stage ORDER BY stage").fetchall()
+        chains = conn.execute("SELECT chain, COUNT(*) FROM outputs GROUP BY chain ORDER BY chain").fetchall()
+    print(f"Manifest: {DB_PATH}")
+    print("Stages completed:")
+    for stage, count in stages:
+        print(f"  {stage}: {count} files")
+    print("Outputs written:")
+    for chain, count in chains:
+        print(f"  {chain}: {count} files")
+
+
+def reset(stage=None):
+    with connect(SCHEMA) as conn:
+        if stage is None:
+            conn.execute("DELETE FROM stage_runs")
+            conn.execute("DELETE FROM outputs")
+        else:
+            conn.execute("DELETE FROM stage_runs WHERE stage = ?", (stage,))
+            conn.execute("DELETE FROM outputs WHERE chain LIKE ?", (f"%{stage}%",))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or reset the pipeline manifest.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("show", help="summarise completed stages and outputs")
+    reset_parser = commands.add_parser("reset", help="forget completed work so it runs again")
+    reset_parser.add_argument("--stage", help="only forget this stage")
+    args = parser.parse_args(argv)
+
+    if args.command == "show":
+        show()
+    else:
+        reset(args.stage)
+        print("Manifest reset.")
+
+
+if __name__ == "__main__":
+    main()
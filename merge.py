@@ -0,0 +1,291 @@
+"""
+Wide per-site tables on one shared minute index.
+
+A site folder holds one export per sensor (Air_Intake_Sensor, Power,
+Volume_total, energy_rate, ...) for the same period. Instead of building a
+separate minute grid, gap mask and interpolation for each of them, this
+stage places every sensor of a site and period on one timestamp index:
+
+  - the files are grouped by site and period (from the catalog, or from the
+    workbook itself the first time it is seen);
+  - each group becomes one wide table with a value column per sensor and a
+    two-dimensional gap mask, and interpolation runs over all columns in
+    one vectorized pass;
+  - the wide table is kept in ../merged as a columnar file, and the usual
+    per-file "averaged" workbooks, gap records, day counts and rollups are
+    sliced from it, so they match what the per-file pipeline writes.
+
+    python merge.py [--workers N] [--force] [--duplicates AGG] [--method M] [--max-gap N]
+    python pipeline.py --merge
+"""
+
+import argparse
+import os
+import time
+import traceback
+from functools import partial
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+
+import cache
+import catalog
+import events
+import instrument
+import manifest
+from executor import run_ordered
+from interpol import METHODS, fill_columns, value_columns
+from missing import AGGREGATIONS, log_missing, regularize
+from pipeline import AVERAGED_DIR, BASE_DIR, ORIGINAL_DIR, Table, list_xlsx, load_table
+from rename import RENAME, table_meta
+from rollup import ROLLUP
+from validate import count_timestamps_per_day
+from writer import MASK_COLUMN, write_table
+
+MERGED_DIR = os.path.join(BASE_DIR, "merged")
+
+# Manifest chain name for outputs sliced from a merged table
+CHAIN = "merge"
+
+
+def _date(value):
+    return str(value)[:10] if value is not None else None
+
+
+def describe(file_path):
+    """(file_path, site, first date, last date) used to group the file with its site and period."""
+    entry = catalog.lookup(file_path)
+    if entry is None:
+        table = load_table(file_path)
+        entry = table_meta(table)
+    return file_path, entry["site"], _date(entry["first_ts"]), _date(entry["last_ts"])
+
+
+def describe_safely(file_path):
+    try:
+        return describe(file_path)
+    except Exception as e:
+        print(f"Error reading '{os.path.basename(file_path)}': {e}", flush=True)
+        return file_path, None, None, None
+
+
+def group_files(file_paths, workers=None):
+    """Lists of files that share a site and period; files without a site stay on their own."""
+    groups = {}
+    for file_path, site, first, last in run_ordered(describe_safely, file_paths, workers):
+        key = (site, first, last) if site else (file_path,)
+        groups.setdefault(key, []).append(file_path)
+    return list(groups.values())
+
+
+def merge_tables(tables, agg="first", freq="min"):
+    """
+    Align the value columns of every table on one shared grid.
+
+    Returns the wide frame (timestamp plus every value column of every
+    table, renamed where two sensors share a name), a gap mask with one
+    column per value column, and for each table the (first, last) row of
+    its own extent and the wide column names it contributed. Rows outside a
+    table's extent are not gaps of that table, only absent.
+    """
+    step = to_offset(freq).nanos
+    extents_ns = []
+    for table in tables:
+        ns = pd.to_datetime(table.df['timestamp']).dropna().to_numpy().astype('datetime64[ns]').astype(np.int64)
+        extents_ns.append((ns.min(), ns.max()))
+    start = min(lo for lo, _ in extents_ns)
+    start -= start % step
+    size = int((max(hi for _, hi in extents_ns) - start) // step) + 1
+
+    columns = {'timestamp': (start + np.arange(size, dtype=np.int64) * step).astype('datetime64[ns]')}
+    masks = []
+    spans = []
+    for table, (lo_ns, hi_ns) in zip(tables, extents_ns):
+        names = value_columns(table.df)
+        frame, absent, duplicates = regularize(table.df[['timestamp', *names]], agg, freq, start=start, size=size)
+        if duplicates:
+            print(f"Collapsed {duplicates} duplicate timestamps in '{table.name}' ({agg})", flush=True)
+        lo, hi = int((lo_ns - start) // step), int((hi_ns - start) // step)
+        gaps = np.zeros(size, dtype=bool)
+        gaps[lo:hi + 1] = absent[lo:hi + 1]
+
+        wide_names = []
+        for name in names:
+            unique = str(name)
+            suffix = 2
+            while unique in columns:
+                unique = f"{name} ({suffix})"
+                suffix += 1
+            columns[unique] = frame[name].to_numpy()
+            masks.append(gaps)
+            wide_names.append(unique)
+        spans.append((lo, hi, wide_names))
+
+    mask = np.column_stack(masks) if masks else np.zeros((size, 0), dtype=bool)
+    return pd.DataFrame(columns), mask, spans
+
+
+def split_table(wide, mask, spans, tables):
+    """Per-file tables sliced from the wide table, one per input table."""
+    derived = []
+    for table, (lo, hi, wide_names) in zip(tables, spans):
+        df = pd.DataFrame({'timestamp': wide['timestamp'].to_numpy()[lo:hi + 1]})
+        for name, wide_name in zip(value_columns(table.df), wide_names):
+            df[name] = wide[wide_name].to_numpy()[lo:hi + 1]
+        first = wide.columns.get_loc(wide_names[0]) - 1 if wide_names else None
+        gap_mask = mask[lo:hi + 1, first].copy() if first is not None else np.zeros(len(df), dtype=bool)
+        out = Table(table.path, [], df, gap_mask, table.source_hash)
+        out.source_path = table.source_path
+        out.meta = table.meta
+        out.missing = pd.DatetimeIndex(df['timestamp'].to_numpy()[out.gap_mask])
+        out.output_dir = AVERAGED_DIR
+        out.output_name = f"averaged {table.name}"
+        derived.append(out)
+    return derived
+
+
+def merged_path(tables):
+    """Base path (without extension) of the wide table for a group."""
+    meta = tables[0].meta or table_meta(tables[0])
+    site = meta.get("site") or os.path.splitext(tables[0].name)[0]
+    return os.path.join(MERGED_DIR, f"{site} {_date(meta.get('first_ts'))} {_date(meta.get('last_ts'))}")
+
+
+def save_wide(wide, mask, base_path):
+    """Store the wide table with one "<column> imputed" flag column per sensor."""
+    frame = wide.copy()
+    for j, name in enumerate(wide.columns[1:]):
+        frame[f"{name} {MASK_COLUMN}"] = mask[:, j]
+    return cache.write_frame(base_path, frame)
+
+
+def process_group(file_paths, agg="first", method="midpoint", max_gap=None, resume=True):
+    """
+    Load, rename and merge one site's files, interpolate them together, and
+    write the per-file outputs. Returns the number of files written.
+
+    The wide table is always built from every file of the group, so the
+    merged file stays whole; the manifest only decides which per-file
+    outputs are rewritten, and a group that is entirely up to date is
+    skipped without loading it.
+    """
+    start = time.perf_counter()
+    label = os.path.basename(file_paths[0]) if len(file_paths) == 1 else f"{len(file_paths)} files"
+    stage_name = "load"
+    try:
+        hashes = [cache.file_hash(file_path) for file_path in file_paths]
+        current = [resume and manifest.is_up_to_date(input_hash, CHAIN) for input_hash in hashes]
+        if all(current):
+            for file_path in file_paths:
+                print(f"Up to date: '{os.path.basename(file_path)}'", flush=True)
+                events.emit("file", file=os.path.basename(file_path), status="skipped",
+                            elapsed=time.perf_counter() - start)
+            return 0
+
+        tables, logged = [], []
+        for file_path, input_hash in zip(file_paths, hashes):
+            table = load_table(file_path, file_hash=input_hash)
+            done = manifest.completed_stages(input_hash) if resume else set()
+            RENAME(table, commit="rename" not in done)
+            if "rename" not in done:
+                manifest.record_stage(input_hash, "rename", file_path)
+            if not table.meta:
+                table.meta = table_meta(table)
+            tables.append(table)
+            logged.append("missing" in done)
+
+        stage_name = "merge"
+        stage_start = time.perf_counter()
+        label = os.path.basename(merged_path(tables))
+        print(f"Merging {len(tables)} sensors for '{label}'", flush=True)
+        with instrument.span("merge", cat="compute", file=label):
+            wide, mask, spans = merge_tables(tables, agg)
+            instrument.count("rows", len(wide))
+            instrument.count("gaps", int(mask.sum()))
+        print(f"Found {int(mask.sum())} missing values across {mask.shape[1]} columns", flush=True)
+        events.emit("stage", file=label, stage="merge", rows=len(wide), gaps=int(mask.sum()),
+                    elapsed=time.perf_counter() - stage_start)
+
+        stage_name = "interpol"
+        stage_start = time.perf_counter()
+        names = list(wide.columns[1:])
+        timestamps = wide['timestamp'].to_numpy() if method == "time" else None
+        with instrument.span("interpol", cat="compute", file=label):
+            filled = fill_columns(wide[names].to_numpy(dtype=float), mask, names, method, timestamps, max_gap)
+            instrument.count("rows", len(wide))
+            instrument.count("cells", int(mask.sum()))
+        for j, name in enumerate(names):
+            wide[name] = filled[:, j]
+        saved = save_wide(wide, mask, merged_path(tables))
+        print(f"Saved: '{saved}'", flush=True)
+        events.emit("stage", file=label, stage="interpol", rows=len(wide), gaps=int(mask.sum()),
+                    elapsed=time.perf_counter() - stage_start)
+
+        stage_name = "write"
+        written = 0
+        for table, input_hash, was_logged, up_to_date in zip(split_table(wide, mask, spans, tables), hashes,
+                                                             logged, current):
+            file_start = time.perf_counter()
+            if up_to_date:
+                print(f"Up to date: '{table.name}'", flush=True)
+                events.emit("file", file=table.name, status="skipped", elapsed=time.perf_counter() - file_start)
+                continue
+            if not was_logged:
+                log_missing(table)
+                manifest.record_stage(input_hash, "missing", table.path)
+            count_timestamps_per_day(table)
+            ROLLUP(table)
+            write_table(table, table.output_path)
+            manifest.record_output(input_hash, CHAIN, table.path, table.output_path)
+            print(f"Saved: '{table.output_path}'", flush=True)
+            events.emit("file", file=table.name, status="done", output=table.output_path,
+                        rows=len(table.df), gaps=int(table.gap_mask.sum()),
+                        elapsed=time.perf_counter() - file_start)
+            written += 1
+        print(f"Done: '{label}' in {time.perf_counter() - start:.1f}s\n", flush=True)
+        return written
+    except Exception as e:
+        print(f"Error processing '{label}': {e}", flush=True)
+        events.emit("error", file=label, stage=stage_name, message=str(e), traceback=traceback.format_exc())
+        events.emit("file", file=label, status="error", elapsed=time.perf_counter() - start)
+        return 0
+
+
+def run_merge(file_paths, workers=None, agg="first", method="midpoint", max_gap=None, resume=None):
+    """Group the files by site and period and process each group, groups side by side."""
+    if resume is None:
+        resume = manifest.enabled()
+    groups = group_files(file_paths, workers)
+    print(f"Stages: rename -> merge -> interpol -> validate -> rollup ({len(groups)} site groups)", flush=True)
+    events.emit("batch", files=len(file_paths), stages=["rename", "merge", "interpol", "validate", "rollup"],
+                workers=workers)
+    work = partial(process_group, agg=agg, method=method, max_gap=max_gap, resume=resume)
+    return run_ordered(work, groups, workers)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Merge each site's sensors on one minute index and process them together.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes (default: $SJV_WORKERS or the CPU count)")
+    parser.add_argument("--force", action="store_true",
+                        help="ignore the manifest and reprocess every file")
+    parser.add_argument("--duplicates", choices=AGGREGATIONS, default="first",
+                        help="how to collapse repeated timestamps")
+    parser.add_argument("--method", choices=METHODS, default="midpoint")
+    parser.add_argument("--max-gap", type=int, default=None,
+                        help="leave gaps longer than this many minutes unfilled")
+    args = parser.parse_args(argv)
+
+    file_paths = list_xlsx(ORIGINAL_DIR)
+    if not file_paths:
+        print("No .xlsx files found", flush=True)
+        return
+    print(f"Found {len(file_paths)} .xlsx files to process.\n", flush=True)
+    run_merge(file_paths, args.workers, args.duplicates, args.method, args.max_gap,
+              resume=False if args.force else None)
+    print("All files processed.", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,111 +1,143 @@
+import argparse
+from functools import partial
+
+import numpy as np
 import pandas as pd
-from openpyxl import load_workbook
-from openpyxl.styles import PatternFill
-import os
-
-# Define the function to process each file
-def process_file(file_path):
-    print(f"Start: '{os.path.basename(file_path)}'", flush=True)
-    
-    try:
-        # Load the original data starting from row 2 (pandas uses zero-indexing, so header=1)
-        print("Loading data...", flush=True)
-        df = pd.read_excel(file_path, header=0)  # Use the 2nd row as header
-
-        # Load the top 1 row separately (assumed to be title or header information)
-        print("Loading top row...", flush=True)
-        top_rows = pd.read_excel(file_path, nrows=1, header=None)
-
-        # Convert the timestamp column to datetime format
-        print("Converting timestamps...", flush=True)
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-
-        # Create a complete timestamp range with the same frequency as in the data
-        print("Creating complete timestamp range...", flush=True)
-        start_time = df['timestamp'].min()
-        end_time = df['timestamp'].max()
-        all_timestamps = pd.date_range(start=start_time, end=end_time, freq='T')  # Assuming frequency is 1 minute
-
-        # Find missing timestamps
-        print("Finding missing timestamps...", flush=True)
-        missing_timestamps = all_timestamps.difference(df['timestamp'])
-
-        # Create a DataFrame for missing timestamps
-        print("Creating DataFrame for missing timestamps...", flush=True)
-        missing_df = pd.DataFrame(missing_timestamps, columns=['timestamp'])
-        missing_df['energy rate'] = 0  # Add the same column as in the original data
-
-        # Combine the original and missing data
-        print("Combining original and missing data...", flush=True)
-        combined_df = pd.concat([df, missing_df]).sort_values(by='timestamp').reset_index(drop=True)
-
-        # Ensure the output directory exists
-        print("Ensuring output directory exists...", flush=True)
-        input_dir, input_file = os.path.split(file_path)
-        parent_dir = os.path.dirname(input_dir)
-        output_dir = os.path.join(parent_dir, "time corrected")
-        os.makedirs(output_dir, exist_ok=True)
-
-        # Generate the output file path
-        print("Generating output file path...", flush=True)
-        output_file_name = f"time corrected {input_file}"
-        output_file_path = os.path.join(output_dir, output_file_name)
-
-        # Save the combined data back to an Excel file
-        print("Saving combined data to Excel...", flush=True)
-        with pd.ExcelWriter(output_file_path, engine='openpyxl') as writer:
-            top_rows.to_excel(writer, index=False, header=False)
-            # Write combined data starting from row 2 (row index 1 in Excel) to preserve the top row
-            combined_df.to_excel(writer, startrow=0, index=False)
-        print(f"Saved: '{os.path.basename(output_file_path)}'", flush=True)
-
-        # Load the workbook and select the active worksheet
-        print("Loading workbook for highlighting...", flush=True)
-        wb = load_workbook(output_file_path)
-        ws = wb.active
-
-        # Define a red fill
-        red_fill = PatternFill(start_color="FFFF0000", end_color="FFFF0000", fill_type="solid")
-
-        # Get the max column once
-        max_column = ws.max_column
-
-        # Highlight the new rows in red
-        print("Highlighting new rows in red...", flush=True)
-        # Since the top row occupies the first row, the data starts on row 2, so add an offset of 1.
-        for index, row in combined_df.iterrows():
-            if row['timestamp'] in missing_timestamps:
-                row_idx = index + 2  # Adjusting for the top row
-                for col_idx in range(1, max_column + 1):
-                    ws.cell(row=row_idx, column=col_idx).fill = red_fill
-
-        # Save the workbook with highlighted rows
-        print("Saving highlighted workbook...", flush=True)
-        wb.save(output_file_path)
-
-        # Log the missing timestamps
-        print("Logging missing timestamps...", flush=True)
-        log_file_path = os.path.join(output_dir, "timestamp_log.csv")
-        log_exists = os.path.isfile(log_file_path)
-
-        with open(log_file_path, 'a') as log_file:
-            if not log_exists:
-                log_file.write("File Name, Missing Timestamps Count, Missing Timestamps\n")
-            log_file.write(f"{input_file}, {len(missing_timestamps)}, {'; '.join(missing_timestamps.astype(str))}\n")
-
-        print(f"Log updated: '{os.path.basename(log_file_path)}'", flush=True)
-    
-    except Exception as e:
-        print(f"Error processing '{os.path.basename(file_path)}': {e}", flush=True)
-
-# Automatically find all .xlsx files in the "original" folder
-print("Finding all .xlsx files in the 'original' folder...", flush=True)
-current_dir = os.path.dirname(os.path.abspath(__file__))
-original_folder = os.path.join(os.path.dirname(current_dir), "original")
-file_paths = [os.path.join(original_folder, f) for f in os.listdir(original_folder) if f.endswith('.xlsx')]
-
-# Process files one at a time
-for file_path in file_paths:
-    process_file(file_path)
-
-print("All files processed.", flush=True)
+from pandas.tseries.frequencies import to_offset
+
+import catalog
+import gaplog
+import instrument
+from pipeline import ORIGINAL_DIR, TIME_CORRECTED_DIR, Stage, list_xlsx, run_pipeline
+
+# Ways to collapse repeated timestamps (e.g. the PDT fall-back hour) into one row
+AGGREGATIONS = ("first", "last", "mean", "min", "max", "sum")
+
+def regularize(df, agg="first", freq="min", start=None, size=None):
+    """
+    Align df onto a regular timestamp grid in linear time.
+
+    Every row is placed by its integer offset from the first grid point, so
+    there is no concat or sort; each output column is allocated once. Rows
+    that land on the same grid point are collapsed with agg. Returns the
+    regular frame, a boolean gap mask (True where the grid had no data) and
+    the number of duplicate rows that were collapsed.
+
+    The grid runs from the first to the last timestamp of df unless start
+    (nanoseconds since the epoch, on the grid) and size are given, as when
+    several sensors share one index (see merge.py); rows outside it are
+    dropped.
+    """
+    if agg not in AGGREGATIONS:
+        raise ValueError(f"unknown duplicate aggregation {agg!r}; expected one of {AGGREGATIONS}")
+
+    timestamps = pd.to_datetime(df['timestamp'])
+    valid = timestamps.notna().to_numpy().copy()
+    ns = timestamps.to_numpy()[valid].astype('datetime64[ns]').astype(np.int64)
+    if len(ns) == 0:
+        return df.iloc[:0].copy(), np.zeros(0, dtype=bool), 0
+
+    # Integer grid offset of every row
+    step = to_offset(freq).nanos
+    if start is None:
+        start = ns.min() - ns.min() % step
+    offsets = (ns - start) // step
+    if size is None:
+        size = int(offsets.max()) + 1
+    inside = (offsets >= 0) & (offsets < size)
+    if not inside.all():
+        offsets = offsets[inside]
+        valid[valid] = inside
+
+    present = np.zeros(size, dtype=bool)
+    present[offsets] = True
+    duplicates = len(offsets) - int(present.sum())
+
+    # Row that supplies the value at each grid point for first/last
+    if agg in ("first", "last"):
+        order = np.arange(len(offsets))
+        pick = np.full(size, len(offsets) if agg == "first" else -1)
+        (np.minimum if agg == "first" else np.maximum).at(pick, offsets, order)
+        pick = pick[present]
+
+    columns = {'timestamp': (start + np.arange(size, dtype=np.int64) * step).astype('datetime64[ns]')}
+    for name in df.columns:
+        if name == 'timestamp':
+            continue
+        values = df[name].to_numpy()[valid]
+        if agg in ("first", "last"):
+            if values.dtype.kind in "biuf":
+                out = np.full(size, np.nan)
+            else:
+                out = np.full(size, None, dtype=object)
+            out[present] = values[pick]
+        else:
+            values = pd.to_numeric(values, errors='coerce').astype(float)
+            if agg in ("mean", "sum"):
+                seen = ~np.isnan(values)
+                sums = np.bincount(offsets, weights=np.where(seen, values, 0.0), minlength=size)
+                counts = np.bincount(offsets, weights=seen, minlength=size)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    out = np.where(counts > 0, sums / counts if agg == "mean" else sums, np.nan)
+            else:
+                out = np.full(size, np.nan)
+                (np.fmin if agg == "min" else np.fmax).at(out, offsets, values)
+        columns[name] = out
+
+    return pd.DataFrame(columns), ~present, duplicates
+
+# Define the stage function applied to each table
+def fill_missing(table, agg="first"):
+    print(f"Start: '{table.name}'", flush=True)
+
+    # Place every row on the one-minute grid, collapsing repeated timestamps
+    print("Aligning timestamps to the minute grid...", flush=True)
+    combined_df, gap_mask, duplicates = regularize(table.df, agg)
+    if duplicates:
+        print(f"Collapsed {duplicates} duplicate timestamps ({agg})", flush=True)
+
+    # Find missing timestamps
+    missing_timestamps = pd.DatetimeIndex(combined_df['timestamp'].to_numpy()[gap_mask])
+    print(f"Found {len(missing_timestamps)} missing timestamps", flush=True)
+
+    # Flag the new rows; they are left blank here and filled per column by
+    # the interpolation stage, and highlighted in red when the table is written
+    table.df = combined_df
+    table.gap_mask = gap_mask
+    table.missing = missing_timestamps
+    instrument.count("gaps", len(missing_timestamps))
+    instrument.count("duplicates", duplicates)
+
+    # Point the output at the "time corrected" folder
+    table.output_dir = TIME_CORRECTED_DIR
+    table.output_name = f"time corrected {table.name}"
+
+def log_missing(table):
+    """Commit step: record the file's gaps as intervals in the gap log store."""
+    print("Logging missing timestamps...", flush=True)
+    site = table.meta.get('site') or catalog.site_from(table.name)
+    sensor = table.df.columns[1] if len(table.df.columns) > 1 else None
+    gap_intervals = gaplog.intervals(table.df['timestamp'].to_numpy(), table.gap_mask)
+    gaplog.record(table.name, site, sensor, gap_intervals)
+    print(f"Log updated: {len(table.missing)} missing timestamps in {len(gap_intervals)} gaps", flush=True)
+
+def make_stage(agg="first"):
+    """A gap-detection stage with a non-default duplicate aggregation."""
+    return Stage("missing", partial(fill_missing, agg=agg), log_missing)
+
+MISSING = make_stage()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Insert rows for missing minutes in the 'original' workbooks.")
+    parser.add_argument("--duplicates", choices=AGGREGATIONS, default="first",
+                        help="how to collapse repeated timestamps")
+    args = parser.parse_args()
+
+    # Automatically find all .xlsx files in the "original" folder
+    print("Finding all .xlsx files in the 'original' folder...", flush=True)
+    file_paths = list_xlsx(ORIGINAL_DIR)
+
+    # Process the files in the shared worker pool
+    run_pipeline(file_paths, [make_stage(args.duplicates)])
+
+    print("All files processed.", flush=True)
@@ -0,0 +1,336 @@
+"""
+In-process pipeline engine for the sensor exports.
+
+Each .xlsx file is parsed once into a Table, handed through the stage
+functions in memory (rename -> missing -> interpol -> validate -> rollup),
+and written once at the end to wherever the last stage pointed it.
+
+Run directly to process every export in the "original" folder:
+
+    python pipeline.py
+"""
+
+import argparse
+import os
+import time
+import traceback
+from functools import partial
+
+import pandas as pd
+from openpyxl import load_workbook
+
+import cache
+import events
+import instrument
+import manifest
+from executor import default_workers, run_ordered
+from writer import MASK_COLUMN, write_table
+
+# Folder layout: the data folders live one level up from the scripts
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = os.path.dirname(SCRIPT_DIR)
+ORIGINAL_DIR = os.path.join(BASE_DIR, "original")
+TIME_CORRECTED_DIR = os.path.join(BASE_DIR, "time corrected")
+AVERAGED_DIR = os.path.join(BASE_DIR, "averaged")
+
+
+class Table:
+    """
+    One sensor export held in memory while it moves through the stages.
+
+    path and name follow the file through renames; source_path and
+    source_hash identify the file the table was loaded from. header_rows
+    holds the metadata rows above the "timestamp" header of a raw export
+    (empty once they have been stripped), df holds the timestamp and value
+    columns, gap_mask flags rows that were inserted for missing timestamps,
+    and meta holds the catalog metadata gathered by the rename stage.
+    Stages set output_dir/output_name to choose where the table is written
+    when the run finishes, and rollups holds the 15-minute, hourly and daily
+    aggregates once the rollup stage has run.
+    """
+
+    def __init__(self, path, header_rows, df, gap_mask=None, source_hash=None):
+        self.path = path
+        self.source_path = path
+        self.source_hash = source_hash
+        self.name = os.path.basename(path)
+        self.header_rows = header_rows
+        self.df = df
+        self.gap_mask = gap_mask
+        self.meta = {}
+        self.missing = pd.DatetimeIndex([])
+        self.day_counts = None
+        self.rollups = None
+        self.output_dir = None
+        self.output_name = None
+
+    @property
+    def output_path(self):
+        if self.output_dir is None:
+            return None
+        return os.path.join(self.output_dir, self.output_name or self.name)
+
+
+class Stage:
+    """
+    A named step of the pipeline.
+
+    func(table) transforms the table in memory. The optional commit(table)
+    makes the stage's changes outside the table (renaming the source file,
+    appending to a log); the engine skips it when the manifest shows the
+    stage already ran for this input, so resumed runs never repeat it.
+    """
+
+    def __init__(self, name, func, commit=None):
+        self.name = name
+        self.func = func
+        self.commit = commit
+
+    def __call__(self, table, commit=True):
+        with instrument.span(self.name, cat="compute", file=table.name):
+            self.func(table)
+            if table.df is not None:
+                instrument.count("rows", len(table.df))
+        if commit and self.commit is not None:
+            with instrument.span(f"{self.name} commit", cat="commit", file=table.name):
+                self.commit(table)
+
+    def __repr__(self):
+        return f"Stage({self.name!r})"
+
+
+def load_table(file_path, use_cache=None, file_hash=None):
+    """
+    Parse a workbook once into a Table with a values-only reader.
+
+    Raw exports carry metadata rows above the "timestamp" header; those are
+    kept on the table for the rename stage. The gap mask written by an
+    earlier run is read back from the hidden "imputed" column. Parsed
+    workbooks are kept in the content-hash cache (see cache.py), so a file
+    that has been seen before is read from its columnar copy instead.
+    """
+    with instrument.span("parse", cat="parse", file=os.path.basename(file_path)):
+        table = _load_table(file_path, use_cache, file_hash)
+        instrument.count("rows", len(table.df))
+        instrument.count("cells", table.df.size)
+    return table
+
+
+def _is_header(values):
+    first = values[0] if values else None
+    return isinstance(first, str) and first.strip().lower() == "timestamp"
+
+
+def _trimmed(values):
+    values = list(values)
+    while values and values[-1] is None:
+        values.pop()
+    return values
+
+
+def sheet_rows(wb):
+    """
+    The rows of a workbook read as one sheet: every row of the first sheet
+    with a "timestamp" header, then the data rows of each later sheet under
+    the same header, where the writer continues outputs longer than one
+    sheet (see writer.py). Other sheets are left out.
+    """
+    columns = None
+    for ws in wb.worksheets:
+        rows = ws.iter_rows(values_only=True)
+        above = []
+        header = None
+        for values in rows:
+            if _is_header(values):
+                header = values
+                break
+            above.append(values)
+        if header is None:
+            continue
+        if columns is None:
+            columns = _trimmed(header)
+            yield from above
+            yield header
+        elif _trimmed(header) != columns:
+            continue
+        yield from rows
+
+
+def _load_table(file_path, use_cache, file_hash):
+    if use_cache is None:
+        use_cache = cache.enabled()
+    key = file_hash
+    if use_cache:
+        key = key or cache.file_hash(file_path)
+        hit = cache.get(key)
+        if hit is not None:
+            instrument.count("cache_hits")
+            return Table(file_path, *hit, source_hash=key)
+
+    wb = load_workbook(file_path, read_only=True)
+
+    header_rows = []
+    columns = None
+    records = []
+    for values in sheet_rows(wb):
+        if columns is None:
+            if _is_header(values):
+                columns = list(values)
+            else:
+                header_rows.append(list(values))
+            continue
+        if not values or values[0] is None:
+            continue
+        records.append(values)
+    wb.close()
+
+    if columns is None:
+        raise ValueError("no 'timestamp' header row found")
+
+    df = pd.DataFrame(records, columns=range(len(columns)))
+    # Keep the named columns plus any unnamed column that actually holds data
+    keep = [i for i, name in enumerate(columns)
+            if name is not None or df[i].notna().any()]
+    df = df[keep]
+    df.columns = [columns[i] if columns[i] is not None else f"column {i + 1}" for i in keep]
+    df = df.rename(columns={df.columns[0]: "timestamp"})
+
+    gap_mask = None
+    if MASK_COLUMN in df.columns:
+        gap_mask = (df.pop(MASK_COLUMN).fillna(0).astype(int) == 1).to_numpy()
+
+    if use_cache:
+        try:
+            cache.put(key, header_rows, df, gap_mask)
+        except Exception as e:
+            print(f"Cache write skipped for '{os.path.basename(file_path)}': {e}", flush=True)
+    return Table(file_path, header_rows, df, gap_mask, source_hash=key)
+
+
+def process_file(file_path, stages, keep_data=True, resume=True):
+    """
+    Load one file, run every stage on it, and write the result once.
+
+    With resume, the manifest is consulted first: an input whose output from
+    this chain is already on disk is skipped, and stages that already ran
+    for it are replayed in memory without repeating their commit step.
+    With keep_data False the table's frame is dropped after writing, so only
+    the stage results travel back from a worker process. Progress and
+    failures are reported as "stage", "file" and "error" events.
+    """
+    file_name = os.path.basename(file_path)
+    start = time.perf_counter()
+    stage_name = "load"
+    try:
+        input_hash = cache.file_hash(file_path)
+        chain = manifest.chain_name(stages)
+        done = set()
+        if resume:
+            if manifest.is_up_to_date(input_hash, chain):
+                print(f"Up to date: '{file_name}'", flush=True)
+                events.emit("file", file=file_name, status="skipped", elapsed=time.perf_counter() - start)
+                return None
+            done = manifest.completed_stages(input_hash)
+
+        table = load_table(file_path, file_hash=input_hash)
+        for stage in stages:
+            stage_name = stage.name
+            stage_start = time.perf_counter()
+            stage(table, commit=stage.name not in done)
+            if stage.commit is not None and stage.name not in done:
+                manifest.record_stage(input_hash, stage.name, file_path)
+            events.emit("stage", file=table.name, stage=stage.name, rows=len(table.df),
+                        gaps=_gap_count(table), elapsed=time.perf_counter() - stage_start)
+
+        stage_name = "write"
+        output_path = table.output_path
+        if output_path is not None:
+            write_table(table, output_path)
+            manifest.record_output(input_hash, chain, table.path, output_path)
+            print(f"Saved: '{output_path}'", flush=True)
+        elapsed = time.perf_counter() - start
+        print(f"Done: '{table.name}' in {elapsed:.1f}s\n", flush=True)
+        events.emit("file", file=table.name, status="done", output=output_path,
+                    rows=len(table.df), gaps=_gap_count(table), elapsed=elapsed)
+        if not keep_data:
+            table.df = None
+            table.gap_mask = None
+        return table
+    except Exception as e:
+        print(f"Error processing '{file_name}': {e}", flush=True)
+        events.emit("error", file=file_name, stage=stage_name, message=str(e),
+                    traceback=traceback.format_exc())
+        events.emit("file", file=file_name, status="error", elapsed=time.perf_counter() - start)
+        return None
+
+
+def _gap_count(table):
+    return int(table.gap_mask.sum()) if table.gap_mask is not None else 0
+
+
+def run_pipeline(file_paths, stages, workers=None, max_in_flight=None, resume=None):
+    """
+    Run the stages over every file and return the tables in input order.
+
+    With more than one worker the files go through a process pool (see
+    executor.py) and the tables come back without their data, which has
+    already been written; a single worker keeps everything in this process.
+    Skipped and failed files come back as None. resume defaults to on
+    unless SJV_MANIFEST=0.
+    """
+    if resume is None:
+        resume = manifest.enabled()
+    workers = min(workers or default_workers(), max(len(file_paths), 1))
+    print(f"Stages: {' -> '.join(stage.name for stage in stages)} ({workers} workers)", flush=True)
+    events.emit("batch", files=len(file_paths), stages=[stage.name for stage in stages], workers=workers)
+    work = partial(process_file, stages=stages, keep_data=workers <= 1, resume=resume)
+    return run_ordered(work, file_paths, workers, max_in_flight)
+
+
+def list_xlsx(folder):
+    """All .xlsx files directly inside folder (empty if it does not exist)."""
+    if not os.path.isdir(folder):
+        return []
+    return sorted(os.path.join(folder, f) for f in os.listdir(folder)
+                  if f.lower().endswith(".xlsx") and not f.startswith("~$"))
+
+
+def default_stages():
+    """rename -> missing -> interpol -> validate, as RUN.py used to chain them, then the rollups."""
+    # Imported here because the stage modules import this one
+    from rename import RENAME
+    from missing import MISSING
+    from interpol import INTERPOLATE
+    from validate import VALIDATE
+    from rollup import ROLLUP
+    return [RENAME, MISSING, INTERPOLATE, VALIDATE, ROLLUP]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run every per-file stage on the 'original' folder.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes (default: $SJV_WORKERS or the CPU count)")
+    parser.add_argument("--max-in-flight", type=int, default=None,
+                        help="most workbooks held in memory at once (default: one per worker)")
+    parser.add_argument("--force", action="store_true",
+                        help="ignore the manifest and reprocess every file")
+    parser.add_argument("--merge", action="store_true",
+                        help="process each site's sensors together on one shared index (see merge.py)")
+    args = parser.parse_args()
+
+    file_paths = list_xlsx(ORIGINAL_DIR)
+    if not file_paths:
+        print("No .xlsx files found", flush=True)
+        return
+    print(f"Found {len(file_paths)} .xlsx files to process.\n", flush=True)
+    if args.merge:
+        from merge import run_merge
+        run_merge(file_paths, args.workers, resume=False if args.force else None)
+    else:
+        run_pipeline(file_paths, default_stages(), args.workers, args.max_in_flight,
+                     resume=False if args.force else None)
+    print("All files processed.", flush=True)
+
+
+if __name__ == "__main__":
+    main()
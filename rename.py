@@ -1,80 +1,119 @@
-import openpyxl
 import os
-from concurrent.futures import ThreadPoolExecutor
+
+import catalog
+from executor import run_ordered
+from pipeline import ORIGINAL_DIR, Stage, list_xlsx
 
 def sanitize_filename(filename):
     # Replace invalid characters with underscores
     return filename.replace(':', '_').replace(' ', '_').replace('\\', '_').replace('/', '_')
 
-def process_file(file_path):
+def as_date(value):
+    return value.date() if hasattr(value, 'date') else value
+
+def build_filename(meta):
+    """File name from the B2 location, B5 sensor and the dates of the first and last rows."""
+    return sanitize_filename(
+        f"{meta['location']} {meta['sensor']} {as_date(meta['first_ts'])} {as_date(meta['last_ts'])}.xlsx")
+
+def print_metadata(file_name, meta):
+    # Full debug print statements
+    print(f"Processing File: {file_name}", flush=True)
+    print(f"Extracted Values:", flush=True)
+    print(f"  B2: {meta['location']}", flush=True)
+    print(f"  B5: {meta['sensor']}", flush=True)
+    print(f"  First Value in Column A (after row 5): {as_date(meta['first_ts'])}", flush=True)
+    print(f"  Last Value in Column A (after row 5): {as_date(meta['last_ts'])}", flush=True)
+
+def table_meta(table):
+    """Catalog metadata of a loaded table, from its B2/B5 cells or, once renamed, its file name."""
+    # B2 is the second cell of the second metadata row; B5 is the header of the value column
+    location = table.header_rows[1][1] if len(table.header_rows) > 1 else None
+    timestamps = table.df['timestamp'].dropna()
+    return {
+        "location": location,
+        "site": catalog.site_from(location) or catalog.site_from(table.name),
+        "sensor": table.df.columns[1] if len(table.df.columns) > 1 else None,
+        "first_ts": timestamps.iloc[0] if len(timestamps) else None,
+        "last_ts": timestamps.iloc[-1] if len(timestamps) else None,
+        "rows": len(timestamps),
+        "header_rows": len(table.header_rows),
+    }
+
+def rename_table(table):
+    """
+    Name the table from its B2/B5 metadata and timestamp extent, and drop the
+    metadata rows above the header. The rows are stripped from the in-memory
+    table only; the file itself is moved by rename_file.
+    """
+    if not table.header_rows:
+        print(f"Already renamed: {table.name}", flush=True)
+        return
+
+    table.meta = table_meta(table)
+    print_metadata(table.name, table.meta)
+
+    # Construct the new file name
+    new_filename = build_filename(table.meta)
+    table.path = os.path.join(os.path.dirname(table.path), new_filename)
+    table.name = new_filename
+    table.header_rows = []
+
+def rename_file(table):
+    """Commit step: rename the original file and catalog it under its new name."""
+    if table.source_path != table.path and os.path.exists(table.source_path):
+        os.rename(table.source_path, table.path)
+    print(f"Renamed to: {table.name}", flush=True)
+    if table.meta and os.path.exists(table.path):
+        catalog.forget(table.source_path)
+        catalog.record(table.path, table.meta)
+
+RENAME = Stage("rename", rename_table, rename_file)
+
+def rename_workbook(file_path):
+    """
+    Standalone rename: stream the workbook once, copying the data rows
+    without the metadata rows into a temporary file while collecting the
+    metadata, then move the copy to its new name.
+    """
+    file_name = os.path.basename(file_path)
     try:
-        # Load the workbook and select the active sheet
-        wb = openpyxl.load_workbook(file_path)
-        ws = wb.active
-
-        # Extract values from cells B2 and B5
-        value_b2 = ws['B2'].value
-        value_b5 = ws['B5'].value
-
-        # Extract first and last values in the first column, excluding the first 5 rows
-        first_value = None
-        last_value = None
-        for row in ws.iter_rows(min_row=6, min_col=1, max_col=1):
-            cell_value = row[0].value
-            if cell_value is not None:
-                if first_value is None:
-                    first_value = cell_value.date() if hasattr(cell_value, 'date') else cell_value
-                last_value = cell_value.date() if hasattr(cell_value, 'date') else cell_value
-
-        # Full debug print statements
-        print(f"Processing File: {os.path.basename(file_path)}", flush=True)
-        print(f"Extracted Values:", flush=True)
-        print(f"  B2: {value_b2}", flush=True)
-        print(f"  B5: {value_b5}", flush=True)
-        print(f"  First Value in Column A (after row 5): {first_value}", flush=True)
-        print(f"  Last Value in Column A (after row 5): {last_value}", flush=True)
-
-        # Construct the new file name
+        if not catalog.has_header_rows(file_path):
+            print(f"Already renamed: {file_name}", flush=True)
+            return None
+
         folder_path = os.path.dirname(file_path)
-        new_filename = sanitize_filename(f"{value_b2} {value_b5} {first_value} {last_value}.xlsx")
-        new_file_path = os.path.join(folder_path, new_filename)
+        temp_path = os.path.join(folder_path, f"~$rename {file_name}")
+        try:
+            meta = catalog.scan(file_path, copy_to=temp_path)
+            print_metadata(file_name, meta)
 
-        # Rename the original file
-        os.rename(file_path, new_file_path)
+            new_filename = build_filename(meta)
+            new_file_path = os.path.join(folder_path, new_filename)
+            os.replace(temp_path, new_file_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        if new_file_path != file_path:
+            os.remove(file_path)
         print(f"Renamed to: {new_filename}", flush=True)
 
-        # Now reopen the renamed workbook to delete the top 4 rows
-        wb2 = openpyxl.load_workbook(new_file_path)
-        ws2 = wb2.active
-
-        # Delete rows 1 through 4
-        ws2.delete_rows(1, 4)
-
-        # Save the workbook (overwrite)
-        wb2.save(new_file_path)
+        meta["header_rows"] = 0
+        catalog.forget(file_path)
+        catalog.record(new_file_path, meta)
         print(f"Deleted top 4 rows and saved: {new_filename}\n", flush=True)
+        return new_file_path
 
     except Exception as e:
-        print(f"Error processing {os.path.basename(file_path)}: {e}", flush=True)
-
-def process_files(file_paths):
-    with ThreadPoolExecutor() as executor:
-        executor.map(process_file, file_paths)
+        print(f"Error processing {file_name}: {e}", flush=True)
+        return None
 
 if __name__ == "__main__":
-    # Define the path to the "original" folder
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    original_folder_path = os.path.join(script_dir, '..', 'original')
-
     # Get all .xlsx files in the "original" folder
-    file_paths = [
-        os.path.join(original_folder_path, f)
-        for f in os.listdir(original_folder_path)
-        if f.lower().endswith('.xlsx')
-    ]
+    file_paths = list_xlsx(ORIGINAL_DIR)
 
     if file_paths:
         print(f"Found {len(file_paths)} .xlsx files to process.\n", flush=True)
-        process_files(file_paths)
+        run_ordered(rename_workbook, file_paths)
     else:
         print("No .xlsx files found", flush=True)
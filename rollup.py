@@ -0,0 +1,237 @@
+"""
+15-minute, hourly and daily rollups of the minute data.
+
+Inside the pipeline, ROLLUP runs after validation on the filled minute grid.
+For every value column it computes the mean, min, max and sum of each
+15-minute bin with one reduceat pass over the minute array. It also counts
+the minutes present and how many of them were imputed. The hourly and daily
+bins are then folded from the 15-minute ones, so the minute data is read
+only once. Bins start on local clock boundaries (the timestamps are local
+PDT), and NaN values are left out of every statistic.
+
+The commit step writes one long table per resolution, with the columns
+timestamp, column, minutes, imputed, mean, min, max and sum, to
+../rollups/<resolution>/<site>/<file>.parquet (.npz without pyarrow; see
+cache.write_frame). Dashboards can read them with load() and never open the
+minute-level workbooks. Run as a script, it builds the rollups for
+workbooks that are already averaged (site subfolders included):
+
+    python rollup.py [folder] [--workers N]
+"""
+
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import cache
+import events
+import instrument
+import routing
+from executor import run_ordered
+from interpol import value_columns
+from pipeline import AVERAGED_DIR, BASE_DIR, Stage, load_table
+
+ROLLUP_DIR = os.path.join(BASE_DIR, "rollups")
+
+# Bin width in minutes; each is a multiple of the first, which is computed from the minutes
+RESOLUTIONS = {"15min": 15, "hourly": 60, "daily": 1440}
+COLUMNS = ["timestamp", "column", "minutes", "imputed", "mean", "min", "max", "sum"]
+
+
+def _bin_starts(keys):
+    """Index of the first row of each run of equal keys."""
+    return np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+
+
+def _fold(stats, starts):
+    """Combine consecutive bins of stats into the bins beginning at starts."""
+    return {
+        "minutes": np.add.reduceat(stats["minutes"], starts, axis=0),
+        "valid": np.add.reduceat(stats["valid"], starts, axis=0),
+        "imputed": np.add.reduceat(stats["imputed"], starts, axis=0),
+        "sum": np.add.reduceat(stats["sum"], starts, axis=0),
+        "min": np.fmin.reduceat(stats["min"], starts, axis=0),
+        "max": np.fmax.reduceat(stats["max"], starts, axis=0),
+    }
+
+
+def aggregate(minutes, values, mask=None):
+    """
+    Roll minute data up to every resolution.
+
+    minutes are ascending integer minutes since 1970-01-01, values has one
+    column per value column, and mask flags the imputed rows (1-D, or 2-D
+    per column). Returns {resolution: (bin start minutes, stats)}, where
+    stats maps minutes (rows per bin), imputed, mean, min, max and sum to
+    arrays of shape (bins, columns).
+    """
+    minutes = np.asarray(minutes, dtype=np.int64)
+    values = np.asarray(values, dtype=float)
+    if values.ndim == 1:
+        values = values[:, None]
+    if mask is None:
+        mask = np.zeros(len(values), dtype=bool)
+    mask = np.asarray(mask, dtype=bool)
+    if mask.ndim == 1:
+        mask = np.broadcast_to(mask[:, None], values.shape)
+
+    if not len(minutes):
+        empty = np.empty((0, values.shape[1]))
+        return {name: (np.empty(0, dtype=np.int64), {key: empty for key in ("minutes", "imputed", "mean",
+                                                                          "min", "max", "sum")})
+                for name in RESOLUTIONS}
+
+    base_width = min(RESOLUTIONS.values())
+    keys = minutes // base_width
+    starts = _bin_starts(keys)
+    present = ~np.isnan(values)
+    rows = np.broadcast_to(np.diff(np.r_[starts, len(minutes)])[:, None], (len(starts), values.shape[1]))
+    base = {
+        "minutes": rows,
+        "valid": np.add.reduceat(present.astype(np.int64), starts, axis=0),
+        "imputed": np.add.reduceat(mask.astype(np.int64), starts, axis=0),
+        "sum": np.add.reduceat(np.where(present, values, 0.0), starts, axis=0),
+        "min": np.fmin.reduceat(values, starts, axis=0),
+        "max": np.fmax.reduceat(values, starts, axis=0),
+    }
+    keys = keys[starts]
+
+    results = {}
+    for name, width in RESOLUTIONS.items():
+        if width == base_width:
+            stats, bins = base, keys
+        else:
+            groups = keys * base_width // width
+            group_starts = _bin_starts(groups)
+            stats, bins = _fold(base, group_starts), groups[group_starts]
+        valid = stats["valid"]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(valid > 0, stats["sum"] / valid, np.nan)
+        out = {key: stats[key] for key in ("minutes", "imputed", "min", "max")}
+        out["mean"] = mean
+        out["sum"] = np.where(valid > 0, stats["sum"], np.nan)
+        results[name] = (bins * width, out)
+    return results
+
+
+def rollup_frame(bin_minutes, stats, names):
+    """One resolution's rollups as a long table: a row per bin and value column."""
+    count = len(bin_minutes)
+    timestamps = np.asarray(bin_minutes, dtype=np.int64).astype("datetime64[m]").astype("datetime64[ns]")
+    frame = {
+        "timestamp": np.tile(timestamps, len(names)),
+        "column": np.repeat(np.array(names, dtype=object), count),
+    }
+    for key in ("minutes", "imputed"):
+        frame[key] = np.asarray(stats[key], dtype=np.int64).T.ravel()
+    for key in ("mean", "min", "max", "sum"):
+        frame[key] = np.asarray(stats[key], dtype=float).T.ravel()
+    return pd.DataFrame(frame, columns=COLUMNS)
+
+
+def compute_rollups(table):
+    """Compute the table's rollups at every resolution and keep them on table.rollups."""
+    names = value_columns(table.df)
+    stamps = table.df["timestamp"].to_numpy(dtype="datetime64[ns]")
+    keep = ~np.isnat(stamps)
+    minutes = stamps[keep].astype("datetime64[m]").astype(np.int64)
+    values = table.df[names].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)[keep]
+    mask = table.gap_mask[keep] if table.gap_mask is not None else None
+    if len(minutes) and (np.diff(minutes) < 0).any():
+        order = np.argsort(minutes, kind="stable")
+        minutes, values = minutes[order], values[order]
+        mask = mask[order] if mask is not None else None
+
+    table.rollups = {name: rollup_frame(bins, stats, names)
+                     for name, (bins, stats) in aggregate(minutes, values, mask).items()}
+    instrument.count("bins", sum(len(frame) for frame in table.rollups.values()))
+    print("Rollups: " + ", ".join(f"{len(frame) // max(len(names), 1)} {name}"
+                                  for name, frame in table.rollups.items())
+          + f" bins for {len(names)} columns", flush=True)
+
+
+def rollup_base(table, resolution):
+    """Path without extension of a table's rollups at resolution."""
+    name = table.output_name or table.name
+    if name.lower().startswith("averaged "):
+        name = name[len("averaged "):]
+    site = routing.site_for(name, (table.meta or {}).get("site")) or "unsorted"
+    return os.path.join(ROLLUP_DIR, resolution, site, os.path.splitext(name)[0])
+
+
+def save_rollups(table):
+    """Commit step: write each resolution's rollups to the columnar store."""
+    for resolution, frame in (table.rollups or {}).items():
+        path = cache.write_frame(rollup_base(table, resolution), frame)
+        print(f"Saved rollups: '{path}'", flush=True)
+
+
+ROLLUP = Stage("rollup", compute_rollups, save_rollups)
+
+
+def load(resolution, site=None, column=None, start=None, end=None):
+    """The stored rollups at resolution, optionally for one site and value column and from start to before end."""
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"unknown resolution {resolution!r}; expected one of {tuple(RESOLUTIONS)}")
+    pattern = os.path.join(ROLLUP_DIR, resolution, site or "*", "*")
+    frames = []
+    for path in sorted(glob.glob(pattern)):
+        if not path.endswith(cache.EXTENSIONS):
+            continue
+        _, frame = cache.read_frame(path)
+        frame.insert(0, "site", os.path.basename(os.path.dirname(path)))
+        frames.append(frame)
+    if not frames:
+        return pd.DataFrame(columns=["site", *COLUMNS])
+    frame = pd.concat(frames, ignore_index=True)
+    if column is not None:
+        frame = frame[frame["column"] == column]
+    if start is not None:
+        frame = frame[frame["timestamp"] >= pd.Timestamp(start)]
+    if end is not None:
+        frame = frame[frame["timestamp"] < pd.Timestamp(end)]
+    return frame.reset_index(drop=True)
+
+
+def rollup_file(file_path):
+    """Standalone: build the rollups of one averaged workbook; returns the number of bins written."""
+    file_name = os.path.basename(file_path)
+    start = time.perf_counter()
+    try:
+        table = load_table(file_path)
+        ROLLUP(table)
+    except Exception as e:
+        print(f"Error rolling up '{file_name}': {e}", flush=True)
+        events.emit("error", file=file_name, stage="rollup", message=str(e))
+        events.emit("file", file=file_name, status="error", elapsed=time.perf_counter() - start)
+        return None
+    events.emit("file", file=file_name, status="done", rows=len(table.df),
+                elapsed=time.perf_counter() - start)
+    return sum(len(frame) for frame in table.rollups.values())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the 15-minute, hourly and daily rollups of averaged workbooks.")
+    parser.add_argument("folder", nargs="?", default=AVERAGED_DIR,
+                        help="folder to scan, site subfolders included (default: the averaged folder)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes (default: $SJV_WORKERS or the CPU count)")
+    args = parser.parse_args(argv)
+
+    from validate import list_workbooks
+    file_paths = list_workbooks(args.folder)
+    if not file_paths:
+        print(f"No Excel files found in '{args.folder}'.", flush=True)
+        return
+    events.emit("batch", files=len(file_paths), stages=["rollup"], workers=args.workers)
+    results = run_ordered(rollup_file, file_paths, args.workers)
+    print(f"\nRolled up {sum(1 for r in results if r is not None)} of {len(file_paths)} files "
+          f"({sum(r or 0 for r in results)} bins) into '{ROLLUP_DIR}'", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Site registry and router shared by the folder-routing scripts.
+
+The site codes come from the "sites" list in config.json and are compiled
+into one regular expression, so each file name is classified with a single
+search instead of one test per site. Names match the way the routing
+scripts always matched them: case-insensitive, with the letter O read as a
+zero and an optional "-", "_" or space between a code's letter and its
+digits (D12, d-12 and D_12 all name D12). When a name holds several codes,
+the first one in the name wins.
+
+route_folder() lists a folder once, classifies every loose file in it and
+moves the files into their site subfolders on a few threads. Within one
+file system a move is a rename, so no data is copied; shutil.move copies
+only when the site folder is on another file system.
+"""
+
+import errno
+import os
+import re
+import shutil
+from functools import lru_cache, partial
+
+import catalog
+import config
+import events
+import instrument
+from executor import run_ordered
+
+MOVE_THREADS = 8
+
+_SEPARATORS = str.maketrans("", "", "-_ ")
+
+
+def site_list():
+    return list(config.get("sites"))
+
+
+def normalize(name):
+    """Upper case with O read as a zero, as file names are matched."""
+    return name.upper().replace("O", "0")
+
+
+@lru_cache(maxsize=None)
+def _compile(sites):
+    """The alternation over the site codes, and each normalized code's site."""
+    codes = {normalize(site): site for site in sites}
+    # Longest first, so a code is never cut short by another that is its prefix
+    alternatives = [re.sub(r"(\d+)", r"[-_ ]?\1", re.escape(code))
+                    for code in sorted(codes, key=len, reverse=True)]
+    return re.compile("|".join(alternatives)), codes
+
+
+def classify(name, sites=None):
+    """The site named in name, or None."""
+    pattern, codes = _compile(tuple(sites or site_list()))
+    match = pattern.search(normalize(name))
+    return codes.get(match.group().translate(_SEPARATORS)) if match else None
+
+
+def site_for(name, known=None, sites=None):
+    """known (the catalogued site, say) when it is a registered site, otherwise the site in name."""
+    sites = tuple(sites or site_list())
+    return known if known in sites else classify(name, sites)
+
+
+def plan(folder, extensions=(".xlsx",), use_catalog=False, sites=None):
+    """(file path, site) for each loose file in folder that belongs to a site, from one listing."""
+    sites = tuple(sites or site_list())
+    try:
+        with os.scandir(folder) as entries:
+            files = sorted(entry.path for entry in entries
+                           if entry.is_file() and entry.name.lower().endswith(extensions)
+                           and not entry.name.startswith("~$"))
+    except FileNotFoundError:
+        return []
+    # The site the rename stage read from cell B2 beats the file name
+    catalogued = catalog.lookup_many(files) if use_catalog and files else {}
+    moves = []
+    for path in files:
+        entry = catalogued.get(os.path.abspath(path)) or {}
+        site = site_for(os.path.basename(path), entry.get("site"), sites)
+        if site:
+            moves.append((path, site))
+    return moves
+
+
+def move_file(file_path, folder):
+    """Move file_path into folder and return its new path."""
+    destination = os.path.join(folder, os.path.basename(file_path))
+    try:
+        os.replace(file_path, destination)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(file_path, destination)
+    return destination
+
+
+def _try_move(move, folders):
+    file_path, site = move
+    try:
+        return move_file(file_path, folders[site]), None
+    except OSError as e:
+        return None, e
+
+
+def route_folder(root, stage, create=False, extensions=(".xlsx",), use_catalog=False, sites=None,
+                 workers=MOVE_THREADS):
+    """
+    Move the loose files in root into root/<site> and return the (old path,
+    new path) of every move. With create the site folders are made as
+    needed; otherwise files whose site folder is missing stay where they are.
+    """
+    moves = plan(root, extensions, use_catalog, sites)
+    folders = {}
+    for site in sorted({site for _, site in moves}):
+        folder = os.path.join(root, site)
+        if create:
+            os.makedirs(folder, exist_ok=True)
+        folders[site] = folder if os.path.isdir(folder) else None
+
+    ready = []
+    for file_path, site in moves:
+        if folders[site] is None:
+            print(f"Warning: target folder '{os.path.join(root, site)}' does not exist; skipping.", flush=True)
+        else:
+            ready.append((file_path, site))
+
+    moved = []
+    results = run_ordered(partial(_try_move, folders=folders), ready, workers, processes=False)
+    for (file_path, site), (destination, error) in zip(ready, results):
+        file_name = os.path.basename(file_path)
+        if error is None:
+            moved.append((file_path, destination))
+            instrument.count("files")
+            print(f"Moved '{file_name}' to '{site}/'", flush=True)
+        else:
+            print(f"Error moving '{file_name}' to '{site}/': {error}", flush=True)
+            events.emit("error", file=file_name, stage=stage, message=str(error))
+    return moved
+
+
+def route_file(file_path, root, site, create=False):
+    """Move one file into root/<site>; returns its new path, or None when it stays put."""
+    if not site or not os.path.exists(file_path):
+        return None
+    folder = os.path.join(root, site)
+    if create:
+        os.makedirs(folder, exist_ok=True)
+    elif not os.path.isdir(folder):
+        print(f"Warning: target folder '{folder}' does not exist; skipping.", flush=True)
+        return None
+    destination = move_file(file_path, folder)
+    print(f"Moved '{os.path.basename(file_path)}' to '{site}/'", flush=True)
+    return destination
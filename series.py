@@ -0,0 +1,201 @@
+"""
+Compact in-memory form of one export's minute data.
+
+Between stages a table is a pandas frame with a datetime64 column and value
+columns that are often object dtype, and before that a grid of openpyxl
+cells; either costs many times the size of the numbers themselves.
+MinuteSeries keeps only:
+
+  - the first timestamp, plus int32 minute offsets when the rows are not a
+    regular one-minute grid (a regular grid stores no timestamps at all);
+  - one float32 or float64 array per value column;
+  - the gap mask packed eight rows to a byte.
+
+Slicing by row or by time returns views of the same arrays (the packed mask
+included), and from_frame/to_frame and from_arrays/to_numpy convert to and
+from pandas and NumPy. A site-month of eight sensors at one-minute
+resolution fits in a few megabytes. The pipeline stages still pass pandas
+frames between them; nothing holds its tables in this form yet.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+MINUTE_NS = 60 * 10**9
+
+
+class MinuteSeries:
+    """
+    Value columns on a minute timestamp index, with a gap mask.
+
+    start is a timestamp in nanoseconds: that of the first row for a regular
+    one-minute grid (offsets is None), else the one the int32 minutes in
+    offsets count from. columns holds one 1-D float array per name.
+    """
+
+    __slots__ = ("start", "offsets", "columns", "names", "_bits", "_bit_start", "_length")
+
+    def __init__(self, start, columns, names, mask=None, offsets=None):
+        self.start = int(start)
+        self.columns = tuple(columns)
+        self.names = tuple(names)
+        self.offsets = offsets
+        self._length = len(offsets) if offsets is not None else (len(self.columns[0]) if self.columns else 0)
+        if len(self.names) != len(self.columns):
+            raise ValueError(f"{len(self.names)} names for {len(self.columns)} columns")
+        if any(len(values) != self._length for values in self.columns):
+            raise ValueError("every column must have one value per row")
+        self._bits = None
+        self._bit_start = 0
+        if mask is not None:
+            mask = np.asarray(mask, dtype=bool)
+            if len(mask) != self._length:
+                raise ValueError("the gap mask must have one flag per row")
+            if mask.any():
+                self._bits = np.packbits(mask)
+
+    @classmethod
+    def from_arrays(cls, timestamps, values, names, mask=None, dtype=np.float64):
+        """
+        Build from datetime64 timestamps and a 2-D (rows, columns) or 1-D
+        value array. Timestamps must fall on whole minutes.
+        """
+        ns = np.asarray(timestamps, dtype='datetime64[ns]').astype(np.int64)
+        values = np.asarray(values, dtype=dtype)
+        if values.ndim == 1:
+            values = values[:, None]
+        if len(ns) == 0:
+            return cls(0, [values[:, j] for j in range(values.shape[1])], names, mask)
+        if np.any(ns % MINUTE_NS):
+            raise ValueError("timestamps must fall on whole minutes")
+        start = int(ns[0])
+        minutes = (ns - start) // MINUTE_NS
+        offsets = None
+        if not np.array_equal(minutes, np.arange(len(minutes))):
+            if minutes.min() < np.iinfo(np.int32).min or minutes.max() > np.iinfo(np.int32).max:
+                raise ValueError("timestamps span more than int32 minutes")
+            offsets = minutes.astype(np.int32)
+        # Column-major copy so each column is one contiguous array
+        values = np.asfortranarray(values)
+        return cls(start, [values[:, j] for j in range(values.shape[1])], names, mask, offsets)
+
+    @classmethod
+    def from_frame(cls, df, mask=None, dtype=np.float64, columns=None):
+        """
+        Build from a frame with a 'timestamp' column and numeric value
+        columns (every other column by default). A column holding anything
+        but numbers raises ValueError instead of being dropped.
+        """
+        names = list(columns) if columns is not None else [name for name in df.columns if name != 'timestamp']
+        numbers = [pd.to_numeric(df[name], errors='coerce') for name in names]
+        bad = [name for name, converted in zip(names, numbers) if (converted.isna() & df[name].notna()).any()]
+        if bad:
+            raise ValueError(f"columns {bad} hold values that are not numbers")
+        values = (np.column_stack([converted.to_numpy(dtype=dtype) for converted in numbers])
+                  if names else np.empty((len(df), 0), dtype=dtype))
+        return cls.from_arrays(pd.to_datetime(df['timestamp']).to_numpy(), values, names, mask, dtype)
+
+    @classmethod
+    def from_table(cls, table, dtype=np.float64):
+        return cls.from_frame(table.df, table.gap_mask, dtype)
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def regular(self):
+        """True when the rows are a one-minute grid with no stored timestamps."""
+        return self.offsets is None
+
+    @property
+    def minutes(self):
+        """Minutes of every row from start, as int64."""
+        if self.offsets is None:
+            return np.arange(self._length, dtype=np.int64)
+        return self.offsets.astype(np.int64)
+
+    @property
+    def timestamps(self):
+        return (self.start + self.minutes * MINUTE_NS).astype('datetime64[ns]')
+
+    @property
+    def mask(self):
+        """The gap mask as a bool array (all False when there are no gaps)."""
+        if self._bits is None:
+            return np.zeros(self._length, dtype=bool)
+        bits = np.unpackbits(self._bits, count=self._bit_start + self._length)
+        return bits[self._bit_start:].astype(bool)
+
+    @property
+    def gap_count(self):
+        return int(self.mask.sum()) if self._bits is not None else 0
+
+    @property
+    def nbytes(self):
+        total = sum(values.nbytes for values in self.columns)
+        if self.offsets is not None:
+            total += self.offsets.nbytes
+        if self._bits is not None:
+            total += self._bits.nbytes
+        return total
+
+    def column(self, name):
+        return self.columns[self.names.index(name)]
+
+    def __getitem__(self, rows):
+        """Rows as a new series sharing this one's arrays; only unit-step slices are supported."""
+        if not isinstance(rows, slice):
+            raise TypeError("MinuteSeries supports slicing only")
+        lo, hi, step = rows.indices(self._length)
+        if step != 1:
+            raise ValueError("MinuteSeries slices must have step 1")
+        hi = max(hi, lo)
+        out = object.__new__(MinuteSeries)
+        out.names = self.names
+        out.columns = tuple(values[lo:hi] for values in self.columns)
+        out._length = hi - lo
+        if self.offsets is None:
+            out.start = self.start + lo * MINUTE_NS
+            out.offsets = None
+        else:
+            # Offsets keep counting from the same start, so they are shared too
+            out.start = self.start
+            out.offsets = self.offsets[lo:hi]
+        if self._bits is None:
+            out._bits = None
+            out._bit_start = 0
+        else:
+            bit = self._bit_start + lo
+            out._bits = self._bits[bit // 8:(self._bit_start + hi + 7) // 8]
+            out._bit_start = bit % 8
+        return out
+
+    def between(self, first, last):
+        """Rows with first <= timestamp <= last, as a slice of this series (rows must be in time order)."""
+        lo_min = -((self.start - pd.Timestamp(first).value) // MINUTE_NS)
+        hi_min = (pd.Timestamp(last).value - self.start) // MINUTE_NS
+        if self.offsets is None:
+            lo = min(max(lo_min, 0), self._length)
+            hi = min(max(hi_min + 1, 0), self._length)
+        else:
+            lo = int(np.searchsorted(self.offsets, lo_min, side="left"))
+            hi = int(np.searchsorted(self.offsets, hi_min, side="right"))
+        return self[lo:hi]
+
+    def to_numpy(self):
+        """(timestamps, 2-D values array) copies."""
+        values = np.column_stack(self.columns) if self.columns else np.empty((self._length, 0))
+        return self.timestamps, values
+
+    def to_frame(self):
+        """A frame with 'timestamp' and the value columns; the value columns share this series' arrays."""
+        data = {'timestamp': self.timestamps}
+        data.update(zip(self.names, self.columns))
+        return pd.DataFrame(data, copy=False)
+
+    def __repr__(self):
+        grid = "regular" if self.offsets is None else "irregular"
+        first = pd.Timestamp(self.timestamps[0]) if self._length else None
+        return (f"MinuteSeries({self._length} rows from {first}, {grid}, columns={list(self.names)}, "
+                f"gaps={self.gap_count}, {self.nbytes} bytes)")
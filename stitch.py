@@ -0,0 +1,225 @@
+"""
+Stitch overlapping exports of one sensor into one continuous series.
+
+The loggers are exported in overlapping windows (2025-07-01_2025-07-29,
+then one starting on the 28th, ...). Treated one by one, the overlap days
+show up as duplicates or as 1440-count mismatches. This stage:
+
+  - groups the renamed exports by site and sensor, read from the file name
+    (or from the catalog when the name does not parse);
+  - streams every export of a group with a read-only reader and merges them
+    with a heap-based k-way merge (heapq.merge), so no file is loaded whole;
+  - resolves timestamps found in more than one export by the --overlap rule
+    (or "overlap" in the "stitch" section of config.json):
+        last   the most recent export wins (the default; later exports
+               carry the corrected values)
+        first  the earliest export wins
+        mean   the average of the exports' values
+    With last and first, every row the winning export has at a timestamp
+    is kept, as for a timestamp found in one export only;
+  - writes the continuous series to ../stitched as one workbook named for
+    its full period, ready for the pipeline.
+
+    python stitch.py [folder] [--overlap RULE]
+"""
+
+import argparse
+import heapq
+import os
+import re
+import time
+import traceback
+from functools import partial
+from itertools import groupby
+
+import numpy as np
+import pandas as pd
+
+import catalog
+import config
+import events
+import instrument
+from executor import run_ordered
+from pipeline import BASE_DIR, ORIGINAL_DIR, list_xlsx
+from rename import build_filename
+from stream import read_batches
+from writer import write_chunks
+
+STITCHED_DIR = os.path.join(BASE_DIR, "stitched")
+OVERLAP_RULES = ("last", "first", "mean")
+WRITE_BATCH_ROWS = 50000
+
+# "<location>_<sensor>_<first date>_<last date>.xlsx" as written by the rename stage,
+# where the location ends with its time zone, e.g. D12__(PDT)
+NAME_PATTERN = re.compile(r"^(?P<location>.*?\))_(?P<sensor>.+)_(?P<first>\d{4}-\d{2}-\d{2})"
+                          r"_(?P<last>\d{4}-\d{2}-\d{2})\.xlsx$", re.IGNORECASE)
+
+
+def default_rule():
+    return config.get("stitch").get("overlap", "last")
+
+
+def parse_name(file_path):
+    """(site, location, sensor, first date, last date) of an export, or None if unknown."""
+    match = NAME_PATTERN.match(os.path.basename(file_path))
+    if match:
+        return (catalog.site_from(match["location"]), match["location"], match["sensor"],
+                match["first"], match["last"])
+    entry = catalog.lookup(file_path)
+    if entry and entry["site"] and entry["sensor"]:
+        return (entry["site"], entry["location"], entry["sensor"].replace(" ", "_"),
+                str(entry["first_ts"])[:10], str(entry["last_ts"])[:10])
+    return None
+
+
+def group_exports(file_paths):
+    """Lists of exports sharing a site and sensor, oldest first, for every group with more than one."""
+    groups = {}
+    for file_path in file_paths:
+        parsed = parse_name(file_path)
+        if parsed is None or parsed[0] is None:
+            continue
+        site, _, sensor, first, last = parsed
+        groups.setdefault((site, sensor.lower()), []).append((first, last, file_path))
+    return [[path for _, _, path in sorted(group)] for group in groups.values() if len(group) > 1]
+
+
+def _rows(file_path, rank):
+    """Yield (timestamp, rank, values) for every row of one export, checking they are in time order."""
+    previous = None
+    for batch in read_batches(file_path):
+        timestamps = pd.to_datetime(batch['timestamp']).to_numpy()
+        values = batch.iloc[:, 1:].itertuples(index=False, name=None)
+        for ts, row in zip(timestamps, values):
+            if pd.isna(ts):
+                continue
+            if previous is not None and ts < previous:
+                raise ValueError(f"'{os.path.basename(file_path)}' is not in time order at {ts}")
+            previous = ts
+            yield ts, rank, row
+
+
+def _resolve(rows, rule):
+    """The rows of values kept from the rows that share a timestamp, taken from different exports."""
+    if rule in ("first", "last"):
+        # Every row of the winning export, so a timestamp it repeats stays as it was
+        winner = rows[0][1] if rule == "first" else rows[-1][1]
+        return [row for _, rank, row in rows if rank == winner]
+    values = np.array([[np.nan if v is None else v for v in row] for _, _, row in rows], dtype=float)
+    with np.errstate(invalid='ignore'):
+        return [tuple(np.nanmean(values, axis=0))]
+
+
+def stitch_rows(file_paths, rule="last"):
+    """
+    Merge the exports' rows into one time-ordered stream of (timestamp, values),
+    resolving timestamps that appear in more than one export by rule. Yields
+    ("overlap", count) as its last item.
+    """
+    streams = [_rows(path, rank) for rank, path in enumerate(file_paths)]
+    overlaps = 0
+    for ts, group in groupby(heapq.merge(*streams, key=lambda row: (row[0], row[1])), key=lambda row: row[0]):
+        rows = list(group)
+        ranks = {rank for _, rank, _ in rows}
+        if len(ranks) > 1:
+            overlaps += 1
+            for row in _resolve(rows, rule):
+                yield ts, row
+        else:
+            for _, _, row in rows:
+                yield ts, row
+    yield "overlap", overlaps
+
+
+def stitch_group(file_paths, rule="last", output_dir=STITCHED_DIR):
+    """Stitch one site and sensor's exports into one workbook; returns its path or None on error."""
+    start = time.perf_counter()
+    site, location, sensor, _, _ = parse_name(file_paths[0])
+    label = f"{site} {sensor}"
+    try:
+        if rule not in OVERLAP_RULES:
+            raise ValueError(f"unknown overlap rule {rule!r}; expected one of {OVERLAP_RULES}")
+        print(f"Stitching {len(file_paths)} exports of {label} ({rule} wins on overlap)", flush=True)
+        columns = next(read_batches(file_paths[0], batch_rows=1)).columns.tolist()
+
+        extent = {"first_ts": None, "last_ts": None, "rows": 0, "overlap": 0}
+
+        def chunks():
+            timestamps, values = [], []
+            for ts, row in stitch_rows(file_paths, rule):
+                if ts == "overlap":
+                    extent["overlap"] = row
+                    break
+                if extent["first_ts"] is None:
+                    extent["first_ts"] = ts
+                extent["last_ts"] = ts
+                timestamps.append(ts)
+                values.append(row)
+                if len(timestamps) == WRITE_BATCH_ROWS:
+                    yield _frame(columns, timestamps, values), None
+                    timestamps, values = [], []
+            if timestamps:
+                yield _frame(columns, timestamps, values), None
+
+        def counted():
+            for df, mask in chunks():
+                extent["rows"] += len(df)
+                yield df, mask
+
+        os.makedirs(output_dir, exist_ok=True)
+        temp_path = os.path.join(output_dir, f"~$stitch {site} {sensor}.xlsx")
+        with instrument.span("stitch", cat="compute", file=label):
+            write_chunks(columns, counted(), temp_path, masked=False)
+            instrument.count("rows", extent["rows"])
+
+        entry = catalog.lookup(file_paths[-1])
+        meta = {"location": entry["location"] if entry else location.replace("_", " "),
+                "site": site, "sensor": columns[1],
+                "first_ts": pd.Timestamp(extent["first_ts"]), "last_ts": pd.Timestamp(extent["last_ts"]),
+                "rows": extent["rows"], "header_rows": 0}
+        output_path = os.path.join(output_dir, build_filename(meta))
+        os.replace(temp_path, output_path)
+        catalog.record(output_path, meta)
+
+        elapsed = time.perf_counter() - start
+        print(f"Resolved {extent['overlap']} overlapping timestamps", flush=True)
+        print(f"Saved: '{output_path}' ({extent['rows']} rows)", flush=True)
+        print(f"Done: '{label}' in {elapsed:.1f}s\n", flush=True)
+        events.emit("file", file=os.path.basename(output_path), status="done", output=output_path,
+                    rows=extent["rows"], gaps=0, elapsed=elapsed)
+        return output_path
+    except Exception as e:
+        print(f"Error stitching '{label}': {e}", flush=True)
+        events.emit("error", file=label, stage="stitch", message=str(e), traceback=traceback.format_exc())
+        events.emit("file", file=label, status="error", elapsed=time.perf_counter() - start)
+        return None
+
+
+def _frame(columns, timestamps, values):
+    df = pd.DataFrame.from_records(values, columns=columns[1:])
+    df.insert(0, 'timestamp', pd.to_datetime(np.array(timestamps)))
+    return df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stitch overlapping exports of each site and sensor into one series.")
+    parser.add_argument("folder", nargs="?", default=ORIGINAL_DIR,
+                        help="folder of renamed exports (default: the 'original' folder)")
+    parser.add_argument("--overlap", choices=OVERLAP_RULES, default=None,
+                        help="which value wins where exports overlap (default: config.json, else last)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes (default: $SJV_WORKERS or the CPU count)")
+    args = parser.parse_args(argv)
+
+    groups = group_exports(list_xlsx(args.folder))
+    if not groups:
+        print("No overlapping exports found.", flush=True)
+        return
+    print(f"Found {len(groups)} sensors with more than one export.\n", flush=True)
+    events.emit("batch", files=len(groups), stages=["stitch"], workers=args.workers)
+    run_ordered(partial(stitch_group, rule=args.overlap or default_rule()), groups, args.workers)
+    print("All files processed.", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+"""
+Chunked streaming mode for long series.
+
+A year of one-minute data is 525,600 rows per sensor, and loading a
+multi-year export into one DataFrame (or one sheet) does not scale. This
+mode runs gap detection and interpolation over fixed time chunks instead:
+
+  - rows are streamed from the workbook with a read-only reader and cut
+    into chunks of --chunk-days days, aligned to midnight;
+  - each chunk is placed on the minute grid with missing.regularize and
+    filled with interpol.fill_columns, the same code as the whole-file
+    stages, so the column policies in config.json apply;
+  - the last known row and any gap still open at the end of a chunk are
+    carried into the next one, so every gap is filled from the same
+    neighbours, and gives the same values, as in a whole-file run;
+  - finished rows are appended to ../streamed/<name>.parquet one row group
+    per chunk (or to numbered .npz parts without pyarrow), with the gap
+    mask in an "imputed" column.
+
+The input must be in time order, as the exports are; rows older than the
+chunk being filled are dropped with a warning. --xlsx also exports the
+result as "averaged <name>" to the averaged folder, continuing on new
+sheets past the .xlsx row limit.
+
+    python stream.py [file ...] [--chunk-days N] [--xlsx] [--method M] [--max-gap N] [--duplicates AGG]
+"""
+
+import argparse
+import os
+import time
+import traceback
+from functools import partial
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from pandas.tseries.frequencies import to_offset
+
+import catalog
+import events
+import gaplog
+import instrument
+from executor import run_ordered
+from interpol import METHODS, fill_columns, value_columns
+from missing import AGGREGATIONS, regularize
+from pipeline import AVERAGED_DIR, BASE_DIR, ORIGINAL_DIR, list_xlsx, sheet_rows
+from validate import MINUTES_PER_DAY
+from writer import MASK_COLUMN, write_chunks
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+STREAM_DIR = os.path.join(BASE_DIR, "streamed")
+DEFAULT_CHUNK_DAYS = 7
+READ_BATCH_ROWS = 50000
+DAY_NS = 24 * 60 * 60 * 10**9
+
+
+def read_batches(file_path, batch_rows=READ_BATCH_ROWS):
+    """
+    Stream a workbook as DataFrames of up to batch_rows raw rows, skipping
+    any metadata rows above the "timestamp" header.
+    """
+    wb = load_workbook(file_path, read_only=True)
+    try:
+        columns = None
+        records = []
+        for values in sheet_rows(wb):
+            if columns is None:
+                first = values[0] if values else None
+                if isinstance(first, str) and first.strip().lower() == "timestamp":
+                    # Same names as load_table gives unnamed columns
+                    columns = ['timestamp'] + [name if name is not None else f"column {i + 1}"
+                                               for i, name in enumerate(values) if i > 0]
+                continue
+            if not values or values[0] is None:
+                continue
+            records.append(values)
+            if len(records) == batch_rows:
+                yield pd.DataFrame.from_records(records, columns=columns)
+                records = []
+        if columns is None:
+            raise ValueError("no 'timestamp' header row found")
+        if records:
+            yield pd.DataFrame.from_records(records, columns=columns)
+    finally:
+        wb.close()
+
+
+class ChunkWriter:
+    """Appends (df, gap_mask) chunks to one Parquet file, or to .npz parts without pyarrow."""
+
+    def __init__(self, base_path):
+        self.base_path = base_path
+        self.path = base_path + (".parquet" if pa is not None else ".parts")
+        self.tmp = self.path + ".tmp"
+        self.writer = None
+        self.parts = 0
+        os.makedirs(os.path.dirname(base_path), exist_ok=True)
+        if pa is None:
+            os.makedirs(self.tmp, exist_ok=True)
+
+    def append(self, df, gap_mask):
+        frame = df.copy()
+        frame[MASK_COLUMN] = np.asarray(gap_mask, dtype=bool)
+        if pa is not None:
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self.writer is None:
+                self.writer = pq.ParquetWriter(self.tmp, table.schema)
+            self.writer.write_table(table)
+        else:
+            arrays = {f"c{i}": frame[name].to_numpy() for i, name in enumerate(frame.columns)}
+            arrays["__columns"] = np.array(list(frame.columns))
+            np.savez(os.path.join(self.tmp, f"{self.parts:05d}.npz"), **arrays)
+        self.parts += 1
+
+    def close(self):
+        """Finish the file and move it into place, replacing any earlier result."""
+        if self.writer is not None:
+            self.writer.close()
+        if not os.path.exists(self.tmp):
+            return None
+        if os.path.isdir(self.path):
+            for name in os.listdir(self.path):
+                os.remove(os.path.join(self.path, name))
+            os.rmdir(self.path)
+        os.replace(self.tmp, self.path)
+        return self.path
+
+
+def read_chunks(path):
+    """Yield (df, gap_mask) chunks back from a file written by ChunkWriter."""
+    if path.endswith(".parquet"):
+        parquet = pq.ParquetFile(path)
+        for i in range(parquet.num_row_groups):
+            df = parquet.read_row_group(i).to_pandas()
+            yield df, df.pop(MASK_COLUMN).to_numpy(dtype=bool)
+        return
+    for name in sorted(os.listdir(path)):
+        with np.load(os.path.join(path, name), allow_pickle=False) as data:
+            columns = [str(c) for c in data["__columns"]]
+            df = pd.DataFrame({c: data[f"c{i}"] for i, c in enumerate(columns)})
+        yield df, df.pop(MASK_COLUMN).to_numpy(dtype=bool)
+
+
+class GapFiller:
+    """
+    Gap detection and filling over a stream of row batches.
+
+    feed() takes raw rows in time order and returns the rows that are
+    final; finish() returns the rest. Rows are finished up to the last
+    non-gap row seen, which is kept as context so the next chunk fills the
+    gap that follows it from the same neighbours a whole-file run would use.
+    """
+
+    def __init__(self, chunk_days=DEFAULT_CHUNK_DAYS, agg="first", method="midpoint",
+                 max_gap=None, freq="min"):
+        self.step = to_offset(freq).nanos
+        # Chunk boundaries fall on the grid
+        self.chunk_ns = max(round(chunk_days * DAY_NS / self.step), 1) * self.step
+        self.agg = agg
+        self.method = method
+        self.max_gap = max_gap
+        self.freq = freq
+        self.names = None
+        self.start = None          # first grid point of the series
+        self.day0 = None           # midnight before it; chunks are counted from here
+        self.window = None         # index of the chunk being collected
+        self.pending = []          # raw rows of that chunk
+        self.carry = None          # (frame, mask, context rows) not yet final
+        self.late_rows = 0
+        self.duplicates = 0
+
+    def _window_start(self, window):
+        return max(self.start, self.day0 + window * self.chunk_ns)
+
+    def feed(self, batch):
+        """Add a batch of raw rows; returns the list of (df, gap_mask) chunks that became final."""
+        if self.names is None:
+            self.names = [name for name in value_columns(batch) if name != MASK_COLUMN]
+        batch = batch[['timestamp', *self.names]]
+        ns = pd.to_datetime(batch['timestamp']).to_numpy().astype('datetime64[ns]').astype(np.int64)
+        valid = ~pd.isna(batch['timestamp']).to_numpy()
+        if not valid.any():
+            return []
+        batch, ns = batch[valid], ns[valid]
+        if self.start is None:
+            self.start = ns[0] - ns[0] % self.step
+            self.day0 = ns[0] - ns[0] % DAY_NS
+            self.window = 0
+
+        windows = (ns - self.day0) // self.chunk_ns
+        late = windows < self.window
+        if late.any():
+            self.late_rows += int(late.sum())
+            batch, ns, windows = batch[~late], ns[~late], windows[~late]
+
+        done = []
+        for window in np.unique(windows):
+            while self.window < window:
+                done += self._close_window(self._window_start(self.window + 1))
+                self.window += 1
+            self.pending.append(batch[windows == window])
+        return done
+
+    def finish(self):
+        """Fill and return everything still held back."""
+        if self.start is None:
+            return []
+        done = self._close_window(None)
+        if self.carry is not None:
+            frame, mask, context = self.carry
+            done += self._fill(frame, mask, context, len(frame))
+            self.carry = None
+        return done
+
+    def _close_window(self, end_ns):
+        """Place the pending rows on the grid up to end_ns (or their last row) and fill what is final."""
+        start = self._window_start(self.window)
+        rows = pd.concat(self.pending) if self.pending else None
+        self.pending = []
+        if end_ns is None:
+            if rows is None or rows.empty:
+                return []
+            last = pd.to_datetime(rows['timestamp']).max().to_datetime64().astype('datetime64[ns]').astype(np.int64)
+            end_ns = last - last % self.step + self.step
+        size = int((end_ns - start) // self.step)
+        if size <= 0:
+            return []
+
+        grid = (start + np.arange(size, dtype=np.int64) * self.step).astype('datetime64[ns]')
+        if rows is None or rows.empty:
+            frame = pd.DataFrame({'timestamp': grid, **{name: np.full(size, np.nan) for name in self.names}})
+            mask = np.ones(size, dtype=bool)
+        else:
+            frame, mask, duplicates = regularize(rows, self.agg, self.freq, start=start, size=size)
+            self.duplicates += duplicates
+
+        context = 0
+        if self.carry is not None:
+            carry_frame, carry_mask, context = self.carry
+            frame = pd.concat([carry_frame, frame], ignore_index=True)
+            mask = np.concatenate([carry_mask, mask])
+            self.carry = None
+
+        present = np.flatnonzero(~mask)
+        if len(present) == 0:
+            # Nothing but gap: hold all of it until a value arrives
+            self.carry = (frame, mask, context)
+            return []
+        last = present[-1]
+        self.carry = (frame.iloc[last:].reset_index(drop=True), mask[last:], 1)
+        return self._fill(frame, mask, context, last + 1)
+
+    def _fill(self, frame, mask, context, stop):
+        """Fill rows [0, stop) of frame and return rows [context, stop) as one finished chunk."""
+        frame = frame.iloc[:stop].copy()
+        mask = mask[:stop]
+        if mask.any() and self.names:
+            timestamps = frame['timestamp'].to_numpy() if self.method == "time" else None
+            values = frame[self.names].to_numpy(dtype=float)
+            filled = fill_columns(values, mask, self.names, self.method, timestamps, self.max_gap)
+            for j, name in enumerate(self.names):
+                frame[name] = filled[:, j]
+        frame = frame.iloc[context:].reset_index(drop=True)
+        if frame.empty:
+            return []
+        return [(frame, mask[context:])]
+
+
+def stream_file(file_path, chunk_days=DEFAULT_CHUNK_DAYS, agg="first", method="midpoint",
+                max_gap=None, export_xlsx=False):
+    """Fill one file chunk by chunk into ../streamed; returns the output path or None on error."""
+    file_name = os.path.basename(file_path)
+    start = time.perf_counter()
+    try:
+        print(f"Start: '{file_name}' in {chunk_days}-day chunks", flush=True)
+        filler = GapFiller(chunk_days, agg, method, max_gap)
+        writer = ChunkWriter(os.path.join(STREAM_DIR, os.path.splitext(file_name)[0]))
+        rows = gaps = chunks = 0
+        gap_intervals = []
+        day_counts = {}
+
+        def write(done):
+            nonlocal rows, gaps, chunks
+            for df, mask in done:
+                writer.append(df, mask)
+                timestamps = df['timestamp'].to_numpy()
+                gap_intervals.extend(gaplog.intervals(timestamps, mask))
+                days, counts = np.unique(timestamps.astype('datetime64[D]'), return_counts=True)
+                for day, count in zip(days, counts):
+                    day_counts[str(day)] = day_counts.get(str(day), 0) + int(count)
+                rows += len(df)
+                gaps += int(mask.sum())
+                chunks += 1
+
+        with instrument.span("stream", cat="compute", file=file_name):
+            for batch in read_batches(file_path):
+                write(filler.feed(batch))
+            write(filler.finish())
+            output_path = writer.close()
+            instrument.count("rows", rows)
+            instrument.count("gaps", gaps)
+
+        if filler.duplicates:
+            print(f"Collapsed {filler.duplicates} duplicate timestamps ({agg})", flush=True)
+        if filler.late_rows:
+            print(f"Warning: dropped {filler.late_rows} rows that were out of time order", flush=True)
+        print(f"Found {gaps} missing timestamps in {len(gap_intervals)} gaps", flush=True)
+        gaplog.record(file_name, catalog.site_from(file_name), filler.names[0] if filler.names else None,
+                      gap_intervals)
+        for day, count in sorted(day_counts.items()):
+            if count != MINUTES_PER_DAY:
+                print(f"{day}: {count} timestamps", flush=True)
+            events.emit("day_count", file=file_name, date=day, count=count, expected=MINUTES_PER_DAY)
+        print(f"Saved: '{output_path}' ({rows} rows in {chunks} chunks)", flush=True)
+
+        if export_xlsx and output_path is not None:
+            xlsx_path = os.path.join(AVERAGED_DIR, f"averaged {file_name}")
+            write_chunks(['timestamp', *filler.names], read_chunks(output_path), xlsx_path)
+            print(f"Saved: '{xlsx_path}'", flush=True)
+
+        elapsed = time.perf_counter() - start
+        print(f"Done: '{file_name}' in {elapsed:.1f}s\n", flush=True)
+        events.emit("file", file=file_name, status="done", output=output_path, rows=rows, gaps=gaps,
+                    elapsed=elapsed)
+        return output_path
+    except Exception as e:
+        print(f"Error processing '{file_name}': {e}", flush=True)
+        events.emit("error", file=file_name, stage="stream", message=str(e), traceback=traceback.format_exc())
+        events.emit("file", file=file_name, status="error", elapsed=time.perf_counter() - start)
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fill gaps chunk by chunk for series too long to load at once.")
+    parser.add_argument("files", nargs="*", help="workbooks to process (default: the 'original' folder)")
+    parser.add_argument("--chunk-days", type=float, default=DEFAULT_CHUNK_DAYS,
+                        help="days of data per chunk (default: %(default)s)")
+    parser.add_argument("--xlsx", action="store_true",
+                        help="also export the result to the 'averaged' folder as .xlsx")
+    parser.add_argument("--duplicates", choices=AGGREGATIONS, default="first",
+                        help="how to collapse repeated timestamps")
+    parser.add_argument("--method", choices=METHODS, default="midpoint")
+    parser.add_argument("--max-gap", type=int, default=None,
+                        help="leave gaps longer than this many minutes unfilled")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes (default: $SJV_WORKERS or the CPU count)")
+    args = parser.parse_args(argv)
+
+    file_paths = args.files or list_xlsx(ORIGINAL_DIR)
+    if not file_paths:
+        print("No .xlsx files found", flush=True)
+        return
+    print(f"Found {len(file_paths)} .xlsx files to process.\n", flush=True)
+    events.emit("batch", files=len(file_paths), stages=["stream"], workers=args.workers)
+    work = partial(stream_file, chunk_days=args.chunk_days, agg=args.duplicates, method=args.method,
+                   max_gap=args.max_gap, export_xlsx=args.xlsx)
+    run_ordered(work, file_paths, args.workers)
+    print("All files processed.", flush=True)
+
+
+if __name__ == "__main__":
+    main()
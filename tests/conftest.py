@@ -0,0 +1,31 @@
+"""
+Shared setup for the tests: the scripts import each other by module name,
+and their stores live one level up from the scripts, so the tests put the
+script folder on sys.path and point every store at a scratch folder before
+anything is imported. config.json is not read; the built-in defaults are.
+"""
+
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+SCRIPT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRATCH = tempfile.mkdtemp(prefix="sjv-tests-")
+atexit.register(shutil.rmtree, SCRATCH, ignore_errors=True)
+
+os.environ.update({
+    "SJV_CONFIG": os.path.join(SCRATCH, "config.json"),
+    "SJV_DB": os.path.join(SCRATCH, "sjv.sqlite"),
+    "SJV_CACHE": "0",
+    "SJV_CACHE_DIR": os.path.join(SCRATCH, "cache"),
+    "SJV_MANIFEST": "0",
+    "SJV_WORKER": "0",
+    "SJV_WORKERS": "1",
+})
+os.environ.pop("SJV_EVENTS", None)
+os.environ.pop("SJV_TRACE", None)
+
+if SCRIPT_DIR not in sys.path:
+    sys.path.insert(0, SCRIPT_DIR)
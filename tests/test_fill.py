@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from interpol import fill_columns, interpolate_gaps
+from missing import regularize
+
+
+def frame(minutes, values):
+    timestamps = pd.Timestamp("2025-07-01") + pd.to_timedelta(minutes, unit="min")
+    return pd.DataFrame({"timestamp": timestamps, "Power": values})
+
+
+def test_regularize_fills_the_grid_and_collapses_duplicates():
+    # 00:01 twice, 00:02 and 00:03 missing, rows out of order
+    df = frame([4, 0, 1, 1], [40.0, 0.0, 10.0, 11.0])
+    out, mask, duplicates = regularize(df)
+
+    assert list(out["timestamp"]) == list(pd.date_range("2025-07-01", periods=5, freq="min"))
+    assert mask.tolist() == [False, False, True, True, False]
+    assert duplicates == 1
+    np.testing.assert_array_equal(out["Power"].to_numpy(), [0.0, 10.0, np.nan, np.nan, 40.0])
+
+
+@pytest.mark.parametrize("agg, expected", [("last", 11.0), ("mean", 10.5), ("min", 10.0), ("max", 11.0),
+                                           ("sum", 21.0)])
+def test_regularize_aggregates_duplicates(agg, expected):
+    out, _, duplicates = regularize(frame([0, 1, 1], [0.0, 10.0, 11.0]), agg=agg)
+    assert duplicates == 1
+    assert out["Power"].iloc[1] == expected
+
+
+def test_regularize_rejects_an_unknown_aggregation():
+    with pytest.raises(ValueError):
+        regularize(frame([0], [0.0]), agg="median")
+
+
+def test_interpolate_gaps_methods():
+    values = np.array([0.0, np.nan, np.nan, 30.0])
+    mask = np.array([False, True, True, False])
+    np.testing.assert_array_equal(interpolate_gaps(values, mask), [0.0, 15.0, 15.0, 30.0])
+    np.testing.assert_array_equal(interpolate_gaps(values, mask, "linear"), [0.0, 10.0, 20.0, 30.0])
+    minutes = np.array([0, 1, 5, 6], dtype="datetime64[m]")
+    np.testing.assert_allclose(interpolate_gaps(values, mask, "time", timestamps=minutes), [0.0, 5.0, 25.0, 30.0])
+
+
+def test_interpolate_gaps_leaves_edges_and_long_gaps():
+    values = np.array([np.nan, 1.0, np.nan, np.nan, np.nan, 5.0, np.nan])
+    mask = np.isnan(values)
+    out = interpolate_gaps(values, mask, "linear", max_gap=2)
+    np.testing.assert_array_equal(np.isnan(out), mask)
+    out = interpolate_gaps(values, mask, "linear")
+    np.testing.assert_array_equal(out[1:6], [1.0, 2.0, 3.0, 4.0, 5.0])
+    assert np.isnan(out[0]) and np.isnan(out[-1])
+
+
+def test_regularize_then_fill_by_policy():
+    df = frame([0, 1, 1, 4], [100.0, 101.0, 99.0, 104.0])
+    df["Volume total"] = [5.0, 6.0, 6.0, 9.0]
+    out, mask, _ = regularize(df)
+    names = ["Power", "Volume total"]
+    filled = fill_columns(out[names].to_numpy(), mask, names, "linear",
+                          policies={"default": "interpolate", "power": "hold"})
+    np.testing.assert_array_equal(filled[:, 0], [100.0, 101.0, 101.0, 101.0, 104.0])
+    np.testing.assert_array_equal(filled[:, 1], [5.0, 6.0, 7.0, 8.0, 9.0])
@@ -0,0 +1,30 @@
+import numpy as np
+
+from gaplog import intervals
+
+
+def minutes(start, count):
+    return np.datetime64(start, "m") + np.arange(count)
+
+
+def test_intervals_are_runs_of_the_mask():
+    ts = minutes("2025-07-01T00:00", 10)
+    mask = np.array([0, 1, 1, 0, 0, 1, 0, 1, 1, 1], dtype=bool)
+    assert [(str(s)[:16], str(e)[:16], n) for s, e, n in intervals(ts, mask)] == [
+        ("2025-07-01T00:01", "2025-07-01T00:02", 2),
+        ("2025-07-01T00:05", "2025-07-01T00:05", 1),
+        ("2025-07-01T00:07", "2025-07-01T00:09", 3),
+    ]
+
+
+def test_intervals_split_at_midnight():
+    ts = minutes("2025-07-01T23:57", 6)
+    mask = np.array([0, 1, 1, 1, 1, 0], dtype=bool)
+    assert [(str(s)[:16], str(e)[:16], n) for s, e, n in intervals(ts, mask)] == [
+        ("2025-07-01T23:58", "2025-07-01T23:59", 2),
+        ("2025-07-02T00:00", "2025-07-02T00:01", 2),
+    ]
+
+
+def test_no_gaps_gives_no_intervals():
+    assert intervals(minutes("2025-07-01T00:00", 3), np.zeros(3, dtype=bool)) == []
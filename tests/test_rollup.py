@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+
+from rollup import aggregate, rollup_frame
+
+DAY0 = int(np.datetime64("2025-07-01T00:00", "m").astype(np.int64))
+
+
+def bins(results, resolution):
+    starts, stats = results[resolution]
+    return (starts - DAY0).tolist(), stats
+
+
+def test_bins_start_on_clock_boundaries():
+    # The last minute of each bin and the first of the next
+    minutes = DAY0 + np.array([14, 15, 59, 60, 1439, 1440])
+    values = np.arange(len(minutes), dtype=float)
+    results = aggregate(minutes, values)
+
+    starts, stats = bins(results, "15min")
+    assert starts == [0, 15, 45, 60, 1425, 1440]
+    assert stats["minutes"][:, 0].tolist() == [1] * 6
+
+    starts, stats = bins(results, "hourly")
+    assert starts == [0, 60, 1380, 1440]
+    assert stats["minutes"][:, 0].tolist() == [3, 1, 1, 1]
+    assert stats["sum"][:, 0].tolist() == [3.0, 3.0, 4.0, 5.0]
+
+    starts, stats = bins(results, "daily")
+    assert starts == [0, 1440]
+    assert stats["minutes"][:, 0].tolist() == [5, 1]
+    assert stats["min"][:, 0].tolist() == [0.0, 5.0]
+    assert stats["max"][:, 0].tolist() == [4.0, 5.0]
+
+
+def test_bins_that_do_not_start_at_midnight():
+    minutes = DAY0 + np.arange(50, 130)
+    starts, stats = bins(aggregate(minutes, np.ones(len(minutes))), "15min")
+    assert starts == list(range(45, 130, 15))
+    assert stats["minutes"][:, 0].tolist() == [10, 15, 15, 15, 15, 10]
+
+
+def test_nan_is_left_out_and_imputed_rows_are_counted():
+    minutes = DAY0 + np.arange(15)
+    values = np.full((15, 2), 2.0)
+    values[:5, 0] = np.nan
+    values[:, 1] = np.nan
+    mask = np.zeros(15, dtype=bool)
+    mask[3:6] = True
+    _, stats = aggregate(minutes, values, mask)["15min"]
+
+    assert stats["minutes"].tolist() == [[15, 15]]
+    assert stats["imputed"].tolist() == [[3, 3]]
+    assert stats["mean"][0, 0] == 2.0 and stats["sum"][0, 0] == 20.0
+    assert np.isnan(stats["mean"][0, 1]) and np.isnan(stats["sum"][0, 1])
+
+
+def test_rollup_frame_is_one_row_per_bin_and_column():
+    minutes = DAY0 + np.arange(30)
+    starts, stats = aggregate(minutes, np.ones((30, 2)))["15min"]
+    frame = rollup_frame(starts, stats, ["Power", "Volume total"])
+    assert frame["column"].tolist() == ["Power", "Power", "Volume total", "Volume total"]
+    assert frame["timestamp"].tolist() == [pd.Timestamp("2025-07-01 00:00"), pd.Timestamp("2025-07-01 00:15")] * 2
+
+
+def test_no_minutes_gives_empty_bins():
+    results = aggregate(np.array([], dtype=np.int64), np.empty((0, 1)))
+    assert all(len(starts) == 0 for starts, _ in results.values())
@@ -0,0 +1,34 @@
+import pytest
+
+from routing import classify, site_for
+
+SITES = ("D12", "D15", "G06", "G10")
+
+
+@pytest.mark.parametrize("name, site", [
+    ("D12__(PDT)_Power_2025-07-01_2025-07-29.xlsx", "D12"),
+    ("averaged d12__(PDT)_Power.xlsx", "D12"),
+    ("D-15 export.xlsx", "D15"),
+    ("d_15 export.xlsx", "D15"),
+    ("GO6 flow temperature.xlsx", "G06"),
+    ("g 10.xlsx", "G10"),
+    ("D15 then D12.xlsx", "D15"),
+    ("D99 unknown site.xlsx", None),
+    ("no site at all.xlsx", None),
+])
+def test_site_in_the_name(name, site):
+    assert classify(name, SITES) == site
+    assert site_for(name, sites=SITES) == site
+
+
+def test_a_known_site_beats_the_name():
+    assert site_for("D12 export.xlsx", "G06", SITES) == "G06"
+
+
+def test_an_unregistered_known_site_falls_back_to_the_name():
+    assert site_for("D12 export.xlsx", "X01", SITES) == "D12"
+    assert site_for("D12 export.xlsx", None, SITES) == "D12"
+
+
+def test_the_default_sites_come_from_the_config():
+    assert site_for("G24 export.xlsx") == "G24"
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from interpol import fill_columns
+from missing import regularize
+from stream import ChunkWriter, GapFiller, read_chunks
+
+
+def raw_export(seed=3):
+    """Two days of minutes with gaps (one across midnight) and a few repeated timestamps."""
+    rng = np.random.default_rng(seed)
+    minutes = np.arange(2 * 1440)
+    keep = np.ones(len(minutes), dtype=bool)
+    for start, length in [(5, 1), (300, 40), (1430, 25), (2000, 3), (2870, 10)]:
+        keep[start:start + length] = False
+    minutes = minutes[keep]
+    minutes = np.sort(np.concatenate([minutes, minutes[[100, 2000, 2500]]]))
+    timestamps = pd.Timestamp("2025-07-01") + pd.to_timedelta(minutes, unit="min")
+    return pd.DataFrame({"timestamp": timestamps, "Power": rng.normal(50, 5, len(minutes)),
+                         "Volume total": np.cumsum(rng.random(len(minutes)))})
+
+
+def whole_file(df):
+    frame, mask, _ = regularize(df)
+    names = ["Power", "Volume total"]
+    frame[names] = fill_columns(frame[names].to_numpy(dtype=float), mask, names, "linear")
+    return frame, mask
+
+
+def streamed(df, chunk_days, batch_rows):
+    filler = GapFiller(chunk_days, method="linear")
+    done = []
+    for start in range(0, len(df), batch_rows):
+        done += filler.feed(df.iloc[start:start + batch_rows])
+    done += filler.finish()
+    return done
+
+
+@pytest.mark.parametrize("chunk_days, batch_rows", [(0.25, 97), (1, 1000), (7, 50000)])
+def test_chunked_output_matches_the_whole_file(chunk_days, batch_rows):
+    df = raw_export()
+    expected, expected_mask = whole_file(df)
+    done = streamed(df, chunk_days, batch_rows)
+
+    frame = pd.concat([chunk for chunk, _ in done], ignore_index=True)
+    mask = np.concatenate([chunk_mask for _, chunk_mask in done])
+    pd.testing.assert_frame_equal(frame, expected, check_dtype=False)
+    np.testing.assert_array_equal(mask, expected_mask)
+
+
+def test_chunks_round_trip_through_the_chunk_writer(tmp_path):
+    done = streamed(raw_export(), 0.5, 500)
+    writer = ChunkWriter(str(tmp_path / "streamed" / "export"))
+    for chunk, mask in done:
+        writer.append(chunk, mask)
+    path = writer.close()
+
+    back = list(read_chunks(path))
+    assert len(back) == len(done)
+    for (chunk, mask), (read, read_mask) in zip(done, back):
+        pd.testing.assert_frame_equal(read, chunk, check_dtype=False)
+        np.testing.assert_array_equal(read_mask, mask)
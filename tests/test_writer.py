@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+
+import writer
+from pipeline import load_table
+from stream import read_batches
+from validate import _read_timestamps_openpyxl, read_timestamps
+
+ROWS = 2500
+
+
+@pytest.fixture
+def small_sheets(monkeypatch):
+    # Spill onto new sheets after 1000 rows instead of 1,048,576
+    monkeypatch.setattr(writer, "MAX_SHEET_ROWS", 1000)
+
+
+def table():
+    timestamps = pd.date_range("2025-07-01", periods=ROWS, freq="min")
+    df = pd.DataFrame({"timestamp": timestamps, "Power": np.arange(ROWS, dtype=float)})
+    mask = np.zeros(ROWS, dtype=bool)
+    mask[::7] = True
+    return df, mask
+
+
+@pytest.mark.parametrize("backend", writer.BACKENDS)
+def test_rows_past_the_sheet_limit_read_back_whole(tmp_path, small_sheets, backend):
+    if backend == "xlsxwriter" and writer.xlsxwriter is None:
+        pytest.skip("xlsxwriter is not installed")
+    df, mask = table()
+    path = str(tmp_path / "averaged D12__(PDT)_Power_2025-07-01_2025-07-02.xlsx")
+    writer.write_chunks(df.columns, [(df, mask)], path, backend)
+
+    wb = load_workbook(path, read_only=True)
+    assert len(wb.sheetnames) == 3
+    wb.close()
+
+    loaded = load_table(path, use_cache=False)
+    assert len(loaded.df) == ROWS
+    np.testing.assert_array_equal(pd.to_datetime(loaded.df["timestamp"]), df["timestamp"])
+    np.testing.assert_array_equal(loaded.df["Power"].astype(float), df["Power"])
+    np.testing.assert_array_equal(loaded.gap_mask, mask)
+
+    assert sum(len(batch) for batch in read_batches(path, batch_rows=700)) == ROWS
+
+    expected = df["timestamp"].to_numpy().astype("datetime64[m]").astype(np.int64)
+    for reader in (read_timestamps, _read_timestamps_openpyxl):
+        sensor, minutes = reader(path)
+        assert sensor == "Power"
+        np.testing.assert_array_equal(minutes, expected)
+
+
+def test_sheets_with_another_header_are_left_out(tmp_path):
+    df, mask = table()
+    path = str(tmp_path / "export.xlsx")
+    writer.write_chunks(df.columns, [(df.iloc[:10], mask[:10])], path, "openpyxl")
+    wb = load_workbook(path)
+    notes = wb.create_sheet("Notes")
+    notes.append(["timestamp", "comment"])
+    notes.append([pd.Timestamp("2025-08-01").to_pydatetime(), "not data"])
+    wb.save(path)
+
+    assert len(load_table(path, use_cache=False).df) == 10
+    assert len(read_timestamps(path)[1]) == 10
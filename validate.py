@@ -1,32 +1,375 @@
+"""
+Timestamp counts per day.
+
+Inside the pipeline, VALIDATE counts the processed table in memory. Run as a
+script, it checks every workbook under the "averaged" folder (site
+subfolders included) without loading them: only the timestamp column is
+read from the sheet XML, timestamps become integer minute offsets, and each file's days
+are counted and measured for their longest gap in a few vectorized steps.
+Files are checked side by side, and the results are saved as one
+completeness matrix (site x sensor x day) to ../validation as CSV and JSON.
+
+The exit status is 0 when every day has 1440 timestamps, 1 when some do not,
+and 2 when a file could not be read.
+
+    python validate.py [folder] [--workers N] [--output DIR]
+"""
+
+import argparse
+import csv
+import json
 import os
+import re
+import sys
+import time
+import traceback
+import zipfile
+from functools import partial
+from html import unescape
+from xml.etree import ElementTree as ET
+
+import numpy as np
 import pandas as pd
+from openpyxl import load_workbook
+
+import catalog
+import events
+import instrument
+from executor import run_ordered
+from pipeline import AVERAGED_DIR, BASE_DIR, Stage, sheet_rows
+
+MINUTES_PER_DAY = 1440
+VALIDATION_DIR = os.path.join(BASE_DIR, "validation")
+
+EXIT_COMPLETE = 0
+EXIT_INCOMPLETE = 1
+EXIT_ERROR = 2
 
-def count_timestamps_per_day(file_path):
-    # Load the Excel file
-    df = pd.read_excel(file_path, skiprows=1, header=None)
-    
+MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+READ_CHUNK_BYTES = 1 << 20
+# Excel date serials count days from 1899-12-30 (or 1904-01-01); these are those days relative to 1970-01-01
+EPOCH_1900_DAYS = -25569
+EPOCH_1904_DAYS = -24107
+SHEET_CELL = re.compile(rb'<c\b([^>]*?)(?:/>|>(.*?)</c>)', re.S)
+CELL_REF = re.compile(rb'\br="([A-Z]+)(\d+)"')
+CELL_TYPE = re.compile(rb'\bt="(\w+)"')
+CELL_VALUE = re.compile(rb'<v>([^<]*)</v>')
+INLINE_TEXT = re.compile(rb'<t[^>]*>([^<]*)</t>')
+
+def count_timestamps_per_day(table):
     # Ensure the first column is in datetime format
-    df[0] = pd.to_datetime(df[0], format='%Y-%m-%d %H:%M:%S')
-    
+    timestamps = pd.to_datetime(table.df['timestamp'], format='%Y-%m-%d %H:%M:%S')
+
     # Group by date and count the number of occurrences
-    counts = df[0].dt.date.value_counts().sort_index()
-    
+    counts = timestamps.dt.date.value_counts().sort_index()
+    table.day_counts = counts
+
     # Print the results
-    print(f"Results for {file_path}:")
+    print(f"Results for {table.output_path or table.path}:", flush=True)
     for date, count in counts.items():
-        print(f"{date}: {count} timestamps")
-    print("\n")
+        print(f"{date}: {count} timestamps", flush=True)
+        events.emit("day_count", file=table.name, date=str(date), count=int(count),
+                    expected=MINUTES_PER_DAY)
+    print("\n", flush=True)
+
+VALIDATE = Stage("validate", count_timestamps_per_day)
+
+def list_workbooks(folder):
+    """Every .xlsx file in folder and its subfolders, skipping Excel lock files."""
+    found = []
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        found.extend(os.path.join(root, f) for f in sorted(files)
+                     if f.lower().endswith(".xlsx") and not f.startswith("~$"))
+    return found
+
+def _sheets(zf):
+    """Zip member names of the workbook's sheets in tab order, and whether it uses the 1904 date system."""
+    workbook = ET.fromstring(zf.read("xl/workbook.xml"))
+    rels = ET.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+    targets = {rel.get("Id"): rel.get("Target") for rel in rels}
+    members = []
+    for sheet in workbook.findall(f"{{{MAIN_NS}}}sheets/{{{MAIN_NS}}}sheet"):
+        target = targets[sheet.get(f"{{{REL_NS}}}id")]
+        members.append(target.lstrip("/") if target.startswith("/") else "xl/" + target)
+    props = workbook.find(f"{{{MAIN_NS}}}workbookPr")
+    date1904 = props is not None and props.get("date1904") in ("1", "true")
+    return members, date1904
+
+def _shared_strings(zf):
+    try:
+        root = ET.fromstring(zf.read("xl/sharedStrings.xml"))
+    except KeyError:
+        return []
+    return ["".join(t.text or "" for t in item.iter(f"{{{MAIN_NS}}}t")) for item in root]
+
+def _scan_sheet(zf, member, strings):
+    """
+    (found a header, sensor, numeric A cells, text A cells) of one sheet.
+    strings is a list the shared strings are loaded into when first needed.
+    """
+    header_row = None
+    sensor = None
+    numbers, texts = [], []
+    with zf.open(member) as f:
+        tail = b""
+        while True:
+            chunk = f.read(READ_CHUNK_BYTES)
+            data = tail + chunk
+            cut = data.rfind(b"</row>") + len(b"</row>") if chunk else len(data)
+            data, tail = data[:cut], data[cut:]
+            for match in SHEET_CELL.finditer(data):
+                attrs, body = match.groups()
+                ref = CELL_REF.search(attrs)
+                if ref is None or body is None or ref[1] not in (b"A", b"B"):
+                    continue
+                kind = CELL_TYPE.search(attrs)
+                kind = kind[1] if kind else b"n"
+                if kind == b"inlineStr":
+                    value = b"".join(INLINE_TEXT.findall(body))
+                else:
+                    value = CELL_VALUE.search(body)
+                    if value is None:
+                        continue
+                    value = value[1]
+                if kind == b"s":
+                    if not strings:
+                        strings.extend(_shared_strings(zf))
+                    value = strings[int(value)].encode("utf-8")
+                    kind = b"str"
+                if header_row is None:
+                    if ref[1] == b"A" and kind != b"n" and value.strip().lower() == b"timestamp":
+                        header_row = ref[2]
+                elif ref[2] == header_row:
+                    sensor = unescape(value.decode("utf-8")) if ref[1] == b"B" else sensor
+                elif ref[1] == b"A":
+                    if kind == b"n":
+                        numbers.append(value)
+                    elif kind in (b"str", b"inlineStr", b"d"):
+                        texts.append(unescape(value.decode("utf-8")))
+            if not chunk:
+                break
+    return header_row is not None, sensor, numbers, texts
+
+def read_timestamps(file_path):
+    """
+    (sensor, timestamps as integer minutes) of a workbook.
+
+    Only the sheets' XML is streamed, and only the cells of column A (plus
+    the header's B cell) are looked at; Excel date serials are converted to
+    minutes in one vectorized step. The first sheet with a "timestamp"
+    header is read, followed by the later sheets under the same header that
+    the writer continues long outputs on. Sheets this reader cannot follow
+    go through openpyxl instead.
+    """
+    with zipfile.ZipFile(file_path) as zf:
+        members, date1904 = _sheets(zf)
+        strings = []
+        found = False
+        sensor = None
+        numbers, texts = [], []
+        for member in members:
+            has_header, sheet_sensor, sheet_numbers, sheet_texts = _scan_sheet(zf, member, strings)
+            if not has_header or (found and sheet_sensor != sensor):
+                continue
+            if not found:
+                found, sensor = True, sheet_sensor
+            numbers += sheet_numbers
+            texts += sheet_texts
+    if not found:
+        return _read_timestamps_openpyxl(file_path)
+
+    epoch_days = EPOCH_1904_DAYS if date1904 else EPOCH_1900_DAYS
+    seconds = np.floor(np.array(numbers, dtype=float) * 86400 + 0.5).astype(np.int64)
+    minutes = seconds // 60 + epoch_days * MINUTES_PER_DAY
+    if texts:
+        parsed = pd.to_datetime(pd.Series(texts), errors='coerce').dropna()
+        minutes = np.concatenate([minutes, parsed.to_numpy().astype('datetime64[m]').astype(np.int64)])
+    return sensor, minutes
+
+def _read_timestamps_openpyxl(file_path):
+    wb = load_workbook(file_path, read_only=True)
+    try:
+        sensor = None
+        header = False
+        values = []
+        for row in sheet_rows(wb):
+            if not header:
+                first = row[0] if row else None
+                if isinstance(first, str) and first.strip().lower() == "timestamp":
+                    header = True
+                    sensor = row[1] if len(row) > 1 else None
+                continue
+            if row and row[0] is not None:
+                values.append(row[0])
+    finally:
+        wb.close()
+    if not header:
+        raise ValueError("no 'timestamp' header row found")
+    timestamps = pd.to_datetime(pd.Series(values, dtype=object), errors='coerce').dropna()
+    return sensor, timestamps.to_numpy().astype('datetime64[m]').astype(np.int64)
+
+def longest_gaps(present):
+    """Longest run of missing minutes in each row of a (days, 1440) presence matrix."""
+    width = present.shape[1] + 2
+    padded = np.ones((present.shape[0], width), dtype=np.int8)
+    padded[:, 1:-1] = present
+    # Each row starts and ends present, so runs never cross from one day into the next
+    edges = np.diff(padded.ravel())
+    starts = np.flatnonzero(edges == -1)
+    ends = np.flatnonzero(edges == 1)
+    longest = np.zeros(present.shape[0], dtype=np.int64)
+    np.maximum.at(longest, starts // width, ends - starts)
+    return longest
+
+def count_days(minutes, with_present=False):
+    """
+    (dates, counts, longest gaps) for every day from the first to the last
+    timestamp; with_present adds the (days, 1440) presence matrix.
+    """
+    if len(minutes) == 0:
+        empty = (np.array([], dtype='datetime64[D]'), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+        return empty + (np.zeros((0, MINUTES_PER_DAY), dtype=bool),) if with_present else empty
+    first_day = minutes.min() // MINUTES_PER_DAY
+    offsets = minutes - first_day * MINUTES_PER_DAY
+    days = offsets // MINUTES_PER_DAY
+    size = int(days.max()) + 1
+    counts = np.bincount(days, minlength=size)
+    present = np.zeros(size * MINUTES_PER_DAY, dtype=bool)
+    present[offsets] = True
+    dates = (first_day + np.arange(size)).astype('datetime64[D]')
+    present = present.reshape(size, MINUTES_PER_DAY)
+    if with_present:
+        return dates, counts, longest_gaps(present), present
+    return dates, counts, longest_gaps(present)
+
+def site_of(file_path, folder):
+    """The site subfolder a file sits in, else the site code at the start of its name."""
+    parent = os.path.relpath(os.path.dirname(file_path), folder).split(os.sep)[0]
+    site = catalog.site_from(parent) if parent != "." else None
+    name = os.path.basename(file_path)
+    if name.lower().startswith("averaged "):
+        name = name[len("averaged "):]
+    return site or catalog.site_from(name)
+
+def check_file(file_path, folder=AVERAGED_DIR):
+    """Count one workbook's timestamps per day; returns a dict of its result."""
+    name = os.path.basename(file_path)
+    start = time.perf_counter()
+    result = {"file": name, "path": file_path, "site": site_of(file_path, folder),
+              "sensor": None, "days": [], "error": None}
+    try:
+        with instrument.span("validate", cat="compute", file=name):
+            sensor, minutes = read_timestamps(file_path)
+            dates, counts, longest, present = count_days(minutes, with_present=True)
+            instrument.count("rows", len(minutes))
+        result["sensor"] = sensor
+        incomplete = []
+        # Each day's minutes go along packed, so overlapping files can be merged per cell
+        packed = np.packbits(present, axis=1)
+        for date, count, gap, bits in zip(dates.astype(str), counts.tolist(), longest.tolist(), packed):
+            result["days"].append((date, count, gap, bits))
+            events.emit("day_count", file=name, date=date, count=count, expected=MINUTES_PER_DAY,
+                        longest_gap=gap)
+            if count != MINUTES_PER_DAY:
+                incomplete.append(f"  {date}: {count} timestamps, longest gap {gap} min")
+        print(f"{name}: {len(dates)} days, {len(incomplete)} incomplete", flush=True)
+        for line in incomplete:
+            print(line, flush=True)
+        events.emit("file", file=name, status="done", rows=len(minutes), elapsed=time.perf_counter() - start)
+    except Exception as e:
+        result["error"] = str(e)
+        print(f"Error reading '{name}': {e}", flush=True)
+        events.emit("error", file=name, stage="validate", message=str(e), traceback=traceback.format_exc())
+        events.emit("file", file=name, status="error", elapsed=time.perf_counter() - start)
+    return result
+
+def build_matrix(results):
+    """
+    {(site, sensor, date): cell} over all files. Overlapping files add to a
+    cell's count (duplicates show up as more than 1440), and the longest gap
+    is measured again on the minutes they cover together.
+    """
+    matrix = {}
+    present = {}
+    for result in results:
+        for date, count, gap, bits in result["days"]:
+            key = (result["site"] or "", str(result["sensor"] or ""), date)
+            cell = matrix.get(key)
+            if cell is None:
+                matrix[key] = {"count": count, "longest_gap": gap, "files": [result["file"]]}
+                present[key] = bits
+            else:
+                cell["count"] += count
+                cell["files"].append(result["file"])
+                present[key] = present[key] | bits
+                merged = np.unpackbits(present[key], count=MINUTES_PER_DAY).astype(bool)
+                cell["longest_gap"] = int(longest_gaps(merged[None, :])[0])
+    return dict(sorted(matrix.items()))
+
+def save_matrix(matrix, results, output_dir=VALIDATION_DIR):
+    """Write completeness.csv (one row per cell) and completeness.json (nested by site and sensor)."""
+    os.makedirs(output_dir, exist_ok=True)
+    csv_path = os.path.join(output_dir, "completeness.csv")
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        out = csv.writer(f)
+        out.writerow(["site", "sensor", "date", "count", "expected", "longest_gap", "complete", "files"])
+        for (site, sensor, date), cell in matrix.items():
+            out.writerow([site, sensor, date, cell["count"], MINUTES_PER_DAY, cell["longest_gap"],
+                          cell["count"] == MINUTES_PER_DAY, ";".join(cell["files"])])
+
+    sites = {}
+    for (site, sensor, date), cell in matrix.items():
+        sites.setdefault(site, {}).setdefault(sensor, {})[date] = {
+            "count": cell["count"], "longest_gap": cell["longest_gap"],
+            "complete": cell["count"] == MINUTES_PER_DAY}
+    report = {
+        "generated": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "expected": MINUTES_PER_DAY,
+        "files": len(results),
+        "incomplete": sum(1 for cell in matrix.values() if cell["count"] != MINUTES_PER_DAY),
+        "errors": {r["file"]: r["error"] for r in results if r["error"]},
+        "sites": sites,
+    }
+    json_path = os.path.join(output_dir, "completeness.json")
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return csv_path, json_path
+
+def exit_status(matrix, results):
+    if any(r["error"] for r in results):
+        return EXIT_ERROR
+    if any(cell["count"] != MINUTES_PER_DAY for cell in matrix.values()):
+        return EXIT_INCOMPLETE
+    return EXIT_COMPLETE
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that every day of every averaged workbook has 1440 timestamps.")
+    parser.add_argument("folder", nargs="?", default=AVERAGED_DIR,
+                        help="folder to check, site subfolders included (default: the 'averaged' folder)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes (default: $SJV_WORKERS or the CPU count)")
+    parser.add_argument("--output", default=VALIDATION_DIR,
+                        help="folder for completeness.csv and completeness.json")
+    args = parser.parse_args(argv)
+
+    file_paths = list_workbooks(args.folder)
+    if not file_paths:
+        print(f"No Excel files found in '{args.folder}'.", flush=True)
+        return EXIT_COMPLETE
+    events.emit("batch", files=len(file_paths), stages=["validate"], workers=args.workers)
+    results = run_ordered(partial(check_file, folder=args.folder), file_paths, args.workers)
+    matrix = build_matrix(results)
+    csv_path, json_path = save_matrix(matrix, results, args.output)
+
+    incomplete = sum(1 for cell in matrix.values() if cell["count"] != MINUTES_PER_DAY)
+    errors = sum(1 for r in results if r["error"])
+    print(f"\nChecked {len(file_paths)} files: {len(matrix)} site/sensor days, {incomplete} incomplete, "
+          f"{errors} unreadable", flush=True)
+    print(f"Saved: '{csv_path}'", flush=True)
+    print(f"Saved: '{json_path}'", flush=True)
+    return exit_status(matrix, results)
 
 if __name__ == "__main__":
-    # Determine the path to the "averaged" folder
-    current_directory = os.path.dirname(os.path.abspath(__file__))
-    averaged_folder = os.path.join(current_directory, '..', 'averaged')
-
-    # Get a list of all Excel files in the "averaged" folder
-    file_paths = [os.path.join(averaged_folder, file) for file in os.listdir(averaged_folder) if file.endswith(('.xlsx', '.xls'))]
-    
-    if file_paths:
-        for file_path in file_paths:
-            count_timestamps_per_day(file_path)
-    else:
-        print("No Excel files found in the 'averaged' folder.")
+    sys.exit(main())
@@ -0,0 +1,328 @@
+"""
+Watch the "original" folder and process each export as soon as it lands.
+
+New workbooks are noticed through inotify on Linux, or by listing the
+folder every --poll seconds elsewhere (and with --polling, for network
+shares that do not deliver inotify events). A file is held back until its
+size and modification time have not changed for --settle seconds and it
+opens as a complete workbook, so exports that are still being copied in
+are never read half-written. Each settled file goes on a bounded queue;
+worker processes take files off it and run rename -> missing -> interpol ->
+validate -> rollup on them (pipeline.process_file), then move the renamed original
+and the averaged output into their site folders. When the queue is full
+the watcher waits, so a burst of exports never holds more than --queue
+files in flight. Files already in the folder at start-up are processed
+first, and files whose output from this chain exists are skipped through
+the manifest as usual. A file whose contents were already queued in this
+session is not queued again; that covers the renamed copy the rename stage
+leaves in the watched folder while its job is still running.
+
+    python watch.py [--workers N] [--queue 8] [--settle 2] [--poll 1] [--polling] [--once]
+
+Stop it with Ctrl+C; files already queued are finished first.
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import os
+import queue
+import select
+import signal
+import struct
+import sys
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import cache
+import catalog
+import events
+import instrument
+import manifest
+import routing
+from executor import captured, default_workers
+from pipeline import AVERAGED_DIR, ORIGINAL_DIR, default_stages, process_file
+
+SETTLE_SECONDS = 2.0
+POLL_SECONDS = 1.0
+QUEUE_SIZE = 8
+# A file that stays unreadable this long after it stopped changing is reported and left alone
+GIVE_UP_SECONDS = 60.0
+
+# From <sys/inotify.h>
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_Q_OVERFLOW = 0x4000
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, name length
+
+
+def is_export(name):
+    return name.lower().endswith(".xlsx") and not name.startswith("~$")
+
+
+def scan(folder):
+    """Exports directly inside folder (not in its site subfolders)."""
+    try:
+        with os.scandir(folder) as entries:
+            return sorted(entry.path for entry in entries if entry.is_file() and is_export(entry.name))
+    except FileNotFoundError:
+        return []
+
+
+class PollingWatcher:
+    """Lists the folder every interval; works on any file system."""
+
+    name = "polling"
+
+    def __init__(self, folder, interval=POLL_SECONDS):
+        self.folder = folder
+        self.interval = interval
+
+    def changes(self, timeout):
+        time.sleep(self.interval)
+        return scan(self.folder)
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Kernel notifications for files written in or moved into the folder (Linux only)."""
+
+    name = "inotify"
+    MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+    def __init__(self, folder):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.folder = folder
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(folder), self.MASK) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, f"cannot watch '{folder}'")
+
+    def changes(self, timeout):
+        """Paths named by the events that arrive within timeout seconds."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        paths = set()
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped: look at everything
+                return scan(self.folder)
+            if is_export(name):
+                paths.add(os.path.join(self.folder, name))
+        return sorted(paths)
+
+    def close(self):
+        os.close(self.fd)
+
+
+def open_watcher(folder, poll=POLL_SECONDS, polling=False):
+    """inotify where the platform has it, otherwise polling."""
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(folder)
+        except (OSError, AttributeError) as e:
+            print(f"inotify unavailable ({e}); polling every {poll:g}s instead", flush=True)
+    return PollingWatcher(folder, poll)
+
+
+class Debouncer:
+    """
+    Holds new files back until they stop changing and open as a complete
+    workbook, and releases each distinct content only once.
+    """
+
+    def __init__(self, settle=SETTLE_SECONDS):
+        self.settle = settle
+        self.pending = {}   # path -> (size and mtime, when they last changed)
+        self.handled = {}   # path -> size and mtime when it was released
+        self.contents = set()  # hashes of the files released so far
+
+    def add(self, paths):
+        now = time.monotonic()
+        for path in paths:
+            self.pending.setdefault(path, (None, now))
+
+    def ready(self):
+        """The pending files that have settled, in name order."""
+        now = time.monotonic()
+        settled = []
+        for path, (signature, changed) in list(self.pending.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # Moved away or deleted before it settled
+                del self.pending[path]
+                continue
+            current = (stat.st_size, stat.st_mtime_ns)
+            if self.handled.get(path) == current:
+                del self.pending[path]
+                continue
+            if current != signature:
+                self.pending[path] = (current, now)
+                continue
+            if now - changed < self.settle or not stat.st_size:
+                continue
+            # An .xlsx is a zip archive, whose directory is written last
+            if not zipfile.is_zipfile(path):
+                if now - changed >= GIVE_UP_SECONDS:
+                    message = f"not a complete workbook after {GIVE_UP_SECONDS:g}s"
+                    print(f"Error: '{os.path.basename(path)}' is {message}; skipping.", flush=True)
+                    events.emit("error", file=os.path.basename(path), stage="watch", message=message)
+                    self.handled[path] = current
+                    del self.pending[path]
+                continue
+            self.handled[path] = current
+            del self.pending[path]
+            # The rename stage renames a file without changing its bytes
+            try:
+                digest = cache.file_hash(path)
+            except OSError:
+                continue
+            if digest in self.contents:
+                continue
+            self.contents.add(digest)
+            settled.append(path)
+        return sorted(settled)
+
+
+def handle(file_path, stages):
+    """Process one export and move the renamed original and its averaged output into their site folders."""
+    with instrument.span("watch", cat="watch", file=os.path.basename(file_path)):
+        table = process_file(file_path, stages, keep_data=False)
+        if table is None:
+            return None
+        site = routing.site_for(table.name, (table.meta or {}).get("site"))
+        with instrument.span("route", cat="route"):
+            moved = routing.route_file(table.path, ORIGINAL_DIR, site, create=True)
+            if moved:
+                catalog.move(table.path, moved)
+            output_path = table.output_path
+            moved = routing.route_file(output_path, AVERAGED_DIR, site, create=True) if output_path else None
+            if moved:
+                manifest.move_output(output_path, moved)
+        return table.name
+
+
+def _ignore_interrupt():
+    # Ctrl+C reaches the whole process group; the parent decides when the workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class Processor:
+    """Worker threads taking files off a bounded queue and running them in a process pool."""
+
+    def __init__(self, stages, workers=None, queue_size=QUEUE_SIZE):
+        self.work = queue.Queue(maxsize=max(queue_size, 1))
+        self.handle = partial(handle, stages=stages)
+        self.workers = workers or default_workers()
+        # One worker runs in this process, as run_ordered does
+        self.pool = None
+        if self.workers > 1:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_ignore_interrupt)
+        self.replay_lock = threading.Lock()
+        self.threads = [threading.Thread(target=self._run, daemon=True) for _ in range(self.workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def put(self, file_path):
+        """Queue a file, waiting while the queue is full."""
+        self.work.put((file_path, time.perf_counter()))
+
+    def _run(self):
+        while True:
+            item = self.work.get()
+            if item is None:
+                return
+            file_path, queued = item
+            file_name = os.path.basename(file_path)
+            try:
+                if self.pool is None:
+                    name = self.handle(file_path)
+                else:
+                    output, name = self.pool.submit(captured, self.handle, file_path).result()
+                    with self.replay_lock:
+                        events.replay(output)
+            except Exception as e:
+                print(f"Error processing '{file_name}': {e}", flush=True)
+                events.emit("error", file=file_name, stage="watch", message=str(e))
+                continue
+            if name:
+                print(f"Handled '{name}' {time.perf_counter() - queued:.1f}s after it settled\n", flush=True)
+
+    def close(self):
+        """Finish the queued files and stop the workers."""
+        for _ in self.threads:
+            self.work.put(None)
+        for thread in self.threads:
+            thread.join()
+        if self.pool is not None:
+            self.pool.shutdown()
+
+
+def watch(folder=ORIGINAL_DIR, workers=None, queue_size=QUEUE_SIZE, settle=SETTLE_SECONDS,
+          poll=POLL_SECONDS, polling=False, once=False):
+    """Process the exports in folder and every one that lands there until interrupted (or, with once, drained)."""
+    if not os.path.isdir(folder):
+        print(f"Error: '{folder}' does not exist or is not a directory.", flush=True)
+        return 1
+    watcher = open_watcher(folder, poll, polling)
+    debouncer = Debouncer(settle)
+    processor = Processor(default_stages(), workers, queue_size)
+    print(f"Watching '{folder}' ({watcher.name}, {processor.workers} workers); Ctrl+C to stop", flush=True)
+
+    debouncer.add(scan(folder))
+    try:
+        while True:
+            for file_path in debouncer.ready():
+                print(f"Queued: '{os.path.basename(file_path)}'", flush=True)
+                processor.put(file_path)
+            if once and not debouncer.pending:
+                break
+            debouncer.add(watcher.changes(poll))
+    except KeyboardInterrupt:
+        print("Stopping: finishing the queued files...", flush=True)
+    finally:
+        watcher.close()
+        processor.close()
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Process new exports in the 'original' folder as they arrive.")
+    parser.add_argument("--folder", default=ORIGINAL_DIR, help="folder to watch (default: original)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes (default: $SJV_WORKERS or the CPU count)")
+    parser.add_argument("--queue", type=int, default=QUEUE_SIZE,
+                        help=f"most settled files waiting for a worker (default {QUEUE_SIZE})")
+    parser.add_argument("--settle", type=float, default=SETTLE_SECONDS,
+                        help=f"seconds a file must stay unchanged before it is read (default {SETTLE_SECONDS:g})")
+    parser.add_argument("--poll", type=float, default=POLL_SECONDS,
+                        help=f"seconds between checks (default {POLL_SECONDS:g})")
+    parser.add_argument("--polling", action="store_true", help="list the folder instead of using inotify")
+    parser.add_argument("--once", action="store_true",
+                        help="process the files already in the folder, then exit")
+    args = parser.parse_args(argv)
+    return watch(args.folder, args.workers, args.queue, args.settle, args.poll, args.polling, args.once)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
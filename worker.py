@@ -0,0 +1,342 @@
+"""
+Warm worker daemon.
+
+Starting every script as a fresh python process pays for the interpreter
+and the pandas/openpyxl/pyarrow imports each time. The daemon imports them
+(and the stage modules) once and then runs scripts on request:
+
+    python worker.py serve     start the daemon in this terminal
+    python worker.py status    check whether one is running
+    python worker.py stop      ask it to exit
+
+Clients connect over a local socket (a Unix socket in the base folder, or
+a named pipe on Windows) using multiprocessing.connection, authenticated
+with a random key that serve writes to ~/.sjv-worker.key (readable by the
+user only) each time it starts; $SJV_WORKER_KEY sets a key instead. Only
+the scripts in SCRIPTS can be run. Each job runs the script as __main__ with the requested arguments and environment, and
+streams its output back line by line, structured events included, so a
+job reads exactly like a subprocess (see launch()). On POSIX each job runs
+in a forked child of the warm process, so jobs are isolated, can run side
+by side and can be stopped; elsewhere jobs run one at a time in the daemon.
+
+RUN.py and cli.py use the daemon when it is running and fall back to
+starting a new process otherwise. Set SJV_WORKER=0 to never use it.
+Environment variables read at import time (SJV_CACHE_DIR, SJV_DB, ...) are
+those the daemon was started with.
+"""
+
+import argparse
+import os
+import runpy
+import secrets
+import signal
+import subprocess
+import sys
+import traceback
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = os.path.dirname(SCRIPT_DIR)
+
+if sys.platform == "win32":
+    DEFAULT_ADDRESS = r"\\.\pipe\sjv-worker"
+else:
+    DEFAULT_ADDRESS = os.path.join(BASE_DIR, ".worker.sock")
+ADDRESS = os.environ.get("SJV_WORKER_ADDRESS") or DEFAULT_ADDRESS
+KEY_PATH = os.environ.get("SJV_WORKER_KEY_FILE") or os.path.join(os.path.expanduser("~"), ".sjv-worker.key")
+
+# The scripts a job may run, all of them in SCRIPT_DIR
+SCRIPTS = {"pipeline.py", "createfolders.py", "timelogrename.py", "tcfilename.py", "averaged.py", "original.py",
+           "rename.py", "missing.py", "interpol.py", "validate.py", "merge.py", "stream.py", "stitch.py",
+           "rollup.py", "catalog.py", "gaplog.py", "cache.py", "manifest.py"}
+
+# Imported once by the daemon so jobs start warm
+PRELOAD = ["numpy", "pandas", "openpyxl", "xlsxwriter", "pyarrow.parquet",
+           "pipeline", "rename", "missing", "interpol", "validate", "merge", "stream", "stitch",
+           "catalog", "gaplog", "routing", "rollup"]
+
+
+def enabled():
+    return os.environ.get("SJV_WORKER", "1") != "0"
+
+
+def new_key(path=KEY_PATH):
+    """Write a fresh random key only the user can read and return it ($SJV_WORKER_KEY wins)."""
+    if os.environ.get("SJV_WORKER_KEY"):
+        return os.environ["SJV_WORKER_KEY"].encode()
+    key = secrets.token_hex(32)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(key)
+    # A key file that already existed keeps its old mode through O_CREAT
+    os.chmod(path, 0o600)
+    return key.encode()
+
+
+def read_key(path=KEY_PATH):
+    """The key of the running daemon; raises OSError when there is none."""
+    if os.environ.get("SJV_WORKER_KEY"):
+        return os.environ["SJV_WORKER_KEY"].encode()
+    with open(path) as f:
+        return f.read().strip().encode()
+
+
+def script_path(name):
+    """Full path of an allowed script; raises ValueError for anything else."""
+    if name in SCRIPTS:
+        path = os.path.realpath(os.path.join(SCRIPT_DIR, name))
+        if os.path.dirname(path) == os.path.realpath(SCRIPT_DIR):
+            return path
+    raise ValueError(f"'{name}' is not one of the scripts the worker runs")
+
+
+class _ConnectionWriter:
+    """File-like stdout for a job: sends every complete line to the client."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.buffer = ""
+
+    def write(self, text):
+        self.buffer += text
+        if "\n" in self.buffer:
+            *lines, self.buffer = self.buffer.split("\n")
+            for line in lines:
+                self.conn.send(("output", line + "\n"))
+        return len(text)
+
+    def flush(self):
+        if self.buffer:
+            self.conn.send(("output", self.buffer))
+            self.buffer = ""
+
+    def isatty(self):
+        return False
+
+
+def _run_job(conn, request):
+    """Run one script as __main__ with its output going to conn; returns the exit code."""
+    writer = _ConnectionWriter(conn)
+    try:
+        script = script_path(request.get("script") or "")
+    except ValueError as e:
+        writer.write(f"Error: {e}\n")
+        return 1
+    saved = sys.argv, sys.stdout, sys.stderr, os.getcwd(), dict(os.environ)
+    code = 0
+    try:
+        sys.argv = [script, *request.get("args", [])]
+        sys.stdout = sys.stderr = writer
+        os.environ.update(request.get("env") or {})
+        os.chdir(request.get("cwd") or SCRIPT_DIR)
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except Exception:
+        traceback.print_exc()
+        code = 1
+    finally:
+        writer.flush()
+        sys.argv, sys.stdout, sys.stderr = saved[:3]
+        os.chdir(saved[3])
+        os.environ.clear()
+        os.environ.update(saved[4])
+    return code
+
+
+def _serve_job(conn, request, forked):
+    conn.send(("started", os.getpid(), forked))
+    try:
+        code = _run_job(conn, request)
+        conn.send(("exit", code))
+    except (EOFError, OSError):
+        # The client went away; nothing left to report to
+        pass
+    finally:
+        conn.close()
+
+
+def _reap():
+    """Collect finished job children so they do not linger as zombies."""
+    try:
+        while os.waitpid(-1, os.WNOHANG)[0]:
+            pass
+    except ChildProcessError:
+        pass
+
+
+def serve(address=ADDRESS):
+    for module in PRELOAD:
+        try:
+            __import__(module)
+        except ImportError:
+            pass
+
+    if not address.startswith("\\\\") and os.path.exists(address):
+        if ping(address):
+            print(f"A worker is already listening on {address}", flush=True)
+            return 1
+        os.remove(address)
+
+    listener = Listener(address, authkey=new_key())
+    print(f"Worker {os.getpid()} listening on {address}", flush=True)
+    try:
+        while True:
+            try:
+                conn = listener.accept()
+                request = conn.recv()
+            except (EOFError, OSError):
+                continue
+            command = request.get("command")
+            if command == "ping":
+                conn.send(("pong", os.getpid()))
+                conn.close()
+            elif command == "stop":
+                conn.send(("stopping", os.getpid()))
+                conn.close()
+                break
+            elif hasattr(os, "fork"):
+                _reap()
+                if os.fork() == 0:
+                    listener.close()
+                    try:
+                        _serve_job(conn, request, True)
+                    finally:
+                        os._exit(0)
+                conn.close()
+            else:
+                _serve_job(conn, request, False)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.close()
+        if not address.startswith("\\\\") and os.path.exists(address):
+            os.remove(address)
+    print("Worker stopped.", flush=True)
+    return 0
+
+
+def _connect(address=ADDRESS):
+    try:
+        return Client(address, authkey=read_key())
+    except AuthenticationError as e:
+        # A stale key file from another daemon: treat it like no daemon at all
+        raise ConnectionRefusedError(f"the worker at {address} rejected the key") from e
+
+
+def ping(address=ADDRESS):
+    """The daemon's pid, or None if no daemon answers."""
+    try:
+        conn = _connect(address)
+    except OSError:
+        return None
+    try:
+        conn.send({"command": "ping"})
+        return conn.recv()[1]
+    except (EOFError, OSError):
+        return None
+    finally:
+        conn.close()
+
+
+class Job:
+    """
+    A script running in the daemon, with the parts of the Popen interface
+    the runners use: stdout.readline() / iteration, poll(), wait() and
+    terminate().
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.stdout = self
+        self.returncode = None
+        _, self.pid, self.forked = conn.recv()
+
+    def readline(self):
+        """The next line of output, or "" once the job has exited."""
+        while self.returncode is None:
+            try:
+                kind, value = self.conn.recv()
+            except (EOFError, OSError):
+                self.returncode = -signal.SIGTERM
+                break
+            if kind == "output":
+                return value
+            if kind == "exit":
+                self.returncode = value
+        self.conn.close()
+        return ""
+
+    def __iter__(self):
+        return iter(self.readline, "")
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self):
+        for _ in self:
+            pass
+        return self.returncode
+
+    def terminate(self):
+        if self.returncode is None and self.forked:
+            os.kill(self.pid, signal.SIGTERM)
+        # Without a forked child, closing the connection makes the job's next write fail
+        self.conn.close()
+
+
+def submit(script, args=(), env=None, cwd=None, address=ADDRESS):
+    """Start script in the daemon and return its Job; raises OSError if none is running."""
+    conn = _connect(address)
+    conn.send({"command": "run", "script": script, "args": list(args), "env": env or {}, "cwd": cwd})
+    return Job(conn)
+
+
+def launch(script, args=(), env=None, cwd=SCRIPT_DIR):
+    """
+    Run script in the daemon when one is up, else in a new python process.
+    Either way the result has stdout, poll(), wait() and terminate().
+    """
+    if enabled():
+        try:
+            return submit(script, args, env, cwd)
+        except OSError:
+            pass
+    return subprocess.Popen(
+        [sys.executable, script, *args],
+        cwd=cwd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        env=dict(os.environ, **(env or {})),
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Keep a warm python process for running the pipeline scripts.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("serve", help="start the daemon in this terminal")
+    commands.add_parser("status", help="check whether a daemon is running")
+    commands.add_parser("stop", help="ask the running daemon to exit")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        return serve()
+    pid = ping()
+    if pid is None:
+        print("No worker running.")
+        return 1
+    if args.command == "status":
+        print(f"Worker {pid} listening on {ADDRESS}")
+    else:
+        conn = _connect()
+        conn.send({"command": "stop"})
+        conn.recv()
+        conn.close()
+        print(f"Worker {pid} stopped.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
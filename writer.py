@@ -0,0 +1,157 @@
+"""
+Single-pass .xlsx writer for pipeline tables.
+
+Rows are streamed to disk in order and the red highlight for inserted rows
+is applied as each row is written, so every output file is serialized
+exactly once. The xlsxwriter backend runs in constant-memory mode; when
+xlsxwriter is not installed the openpyxl write-only backend is used.
+"""
+
+import os
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import PatternFill
+from openpyxl.utils import get_column_letter
+
+import instrument
+
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+RED = "FFFF0000"
+
+# Hidden column that carries the gap mask between runs
+MASK_COLUMN = "imputed"
+
+DATE_FORMAT = "yyyy-mm-dd hh:mm:ss"
+
+BACKENDS = ("xlsxwriter", "openpyxl")
+
+# Rows per worksheet in .xlsx, header included
+MAX_SHEET_ROWS = 1048576
+
+
+def default_backend():
+    return "xlsxwriter" if xlsxwriter is not None else "openpyxl"
+
+
+def _rows(chunks):
+    """Yield (is_gap, timestamp, values) for every row of every (df, gap_mask) chunk, with blanks as None."""
+    for df, mask in chunks:
+        timestamps = df["timestamp"]
+        if hasattr(timestamps, "dt"):
+            timestamps = timestamps.dt.to_pydatetime()
+        others = df.drop(columns="timestamp")
+        others = others.astype(object).where(others.notna(), None)
+        for i, (ts, values) in enumerate(zip(timestamps, others.itertuples(index=False, name=None))):
+            yield (mask is not None and bool(mask[i])), ts, values
+
+
+def _write_xlsxwriter(columns, chunks, output_path, masked):
+    wb = xlsxwriter.Workbook(output_path, {"constant_memory": True})
+    date_fmt = wb.add_format({"num_format": DATE_FORMAT})
+    red_fmt = wb.add_format({"bg_color": "#FF0000", "pattern": 1})
+    red_date_fmt = wb.add_format({"num_format": DATE_FORMAT, "bg_color": "#FF0000", "pattern": 1})
+
+    columns = list(columns)
+    if masked:
+        columns.append(MASK_COLUMN)
+
+    def new_sheet():
+        ws = wb.add_worksheet()
+        if masked:
+            ws.set_column(len(columns) - 1, len(columns) - 1, None, None, {"hidden": True})
+        ws.write_row(0, 0, columns)
+        return ws
+
+    ws = new_sheet()
+    r = 0
+    for is_gap, ts, values in _rows(chunks):
+        r += 1
+        if r == MAX_SHEET_ROWS:
+            ws = new_sheet()
+            r = 1
+        if is_gap:
+            ws.write(r, 0, ts, red_date_fmt)
+            for c, value in enumerate(values, start=1):
+                if value is None:
+                    ws.write_blank(r, c, None, red_fmt)
+                else:
+                    ws.write(r, c, value, red_fmt)
+            ws.write_number(r, len(values) + 1, 1)
+        else:
+            ws.write(r, 0, ts, date_fmt)
+            ws.write_row(r, 1, values)
+    wb.close()
+
+
+def _write_openpyxl(columns, chunks, output_path, masked):
+    red_fill = PatternFill(start_color=RED, end_color=RED, fill_type="solid")
+
+    wb = Workbook(write_only=True)
+    columns = list(columns)
+    if masked:
+        columns.append(MASK_COLUMN)
+
+    def new_sheet():
+        ws = wb.create_sheet()
+        if masked:
+            ws.column_dimensions[get_column_letter(len(columns))].hidden = True
+        ws.append(columns)
+        return ws
+
+    ws = new_sheet()
+    r = 0
+    for is_gap, ts, values in _rows(chunks):
+        r += 1
+        if r == MAX_SHEET_ROWS:
+            ws = new_sheet()
+            r = 1
+        if is_gap:
+            cells = []
+            for value in (ts,) + values:
+                cell = WriteOnlyCell(ws, value=value)
+                cell.fill = red_fill
+                cells.append(cell)
+            cells.append(1)
+            ws.append(cells)
+        else:
+            ws.append((ts,) + values)
+    wb.save(output_path)
+
+
+def write_chunks(columns, chunks, output_path, backend=None, masked=True):
+    """
+    Write rows arriving as (df, gap_mask) chunks in a single pass, without
+    holding more than one chunk in memory. Rows past the sheet limit of
+    .xlsx continue on a new sheet with the same header.
+    """
+    backend = backend or default_backend()
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown writer backend {backend!r}; expected one of {BACKENDS}")
+    if backend == "xlsxwriter" and xlsxwriter is None:
+        raise ImportError("the xlsxwriter backend needs the xlsxwriter package")
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    if backend == "xlsxwriter":
+        _write_xlsxwriter(columns, chunks, output_path, masked)
+    else:
+        _write_openpyxl(columns, chunks, output_path, masked)
+
+
+def write_table(table, output_path, backend=None):
+    """
+    Write the table in a single pass.
+
+    The gap mask is stored in a hidden "imputed" column (1 on inserted rows)
+    so later stages can recover it without reading styles, and the inserted
+    rows are highlighted in red for whoever opens the file.
+    """
+    with instrument.span("write", cat="write", file=os.path.basename(output_path)):
+        write_chunks(table.df.columns, [(table.df, table.gap_mask)], output_path, backend,
+                     masked=table.gap_mask is not None)
+        instrument.count("rows", len(table.df))
+        instrument.count("cells", table.df.size)